@@ -1,50 +1,103 @@
 ﻿import json
 import logging
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING
 
-import pandas as pd
+from starlette.concurrency import run_in_threadpool
 
+from app.ai.circuit_breaker import CircuitOpenError
 from app.ai.ollama_client import OllamaClient, PromptLoader
+from app.ai.scheduler import SchedulerSaturatedError
 from app.models.entities import Dataset
-from app.services.dataset_service import DatasetService
+from app.services.async_service import AsyncService
+from app.services.dataset_service import DatasetService, load_dataframe
 from app.utils.middleware import AppException
-from app.utils.safe_query import execute_safe_query, parse_json_payload, sanitize_chart_config
+from app.utils.charts import build_chart_data, build_comparison_data, comparison_chart_config
+from app.utils.metrics import AI_CACHE_REQUESTS, LLM_FAILURES, MODEL, QUERY_REPAIRS, RUN_ATTEMPTS, set_run_type
+from app.utils.query_repair import repair_query_output
+from app.utils.safe_query import ALLOWED_AGGREGATIONS, execute_safe_query, parse_json_payload, sanitize_chart_config
 from app.utils.settings import get_settings
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
 class AIAgentService:
-    def __init__(self, dataset_service: DatasetService) -> None:
+    def __init__(self, dataset_service: AsyncService[DatasetService], telegram_id: int | None = None) -> None:
         self.dataset_service = dataset_service
+        self.telegram_id = telegram_id
         self.client = OllamaClient()
 
-    def _build_chart_data(self, df: pd.DataFrame, chart_config: dict[str, str | None]) -> list[dict]:
-        x_col = chart_config["x"]
-        y_col = chart_config["y"]
-        agg = chart_config.get("aggregation")
-        chart_type = chart_config["type"]
-
-        if x_col is None:
-            raise AppException("Unable to build chart: dataset has no columns", 400)
-
-        if chart_type == "histogram":
-            values = df[x_col].dropna()
-            bins = min(20, max(5, int(values.nunique() / 2) if hasattr(values, "nunique") else 10))
-            hist = values.value_counts(bins=bins).sort_index()
-            return [{"x": str(idx), "y": float(val)} for idx, val in hist.items()]
+    def _heuristic_chart_configs(self, dataset: Dataset) -> list[tuple[str, dict]]:
+        schema = json.loads(dataset.schema_json)
+        numeric = [c["name"] for c in schema if c["dtype"].startswith(("int", "float"))]
+        dates = [c["name"] for c in schema if c["dtype"].startswith("datetime")]
+        categories = [c["name"] for c in schema if c["dtype"] in {"object", "bool", "category"} and c["unique"] <= 50]
+        y = numeric[0] if numeric else None
+        agg = "sum" if y else None
+
+        configs: list[tuple[str, dict]] = []
+        if dates:
+            configs.append(("Key trend", {"type": "line", "x": dates[0], "y": y, "aggregation": agg}))
+        if categories:
+            configs.append(("Top categories", {"type": "bar", "x": categories[0], "y": y, "aggregation": agg}))
+        if not configs and numeric:
+            configs.append(("Distribution", {"type": "histogram", "x": numeric[0], "y": None, "aggregation": None}))
+        if not configs and schema:
+            configs.append(("Top values", {"type": "bar", "x": schema[0]["name"], "y": None, "aggregation": None}))
+        return configs
+
+    def _heuristic_profile(self, dataset: Dataset) -> dict:
+        schema = json.loads(dataset.schema_json)
+        insights = [f"Dataset has {dataset.row_count} rows and {dataset.column_count} columns."]
+        missing = sorted((c for c in schema if c["missing"] > 0), key=lambda c: c["missing"], reverse=True)
+        if missing:
+            insights.append(f"Column {missing[0]['name']} has the most missing values ({missing[0]['missing']}).")
+        numeric = [c["name"] for c in schema if c["dtype"].startswith(("int", "float"))]
+        if numeric:
+            insights.append(f"Numeric columns: {', '.join(numeric[:5])}.")
+        return {
+            "summary": "Basic dataset profile (AI service is temporarily unavailable).",
+            "insights": insights[:5],
+            "suggested_visualizations": [config for _, config in self._heuristic_chart_configs(dataset)],
+        }
 
-        if y_col and y_col in df.columns:
-            series = df[[x_col, y_col]].dropna()
-            if agg in {"sum", "mean", "count", "max", "min"}:
-                grouped = series.groupby(x_col)[y_col].agg(agg).reset_index()
-                return [{"x": str(r[x_col]), "y": float(r[y_col])} for _, r in grouped.head(200).iterrows()]
-            return [{"x": str(r[x_col]), "y": float(r[y_col])} for _, r in series.head(200).iterrows()]
+    async def _heuristic_dashboard(self, dataset: Dataset) -> dict:
+        df = await run_in_threadpool(load_dataframe, dataset)
+        widgets = []
+        for title, config in self._heuristic_chart_configs(dataset):
+            try:
+                chart_data = await run_in_threadpool(build_chart_data, df, config)
+            except Exception as exc:
+                logger.warning("heuristic widget failed: %s", exc)
+                continue
+            if chart_data:
+                widgets.append({"title": title, "pandas_query": None, "chart_config": config, "chart_data": chart_data})
+        if not widgets:
+            raise AppException("LLM backend is unavailable and no default widgets could be built", 503)
+        return {
+            "summary": "Default dashboard (AI service is temporarily unavailable).",
+            "widgets": widgets,
+            "fallback": True,
+        }
 
-        counts = df[x_col].value_counts().head(50)
-        return [{"x": str(idx), "y": int(val)} for idx, val in counts.items()]
+    def _heuristic_explanation(self, chart_data: list[dict]) -> str:
+        points = [p for p in chart_data if isinstance(p.get("y"), (int, float))]
+        if not points:
+            return "Chart shows trend and key changes in selected data."
+        top = max(points, key=lambda p: p["y"])
+        bottom = min(points, key=lambda p: p["y"])
+        text = f"Chart has {len(points)} points. Highest value {top['y']:g} at {top['x']}, lowest {bottom['y']:g} at {bottom['x']}."
+        first, last = points[0]["y"], points[-1]["y"]
+        if len(points) > 1 and first:
+            text += f" Change from first to last point: {(last - first) / abs(first) * 100:.1f}%."
+        return text
 
     async def profile_dataset(self, dataset: Dataset) -> dict:
+        set_run_type("profile")
         base_template = PromptLoader.load("data_profiler_prompt.txt")
         repair_template = PromptLoader.load("data_profiler_repair_prompt.txt")
 
@@ -70,7 +123,7 @@ class AIAgentService:
                 )
 
             try:
-                output = await self.client.generate_json(prompt)
+                output = await self.client.generate_json(prompt, run_type="profile", user_key=self.telegram_id)
                 last_output = output
                 summary = str(output.get("summary", "Dataset profile generated."))
                 insights = output.get("insights", [])
@@ -80,6 +133,7 @@ class AIAgentService:
                 if not isinstance(suggested, list):
                     suggested = []
 
+                RUN_ATTEMPTS.labels("profile", MODEL).observe(attempt)
                 return {
                     "summary": summary,
                     "insights": [str(i) for i in insights][:5],
@@ -87,15 +141,56 @@ class AIAgentService:
                     "attempts": attempt,
                     "error_log": errors,
                 }
+            except CircuitOpenError:
+                logger.warning("LLM circuit open, serving heuristic profile for dataset=%s", dataset.id)
+                return {**self._heuristic_profile(dataset), "attempts": attempt, "error_log": errors, "fallback": True}
+            except SchedulerSaturatedError:
+                raise
             except Exception as exc:
                 err = str(exc)
                 errors.append(err)
+                LLM_FAILURES.labels(type(exc).__name__, "profile", MODEL).inc()
                 logger.warning("profile attempt=%s failed: %s", attempt, err)
 
         raise AppException(f"LLM profile failed after {settings.llm_max_attempts} attempts", 502)
 
-    async def ask(self, dataset: Dataset, question: str) -> dict:
-        df = self.dataset_service.load_dataframe(dataset)
+    def _materialize_query(self, df: "pd.DataFrame", parsed: dict) -> dict:
+        pandas_query = parsed.get("pandas_query")
+        if pandas_query is not None and not isinstance(pandas_query, str):
+            raise AppException("Invalid pandas_query returned by model", 502)
+
+        raw_config = parsed.get("chart_config") or {}
+        if not isinstance(raw_config, dict):
+            raise AppException("Invalid chart_config returned by model", 502)
+        agg = raw_config.get("aggregation")
+        if agg is not None and agg not in ALLOWED_AGGREGATIONS:
+            raise AppException(f"Unsupported aggregation: {agg}", 400)
+        columns = list(df.columns)
+        # Stricter than sanitize_chart_config on purpose: an unknown axis goes through the
+        # local repair (fuzzy match, else the sanitiser's fallback) so the fix is counted.
+        for axis in ("x", "y"):
+            column = raw_config.get(axis)
+            if column is not None and column not in columns:
+                raise AppException(f"Unknown chart column: {column}", 400)
+
+        filtered = execute_safe_query(df, pandas_query)
+        chart_config = sanitize_chart_config(raw_config, columns)
+        chart_data = build_chart_data(filtered, chart_config)
+
+        if not chart_data:
+            raise AppException("Chart data is empty", 400)
+
+        return {
+            "answer": str(parsed.get("answer", "Analysis complete.")),
+            "pandas_query": pandas_query,
+            "chart_config": chart_config,
+            "chart_data": chart_data,
+        }
+
+    async def ask(self, dataset: Dataset, question: str, run_type: str = "query", df: "pd.DataFrame | None" = None) -> dict:
+        set_run_type(run_type)
+        if df is None:
+            df = await run_in_threadpool(load_dataframe, dataset)
         schema = json.loads(dataset.schema_json)
 
         base_template = PromptLoader.load("query_translator_prompt.txt")
@@ -121,66 +216,61 @@ class AIAgentService:
                 )
 
             try:
-                raw = await self.client.generate_json(prompt)
+                raw = await self.client.generate_json(prompt, run_type=run_type, user_key=self.telegram_id)
                 parsed = parse_json_payload(json.dumps(raw))
                 last_output = parsed
 
-                pandas_query = parsed.get("pandas_query")
-                if pandas_query is not None and not isinstance(pandas_query, str):
-                    raise AppException("Invalid pandas_query returned by model", 502)
-
-                filtered = execute_safe_query(df, pandas_query)
-                chart_config = sanitize_chart_config(parsed.get("chart_config", {}), list(df.columns))
-                chart_data = self._build_chart_data(filtered, chart_config)
-
-                if not chart_data:
-                    raise AppException("Chart data is empty", 400)
-
+                try:
+                    result = await run_in_threadpool(self._materialize_query, df, parsed)
+                except Exception as exc:
+                    repaired, rules = repair_query_output(parsed, list(df.columns))
+                    if not rules:
+                        raise
+                    errors.append(str(exc))
+                    for rule in rules:
+                        QUERY_REPAIRS.labels(rule, run_type, MODEL).inc()
+                    logger.info("query attempt=%s retrying locally after repair rules=%s", attempt, rules)
+                    last_output = repaired
+                    result = await run_in_threadpool(self._materialize_query, df, repaired)
+
+                RUN_ATTEMPTS.labels(run_type, MODEL).observe(attempt)
+                return {**result, "attempts": attempt, "error_log": errors}
+            except CircuitOpenError:
+                cached = await self.dataset_service.get_cached_query(dataset.id, question)
+                AI_CACHE_REQUESTS.labels("query_fallback", "miss" if cached is None else "hit", run_type).inc()
+                if cached is None:
+                    raise
+                logger.warning("LLM circuit open, serving cached answer for dataset=%s", dataset.id)
                 return {
-                    "answer": str(parsed.get("answer", "Analysis complete.")),
-                    "pandas_query": pandas_query,
-                    "chart_config": chart_config,
-                    "chart_data": chart_data,
+                    "answer": str(cached.get("answer", "Analysis complete.")),
+                    "pandas_query": cached.get("pandas_query"),
+                    "chart_config": cached.get("chart_config", {}),
+                    "chart_data": cached.get("chart_data", []),
                     "attempts": attempt,
                     "error_log": errors,
+                    "fallback": True,
                 }
+            except SchedulerSaturatedError:
+                raise
             except Exception as exc:
                 err = str(exc)
                 errors.append(err)
+                LLM_FAILURES.labels(type(exc).__name__, run_type, MODEL).inc()
                 logger.warning("query attempt=%s failed: %s", attempt, err)
 
         raise AppException(f"LLM query failed after {settings.llm_max_attempts} attempts", 502)
 
-    async def compare_periods(self, dataset: Dataset, date_column: str, value_column: str, period: str) -> dict:
-        df = self.dataset_service.load_dataframe(dataset)
-        if date_column not in df.columns or value_column not in df.columns:
-            raise AppException("Invalid columns for period comparison", 400)
-
-        dates = pd.to_datetime(df[date_column], errors="coerce")
-        values = pd.to_numeric(df[value_column], errors="coerce")
-        local = pd.DataFrame({"date": dates, "value": values}).dropna()
-        if local.empty:
-            raise AppException("Insufficient data for period comparison", 400)
-
-        period_map = {"day": "D", "week": "W", "month": "M"}
-        code = period_map.get(period, "M")
-
-        grouped = local.groupby(local["date"].dt.to_period(code))["value"].sum().sort_index()
-        tail = grouped.tail(12)
-        prev = tail.shift(1)
-
-        chart_data = [
-            {
-                "x": str(idx),
-                "current": float(cur),
-                "previous": float(prev.loc[idx]) if pd.notna(prev.loc[idx]) else None,
-            }
-            for idx, cur in tail.items()
-        ]
-
-        latest = tail.iloc[-1]
-        before = prev.iloc[-1]
-        if pd.notna(before) and before != 0:
+    async def compare_periods(
+        self, dataset: Dataset, date_column: str, value_column: str, period: str, df: "pd.DataFrame | None" = None
+    ) -> dict:
+        set_run_type("compare")
+        if df is None:
+            df = await run_in_threadpool(load_dataframe, dataset)
+        chart_data = await run_in_threadpool(build_comparison_data, df, date_column, value_column, period)
+
+        latest = chart_data[-1]["current"]
+        before = chart_data[-1]["previous"]
+        if before is not None and before != 0:
             delta_pct = ((latest - before) / abs(before)) * 100
             summary = f"Change in latest {period}: {delta_pct:.1f}% versus previous period."
         else:
@@ -188,17 +278,17 @@ class AIAgentService:
 
         return {
             "summary": summary,
-            "chart_config": {
-                "type": "line",
-                "x": date_column,
-                "y": value_column,
-                "comparison": True,
-                "period": period,
-            },
+            "chart_config": comparison_chart_config(date_column, value_column, period),
             "chart_data": chart_data,
         }
 
-    async def generate_dashboard(self, dataset: Dataset, prompt_text: str) -> dict:
+    async def generate_dashboard(
+        self,
+        dataset: Dataset,
+        prompt_text: str,
+        on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+    ) -> dict:
+        set_run_type("nl2dashboard")
         prompt_template = PromptLoader.load("nl2dashboard_prompt.txt")
         prompt = prompt_template.format(
             schema=dataset.schema_json,
@@ -206,7 +296,12 @@ class AIAgentService:
             prompt=prompt_text,
         )
 
-        output = await self.client.generate_json(prompt)
+        try:
+            output = await self.client.generate_json(prompt, run_type="nl2dashboard", user_key=self.telegram_id)
+        except CircuitOpenError:
+            logger.warning("LLM circuit open, serving heuristic dashboard for dataset=%s", dataset.id)
+            return await self._heuristic_dashboard(dataset)
+
         widgets_raw = output.get("widgets", []) if isinstance(output, dict) else []
         if not isinstance(widgets_raw, list) or not widgets_raw:
             widgets_raw = [
@@ -214,22 +309,38 @@ class AIAgentService:
                 {"title": "Top categories", "question": "Show top categories by contribution"},
             ]
 
+        widgets_raw = widgets_raw[:4]
+        if on_progress:
+            await on_progress(0, len(widgets_raw))
+
         widgets: list[dict] = []
-        for raw in widgets_raw[:4]:
+        circuit_open = False
+        for index, raw in enumerate(widgets_raw, start=1):
             question = str(raw.get("question", "Show key chart"))
             title = str(raw.get("title", "AI Widget"))
             try:
-                chart = await self.ask(dataset, question)
+                chart = await self.ask(dataset, question, run_type="nl2dashboard")
                 widgets.append(
                     {
                         "title": title,
+                        "pandas_query": chart["pandas_query"],
                         "chart_config": chart["chart_config"],
                         "chart_data": chart["chart_data"],
                     }
                 )
+            except CircuitOpenError:
+                circuit_open = True
+                break
+            except SchedulerSaturatedError:
+                raise
             except Exception as exc:
                 logger.warning("nl2dashboard widget failed: %s", exc)
+            if on_progress:
+                await on_progress(index, len(widgets_raw))
 
+        if not widgets and circuit_open:
+            logger.warning("LLM circuit opened mid-build, serving heuristic dashboard for dataset=%s", dataset.id)
+            return await self._heuristic_dashboard(dataset)
         if not widgets:
             raise AppException("Failed to build widgets for dashboard", 502)
 
@@ -239,6 +350,7 @@ class AIAgentService:
         }
 
     async def explain_chart(self, dataset: Dataset, chart_config: dict, chart_data: list[dict], question: str | None) -> dict:
+        set_run_type("explain")
         prompt_template = PromptLoader.load("explain_chart_prompt.txt")
         prompt = prompt_template.format(
             schema=dataset.schema_json,
@@ -246,6 +358,10 @@ class AIAgentService:
             chart_data=json.dumps(chart_data[:120]),
             question=question or "Explain chart in plain Russian.",
         )
-        output = await self.client.generate_json(prompt)
+        try:
+            output = await self.client.generate_json(prompt, run_type="explain", user_key=self.telegram_id)
+        except CircuitOpenError:
+            logger.warning("LLM circuit open, serving heuristic chart explanation for dataset=%s", dataset.id)
+            return {"explanation": self._heuristic_explanation(chart_data), "fallback": True}
         explanation = str(output.get("explanation", "Chart shows trend and key changes in selected data."))
         return {"explanation": explanation}
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from app.utils.middleware import AppException
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+LATENCY_SMOOTHING = 0.3
+
+
+class OllamaUnavailableError(AppException):
+    pass
+
+
+@dataclass
+class OllamaBackend:
+    url: str
+    healthy: bool = True
+    in_flight: int = 0
+    latency_ewma: float | None = None
+    consecutive_failures: int = 0
+    last_error: str | None = None
+    failed_at: float = 0.0
+
+    def load_score(self) -> tuple[float, int]:
+        # Unmeasured backends score zero so that every node gets sampled at least once.
+        return (self.in_flight + 1) * (self.latency_ewma or 0.0), self.in_flight
+
+
+class OllamaBackendPool:
+    def __init__(self, urls: list[str], unhealthy_after: int, probe_interval_s: float) -> None:
+        self.backends = [OllamaBackend(url=u.rstrip("/")) for u in urls]
+        self.unhealthy_after = max(1, unhealthy_after)
+        self.probe_interval_s = probe_interval_s
+        self._probe_task: asyncio.Task | None = None
+
+    def acquire(self) -> OllamaBackend:
+        if not self.backends:
+            raise OllamaUnavailableError("No Ollama backend configured", 503)
+        candidates = [b for b in self.backends if b.healthy]
+        if candidates:
+            backend = min(candidates, key=lambda b: b.load_score())
+        else:
+            # With every node ejected (always the case for a single-node pool after a couple
+            # of timeouts) refusing to route would add an outage on top of the circuit
+            # breaker; try the node that failed longest ago instead.
+            backend = min(self.backends, key=lambda b: b.failed_at)
+        backend.in_flight += 1
+        return backend
+
+    def release(self, backend: OllamaBackend, latency_s: float | None = None, error: str | None = None) -> None:
+        backend.in_flight -= 1
+        if error is None:
+            self._mark_success(backend, latency_s)
+        else:
+            self._mark_failure(backend, error)
+
+    def _mark_success(self, backend: OllamaBackend, latency_s: float | None) -> None:
+        if not backend.healthy:
+            logger.info("Ollama backend recovered url=%s", backend.url)
+        backend.healthy = True
+        backend.consecutive_failures = 0
+        backend.last_error = None
+        if latency_s is not None:
+            if backend.latency_ewma is None:
+                backend.latency_ewma = latency_s
+            else:
+                backend.latency_ewma = LATENCY_SMOOTHING * latency_s + (1 - LATENCY_SMOOTHING) * backend.latency_ewma
+
+    def _mark_failure(self, backend: OllamaBackend, error: str) -> None:
+        backend.consecutive_failures += 1
+        backend.last_error = error
+        backend.failed_at = time.monotonic()
+        if backend.healthy and backend.consecutive_failures >= self.unhealthy_after:
+            backend.healthy = False
+            logger.warning("Ollama backend marked unhealthy url=%s error=%s", backend.url, error)
+
+    async def probe(self) -> None:
+        import httpx
+
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            results = await asyncio.gather(
+                *(client.get(f"{b.url}/api/tags") for b in self.backends),
+                return_exceptions=True,
+            )
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, Exception):
+                self._mark_failure(backend, str(result) or type(result).__name__)
+            elif result.status_code != 200:
+                self._mark_failure(backend, f"health probe returned {result.status_code}")
+            else:
+                self._mark_success(backend, None)
+
+    async def _probe_loop(self) -> None:
+        while True:
+            try:
+                await self.probe()
+            except Exception as exc:
+                logger.warning("Ollama health probe failed: %s", exc)
+            await asyncio.sleep(self.probe_interval_s)
+
+    def start(self) -> None:
+        if self._probe_task is None and self.probe_interval_s > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self) -> None:
+        if self._probe_task is None:
+            return
+        self._probe_task.cancel()
+        try:
+            await self._probe_task
+        except asyncio.CancelledError:
+            pass
+        self._probe_task = None
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "url": b.url,
+                "healthy": b.healthy,
+                "in_flight": b.in_flight,
+                "latency_ms": round(b.latency_ewma * 1000, 1) if b.latency_ewma is not None else None,
+                "consecutive_failures": b.consecutive_failures,
+                "last_error": b.last_error,
+            }
+            for b in self.backends
+        ]
+
+
+def _configured_urls() -> list[str]:
+    urls = [u.strip() for u in settings.ollama_base_urls.split(",") if u.strip()]
+    return urls or [settings.ollama_base_url]
+
+
+ollama_pool = OllamaBackendPool(
+    _configured_urls(),
+    unhealthy_after=settings.ollama_unhealthy_after,
+    probe_interval_s=settings.ollama_health_interval_s,
+)
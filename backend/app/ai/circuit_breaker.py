@@ -0,0 +1,79 @@
+import logging
+import math
+import time
+
+from app.utils.middleware import AppException
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(AppException):
+    def __init__(self, retry_after: int):
+        super().__init__("LLM backend is unavailable, retry later", 503, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout_s: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == STATE_OPEN and self._remaining() > 0
+
+    def _remaining(self) -> float:
+        return self.opened_at + self.reset_timeout_s - time.monotonic()
+
+    def before_call(self) -> None:
+        if self.is_open:
+            raise CircuitOpenError(max(1, math.ceil(self._remaining())))
+        if self.state == STATE_OPEN:
+            self.state = STATE_HALF_OPEN
+            logger.info("LLM circuit half-open, probing backend")
+        if self.state == STATE_HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(1)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state == STATE_HALF_OPEN:
+            logger.info("LLM circuit closed after successful probe")
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self, error: str) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.trips += 1
+                logger.warning("LLM circuit opened after %s failures: %s", self.consecutive_failures, error)
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "retry_after_s": math.ceil(self._remaining()) if self.is_open else 0,
+        }
+
+
+llm_breaker = CircuitBreaker(settings.llm_breaker_threshold, settings.llm_breaker_reset_s)
@@ -1,21 +1,55 @@
 import json
+import time
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import httpx
-
+from app.ai.backend_pool import OllamaUnavailableError, ollama_pool
+from app.ai.circuit_breaker import llm_breaker
+from app.ai.scheduler import llm_scheduler
+from app.utils.metrics import observe_stage, record_stage
 from app.utils.middleware import AppException
 from app.utils.settings import get_settings
 
+if TYPE_CHECKING:
+    import httpx
+
 settings = get_settings()
 PROMPT_DIR = Path(__file__).resolve().parent / "prompts"
 
 
 class OllamaClient:
     def __init__(self) -> None:
-        self.base_url = settings.ollama_base_url.rstrip("/")
         self.model = settings.ollama_model
 
-    async def generate_json(self, prompt: str) -> dict:
+    async def generate_json(self, prompt: str, run_type: str = "query", user_key: int | None = None) -> dict:
+        llm_breaker.before_call()
+        queued = time.perf_counter()
+        try:
+            async with llm_scheduler.slot(user_key, run_type):
+                record_stage("llm_queue", time.perf_counter() - queued, run_type)
+                with observe_stage("llm_generate", run_type):
+                    response = await self._post(prompt)
+        except OllamaUnavailableError as exc:
+            llm_breaker.record_failure(exc.message)
+            raise
+        except BaseException:
+            llm_breaker.release_probe()
+            raise
+        llm_breaker.record_success()
+
+        if response.status_code != 200:
+            raise AppException(f"Ollama request failed: {response.text}", 502)
+        data = response.json()
+        raw = data.get("response", "{}")
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as exc:
+            raise AppException("Ollama returned invalid JSON", 502) from exc
+
+    async def _post(self, prompt: str) -> "httpx.Response":
+        import httpx
+
         payload = {
             "model": self.model,
             "prompt": prompt,
@@ -23,22 +57,35 @@ class OllamaClient:
             "format": "json",
             "options": {"temperature": 0.2},
         }
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(f"{self.base_url}/api/generate", json=payload)
-            if response.status_code != 200:
-                raise AppException(f"Ollama request failed: {response.text}", 502)
-            data = response.json()
-            raw = data.get("response", "{}")
-            try:
-                return json.loads(raw)
-            except json.JSONDecodeError as exc:
-                raise AppException("Ollama returned invalid JSON", 502) from exc
+        backend = ollama_pool.acquire()
+        started = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=settings.llm_timeout_s) as client:
+                response = await client.post(f"{backend.url}/api/generate", json=payload)
+        except httpx.HTTPError as exc:
+            error = str(exc) or type(exc).__name__
+            ollama_pool.release(backend, error=error)
+            raise OllamaUnavailableError(f"Ollama request failed: {error}", 502) from exc
+
+        if response.status_code >= 500:
+            ollama_pool.release(backend, error=f"status {response.status_code}")
+            raise OllamaUnavailableError(f"Ollama request failed: {response.text}", 502)
+        ollama_pool.release(backend, latency_s=time.monotonic() - started)
+        return response
 
 
 class PromptLoader:
     @staticmethod
+    @lru_cache(maxsize=None)
     def load(name: str) -> str:
         file_path = PROMPT_DIR / name
         if not file_path.exists():
             raise AppException(f"Prompt file missing: {name}", 500)
         return file_path.read_text(encoding="utf-8")
+
+    @staticmethod
+    def preload() -> int:
+        names = [path.name for path in PROMPT_DIR.glob("*.txt")]
+        for name in names:
+            PromptLoader.load(name)
+        return len(names)
@@ -0,0 +1,125 @@
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from app.utils.middleware import AppException
+from app.utils.settings import get_settings
+
+settings = get_settings()
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+RUN_TYPE_PRIORITY = {
+    "query": PRIORITY_INTERACTIVE,
+    "explain": PRIORITY_INTERACTIVE,
+    "profile": PRIORITY_BACKGROUND,
+    "nl2dashboard": PRIORITY_BACKGROUND,
+}
+
+
+class SchedulerSaturatedError(AppException):
+    def __init__(self, retry_after: int):
+        super().__init__("LLM queue is full, retry later", 429, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._active = 0
+        self._waiting = 0
+        self._queues: dict[int, OrderedDict[str, deque[asyncio.Future]]] = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._wait_times: deque[float] = deque(maxlen=512)
+        self._service_times: deque[float] = deque(maxlen=128)
+        self._counters: Counter[str] = Counter()
+
+    @asynccontextmanager
+    async def slot(self, user_key: int | str | None, run_type: str) -> AsyncIterator[None]:
+        priority = RUN_TYPE_PRIORITY.get(run_type, PRIORITY_INTERACTIVE)
+        await self._acquire(str(user_key or "anonymous"), priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_times.append(time.monotonic() - started)
+            self._release()
+
+    async def _acquire(self, user_key: str, priority: int) -> None:
+        if self._active < self.max_concurrency and self._waiting == 0:
+            self._active += 1
+            self._wait_times.append(0.0)
+            self._counters["admitted"] += 1
+            return
+
+        if self._waiting >= self.max_queue:
+            self._counters["rejected"] += 1
+            raise SchedulerSaturatedError(self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_key, deque()).append(future)
+        self._waiting += 1
+        enqueued = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                self._discard(priority, user_key, future)
+            raise
+        self._wait_times.append(time.monotonic() - enqueued)
+        self._counters["admitted"] += 1
+
+    def _release(self) -> None:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user_key, waiters = next(iter(users.items()))
+                future = waiters.popleft()
+                if waiters:
+                    users.move_to_end(user_key)
+                else:
+                    del users[user_key]
+                self._waiting -= 1
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self._active -= 1
+
+    def _discard(self, priority: int, user_key: str, future: asyncio.Future) -> None:
+        waiters = self._queues[priority].get(user_key)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self._waiting -= 1
+        if not waiters:
+            del self._queues[priority][user_key]
+
+    def _retry_after(self) -> int:
+        service = sum(self._service_times) / len(self._service_times) if self._service_times else 5.0
+        return max(1, math.ceil(service * (self._waiting + 1) / self.max_concurrency))
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._waiting,
+            "queue_depth_by_priority": {
+                name: sum(len(w) for w in self._queues[p].values()) for p, name in PRIORITY_NAMES.items()
+            },
+            "max_queue": self.max_queue,
+            "admitted": self._counters["admitted"],
+            "rejected": self._counters["rejected"],
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+
+llm_scheduler = LLMScheduler(settings.llm_max_concurrency, settings.llm_queue_max)
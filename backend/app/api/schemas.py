@@ -36,12 +36,14 @@ class AIQueryOut(BaseModel):
 
 
 class AIHistoryItem(BaseModel):
-    id: int
+    # id and payload_url are null for a run that is still waiting to be written.
+    id: int | None
     question: str | None
     answer: str
     pandas_query: str | None
-    chart_config: dict | None
-    chart_data: list[dict] | None
+    chart_type: str | None = None
+    row_count: int | None = None
+    payload_url: str | None
     attempts: int
     created_at: str
 
@@ -49,6 +51,7 @@ class AIHistoryItem(BaseModel):
 class AIHistoryOut(BaseModel):
     profile: AIProfileOut | None
     queries: list[AIHistoryItem]
+    next_cursor: str | None = None
 
 
 class ComparePeriodsIn(BaseModel):
@@ -63,12 +66,37 @@ class ComparePeriodsOut(BaseModel):
     chart_data: list[dict]
 
 
+class AIBatchIn(BaseModel):
+    queries: list[AIQueryIn] = Field(default_factory=list, max_length=20)
+    comparisons: list[ComparePeriodsIn] = Field(default_factory=list, max_length=20)
+
+
+class AIBatchQueryResult(BaseModel):
+    question: str
+    result: AIQueryOut | None = None
+    error: str | None = None
+    status_code: int = 200
+
+
+class AIBatchCompareResult(BaseModel):
+    request: ComparePeriodsIn
+    result: ComparePeriodsOut | None = None
+    error: str | None = None
+    status_code: int = 200
+
+
+class AIBatchOut(BaseModel):
+    queries: list[AIBatchQueryResult]
+    comparisons: list[AIBatchCompareResult]
+
+
 class NL2DashboardIn(BaseModel):
     prompt: str = Field(min_length=5, max_length=600)
 
 
 class NL2DashboardWidget(BaseModel):
     title: str
+    pandas_query: str | None = None
     chart_config: dict
     chart_data: list[dict]
 
@@ -78,6 +106,19 @@ class NL2DashboardOut(BaseModel):
     widgets: list[NL2DashboardWidget]
 
 
+class AIJobOut(BaseModel):
+    id: str
+    job_type: str
+    dataset_id: int
+    status: str
+    progress_done: int
+    progress_total: int
+    result: dict | None
+    error: str | None
+    created_at: str
+    updated_at: str
+
+
 class ExplainChartIn(BaseModel):
     question: str | None = None
     chart_config: dict
@@ -107,6 +148,15 @@ class DashboardOut(BaseModel):
     updated_at: str
 
 
+class DashboardRefreshOut(BaseModel):
+    dashboard: DashboardOut
+    recomputed: int
+    cached: int
+    unchanged: int
+    skipped: int
+    errors: dict[str, str]
+
+
 class DashboardTeamShareIn(BaseModel):
     telegram_id: int
     team_id: int
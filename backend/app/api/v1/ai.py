@@ -1,10 +1,21 @@
-﻿import json
+﻿import asyncio
+import json
+import logging
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse
 
 from app.ai.agents import AIAgentService
+from app.ai.backend_pool import ollama_pool
+from app.ai.circuit_breaker import llm_breaker
+from app.ai.scheduler import llm_scheduler
 from app.api.schemas import (
+    AIBatchCompareResult,
+    AIBatchIn,
+    AIBatchOut,
+    AIBatchQueryResult,
+    AIJobOut,
+    AIHistoryItem,
     AIHistoryOut,
     AIProfileOut,
     AIQueryIn,
@@ -16,40 +27,48 @@ from app.api.schemas import (
     NL2DashboardIn,
     NL2DashboardOut,
 )
-from app.models.database import get_db
-from app.services.dataset_service import DatasetService
+from app.models.database import AsyncDB, get_async_db
+from app.services.async_service import AsyncService
+from app.services.ai_jobs import in_flight_profile, run_batch, run_nl2dashboard, run_profile, submit_job
+from app.services.ai_run_log import ai_run_writer
+from app.services.dataset_service import DEFAULT_ANSWER, DatasetService
+from app.services.job_service import JobService
+from app.utils.chart_format import loads_compact, negotiated_response
+from app.utils.metrics import AI_CACHE_REQUESTS
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.post("/profile/{dataset_id}", response_model=AIProfileOut)
-async def profile_dataset(dataset_id: int, telegram_id: int, db: Session = Depends(get_db)) -> AIProfileOut:
-    dataset_service = DatasetService(db)
-    dataset = dataset_service.get_dataset(dataset_id, telegram_id)
-    ai_service = AIAgentService(dataset_service)
-    result = await ai_service.profile_dataset(dataset)
+async def profile_dataset(dataset_id: int, telegram_id: int, refresh: bool = False, db: AsyncDB = Depends(get_async_db)) -> AIProfileOut:
+    dataset_service = AsyncService(DatasetService, db)
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
 
-    response = {
-        "summary": result["summary"],
-        "insights": result["insights"],
-        "suggested_visualizations": result["suggested_visualizations"],
-    }
-    dataset_service.save_ai_run(
-        dataset=dataset,
-        telegram_id=telegram_id,
-        run_type="profile",
-        response=response,
-        attempts=result.get("attempts", 1),
-        error_log=result.get("error_log", []),
-    )
+    if not refresh:
+        in_flight = in_flight_profile(dataset.id)
+        if in_flight is not None:
+            try:
+                return AIProfileOut(**await asyncio.shield(in_flight))
+            except Exception as exc:
+                logger.warning("precomputed profile failed for dataset=%s: %s", dataset.id, exc)
+        stored = await dataset_service.get_latest_profile(dataset.id)
+        AI_CACHE_REQUESTS.labels("profile", "miss" if stored is None else "hit", "profile").inc()
+        if stored is not None:
+            return AIProfileOut(**stored)
+
+    response = await run_profile(dataset_service, dataset.id, telegram_id)
     return AIProfileOut(**response)
 
 
 @router.post("/query/{dataset_id}", response_model=AIQueryOut)
-async def ask_ai(dataset_id: int, payload: AIQueryIn, telegram_id: int, db: Session = Depends(get_db)) -> AIQueryOut:
-    dataset_service = DatasetService(db)
-    dataset = dataset_service.get_dataset(dataset_id, telegram_id)
-    ai_service = AIAgentService(dataset_service)
+async def ask_ai(
+    dataset_id: int, payload: AIQueryIn, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> JSONResponse:
+    dataset_service = AsyncService(DatasetService, db)
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
     result = await ai_service.ask(dataset=dataset, question=payload.question)
 
     response = {
@@ -58,80 +77,148 @@ async def ask_ai(dataset_id: int, payload: AIQueryIn, telegram_id: int, db: Sess
         "chart_config": json.loads(json.dumps(result["chart_config"])),
         "chart_data": result["chart_data"],
     }
-    dataset_service.save_ai_run(
-        dataset=dataset,
-        telegram_id=telegram_id,
-        run_type="query",
-        response=response,
-        question=payload.question,
-        attempts=result.get("attempts", 1),
-        error_log=result.get("error_log", []),
-    )
-    return AIQueryOut(**response)
+    if not result.get("fallback"):
+        await dataset_service.save_ai_run(
+            dataset=dataset,
+            telegram_id=telegram_id,
+            run_type="query",
+            response=response,
+            question=payload.question,
+            attempts=result.get("attempts", 1),
+            error_log=result.get("error_log", []),
+        )
+    return negotiated_response(request, AIQueryOut(**response))
 
 
 @router.post("/compare/{dataset_id}", response_model=ComparePeriodsOut)
-async def compare_periods(dataset_id: int, payload: ComparePeriodsIn, telegram_id: int, db: Session = Depends(get_db)) -> ComparePeriodsOut:
-    dataset_service = DatasetService(db)
-    dataset = dataset_service.get_dataset(dataset_id, telegram_id)
-    ai_service = AIAgentService(dataset_service)
+async def compare_periods(
+    dataset_id: int, payload: ComparePeriodsIn, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> JSONResponse:
+    dataset_service = AsyncService(DatasetService, db)
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
     result = await ai_service.compare_periods(
         dataset=dataset,
         date_column=payload.date_column,
         value_column=payload.value_column,
         period=payload.period,
     )
-    dataset_service.save_ai_run(
+    await dataset_service.save_ai_run(
         dataset=dataset,
         telegram_id=telegram_id,
         run_type="compare",
         response=result,
         question=f"compare:{payload.period}:{payload.date_column}:{payload.value_column}",
     )
-    return ComparePeriodsOut(**result)
+    return negotiated_response(request, ComparePeriodsOut(**result))
 
 
-@router.post("/nl2dashboard/{dataset_id}", response_model=NL2DashboardOut)
-async def nl2dashboard(dataset_id: int, payload: NL2DashboardIn, telegram_id: int, db: Session = Depends(get_db)) -> NL2DashboardOut:
-    dataset_service = DatasetService(db)
-    dataset = dataset_service.get_dataset(dataset_id, telegram_id)
-    ai_service = AIAgentService(dataset_service)
-    result = await ai_service.generate_dashboard(dataset=dataset, prompt_text=payload.prompt)
-    dataset_service.save_ai_run(
-        dataset=dataset,
-        telegram_id=telegram_id,
-        run_type="nl2dashboard",
-        response=result,
-        question=payload.prompt,
+@router.post("/batch/{dataset_id}", response_model=AIBatchOut)
+async def ask_ai_batch(
+    dataset_id: int, payload: AIBatchIn, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> JSONResponse:
+    dataset_service = AsyncService(DatasetService, db)
+    comparisons = [comparison.model_dump() for comparison in payload.comparisons]
+    query_results, compare_results = await run_batch(
+        dataset_service, dataset_id, telegram_id, [query.question for query in payload.queries], comparisons
+    )
+    return negotiated_response(
+        request,
+        AIBatchOut(
+            queries=[
+                AIBatchQueryResult(question=query.question, result=result, error=error, status_code=status_code)
+                for query, (result, error, status_code) in zip(payload.queries, query_results)
+            ],
+            comparisons=[
+                AIBatchCompareResult(request=comparison, result=result, error=error, status_code=status_code)
+                for comparison, (result, error, status_code) in zip(payload.comparisons, compare_results)
+            ],
+        ),
     )
-    return NL2DashboardOut(**result)
+
+
+@router.post("/nl2dashboard/{dataset_id}", response_model=NL2DashboardOut)
+async def nl2dashboard(
+    dataset_id: int, payload: NL2DashboardIn, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> JSONResponse:
+    dataset_service = AsyncService(DatasetService, db)
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
+    result = await run_nl2dashboard(dataset_service, dataset.id, telegram_id, payload.prompt)
+    return negotiated_response(request, NL2DashboardOut(**result))
 
 
 @router.post("/explain/{dataset_id}", response_model=ExplainChartOut)
-async def explain_chart(dataset_id: int, payload: ExplainChartIn, telegram_id: int, db: Session = Depends(get_db)) -> ExplainChartOut:
-    dataset_service = DatasetService(db)
-    dataset = dataset_service.get_dataset(dataset_id, telegram_id)
-    ai_service = AIAgentService(dataset_service)
+async def explain_chart(dataset_id: int, payload: ExplainChartIn, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> ExplainChartOut:
+    dataset_service = AsyncService(DatasetService, db)
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
     result = await ai_service.explain_chart(
         dataset=dataset,
         chart_config=payload.chart_config,
         chart_data=payload.chart_data,
         question=payload.question,
     )
-    dataset_service.save_ai_run(
-        dataset=dataset,
-        telegram_id=telegram_id,
-        run_type="explain",
-        response=result,
-        question=payload.question,
-    )
+    if not result.get("fallback"):
+        await dataset_service.save_ai_run(
+            dataset=dataset,
+            telegram_id=telegram_id,
+            run_type="explain",
+            response=result,
+            question=payload.question,
+        )
     return ExplainChartOut(**result)
 
 
+def _to_job_out(job) -> AIJobOut:
+    return AIJobOut(
+        id=job.id,
+        job_type=job.job_type,
+        dataset_id=job.dataset_id,
+        status=job.status,
+        progress_done=job.progress_done,
+        progress_total=job.progress_total,
+        result=loads_compact(job.result_json) if job.result_json else None,
+        error=job.error,
+        created_at=job.created_at.isoformat(),
+        updated_at=job.updated_at.isoformat(),
+    )
+
+
+@router.post("/jobs/profile/{dataset_id}", response_model=AIJobOut, status_code=202)
+async def create_profile_job(dataset_id: int, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> AIJobOut:
+    dataset = await AsyncService(DatasetService, db).get_dataset(dataset_id, telegram_id)
+    job = await AsyncService(JobService, db).create_job(dataset, telegram_id, "profile", {})
+    submit_job(job, telegram_id)
+    return _to_job_out(job)
+
+
+@router.post("/jobs/nl2dashboard/{dataset_id}", response_model=AIJobOut, status_code=202)
+async def create_nl2dashboard_job(dataset_id: int, payload: NL2DashboardIn, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> AIJobOut:
+    dataset = await AsyncService(DatasetService, db).get_dataset(dataset_id, telegram_id)
+    job = await AsyncService(JobService, db).create_job(dataset, telegram_id, "nl2dashboard", {"prompt": payload.prompt})
+    submit_job(job, telegram_id)
+    return _to_job_out(job)
+
+
+@router.get("/jobs/{job_id}", response_model=AIJobOut)
+async def get_job(job_id: str, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)) -> JSONResponse:
+    return negotiated_response(request, _to_job_out(await AsyncService(JobService, db).get_job(job_id, telegram_id)))
+
+
 @router.get("/history/{dataset_id}", response_model=AIHistoryOut)
-def get_ai_history(dataset_id: int, telegram_id: int, db: Session = Depends(get_db)) -> AIHistoryOut:
-    dataset_service = DatasetService(db)
-    profile, queries = dataset_service.get_ai_history(dataset_id, telegram_id)
+async def get_ai_history(
+    request: Request,
+    dataset_id: int,
+    telegram_id: int,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncDB = Depends(get_async_db),
+) -> AIHistoryOut:
+    # Best effort so the runs get ids; anything still pending is merged in by the service.
+    if ai_run_writer.has_pending(dataset_id):
+        await ai_run_writer.flush()
+    dataset_service = AsyncService(DatasetService, db)
+    profile, runs, next_cursor = await dataset_service.get_ai_history(dataset_id, telegram_id, cursor=cursor, limit=limit)
 
     profile_payload = None
     if profile:
@@ -141,4 +228,40 @@ def get_ai_history(dataset_id: int, telegram_id: int, db: Session = Depends(get_
             suggested_visualizations=profile.get("suggested_visualizations", []),
         )
 
-    return AIHistoryOut(profile=profile_payload, queries=queries)
+    queries = [
+        AIHistoryItem(
+            id=run.id,
+            question=run.question,
+            answer=run.answer or DEFAULT_ANSWER,
+            pandas_query=run.pandas_query,
+            chart_type=run.chart_type,
+            row_count=run.row_count,
+            payload_url=(
+                str(request.app.url_path_for("get_ai_run_payload", dataset_id=dataset_id, run_id=run.id))
+                if run.id is not None
+                else None
+            ),
+            attempts=run.attempts,
+            created_at=run.created_at.isoformat(),
+        )
+        for run in runs
+    ]
+    return AIHistoryOut(profile=profile_payload, queries=queries, next_cursor=next_cursor)
+
+
+@router.get("/history/{dataset_id}/runs/{run_id}", response_model=AIQueryOut)
+async def get_ai_run_payload(
+    dataset_id: int, run_id: int, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> JSONResponse:
+    payload = await AsyncService(DatasetService, db).get_ai_run_payload(dataset_id, run_id, telegram_id)
+    return negotiated_response(request, AIQueryOut(**payload))
+
+
+@router.get("/scheduler/stats")
+def scheduler_stats() -> dict:
+    return llm_scheduler.stats()
+
+
+@router.get("/backends")
+def backend_stats() -> dict:
+    return {"circuit": llm_breaker.stats(), "backends": ollama_pool.stats()}
@@ -1,15 +1,35 @@
 import json
-
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-
-from app.api.schemas import DashboardCommentIn, DashboardCommentOut, DashboardIn, DashboardOut, DashboardTeamShareIn
-from app.models.database import get_db
-from app.models.entities import User
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.api.schemas import (
+    DashboardCommentIn,
+    DashboardCommentOut,
+    DashboardIn,
+    DashboardOut,
+    DashboardRefreshOut,
+    DashboardTeamShareIn,
+)
+from app.models.database import AsyncDB, get_async_db
+from app.services.async_service import AsyncService
+from app.services.dashboard_events import DashboardEvent, get_event_broker
 from app.services.dashboard_service import DashboardService
+from app.services.public_cache import CachedDashboard, public_dashboard_cache
+from app.services.widget_refresh import refresh_dashboard
+from app.utils.chart_format import COLUMNAR_MEDIA_TYPE, loads_compact, negotiated_response, pack_payload, wants_columnar
+from app.utils.http_cache import is_not_modified, make_etag, not_modified_response, validator_headers
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.utils.settings import get_settings
 
 router = APIRouter()
 public_router = APIRouter()
+settings = get_settings()
+
+# Clients revalidate on every use; an unchanged dashboard costs a 304 with no body.
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+PUBLIC_CACHE_CONTROL = "public, no-cache"
 
 
 def _to_dashboard_out(dashboard) -> DashboardOut:
@@ -17,7 +37,7 @@ def _to_dashboard_out(dashboard) -> DashboardOut:
         id=dashboard.id,
         title=dashboard.title,
         dataset_id=dashboard.dataset_id,
-        config=json.loads(dashboard.config_json),
+        config=loads_compact(dashboard.config_json),
         share_token=dashboard.share_token,
         is_public=dashboard.is_public,
         created_at=dashboard.created_at.isoformat(),
@@ -25,21 +45,24 @@ def _to_dashboard_out(dashboard) -> DashboardOut:
     )
 
 
-def _to_comment_out(db: Session, comment) -> DashboardCommentOut:
-    user = db.query(User).filter(User.id == comment.user_id).first()
+def _dashboard_etag(dashboard, columnar: bool = False) -> str:
+    return make_etag(dashboard.id, dashboard.updated_at.isoformat(), dashboard.share_token, dashboard.is_public, columnar)
+
+
+def _to_comment_out(comment) -> DashboardCommentOut:
     return DashboardCommentOut(
         id=comment.id,
         dashboard_id=comment.dashboard_id,
-        user_telegram_id=user.telegram_id if user else 0,
+        user_telegram_id=comment.user.telegram_id if comment.user else 0,
         text=comment.text,
         created_at=comment.created_at.isoformat(),
     )
 
 
 @router.post("/save", response_model=DashboardOut)
-def save_dashboard(payload: DashboardIn, db: Session = Depends(get_db)) -> DashboardOut:
-    service = DashboardService(db)
-    dashboard = service.save_dashboard(
+async def save_dashboard(payload: DashboardIn, db: AsyncDB = Depends(get_async_db)) -> DashboardOut:
+    service = AsyncService(DashboardService, db)
+    dashboard = await service.save_dashboard(
         telegram_id=payload.telegram_id,
         dataset_id=payload.dataset_id,
         title=payload.title,
@@ -50,30 +73,60 @@ def save_dashboard(payload: DashboardIn, db: Session = Depends(get_db)) -> Dashb
 
 
 @router.get("", response_model=list[DashboardOut])
-def list_dashboards(telegram_id: int, dataset_id: int | None = None, db: Session = Depends(get_db)) -> list[DashboardOut]:
-    service = DashboardService(db)
-    dashboards = service.list_dashboards(telegram_id=telegram_id, dataset_id=dataset_id)
-    return [_to_dashboard_out(d) for d in dashboards]
+async def list_dashboards(
+    telegram_id: int,
+    request: Request,
+    dataset_id: int | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncDB = Depends(get_async_db),
+) -> Response:
+    service = AsyncService(DashboardService, db)
+    dashboards, next_cursor = await service.list_dashboards(
+        telegram_id=telegram_id, dataset_id=dataset_id, cursor=cursor, limit=limit
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return negotiated_response(request, [_to_dashboard_out(d) for d in dashboards], headers)
 
 
 @router.get("/{dashboard_id}", response_model=DashboardOut)
-def get_dashboard(dashboard_id: int, telegram_id: int, db: Session = Depends(get_db)) -> DashboardOut:
-    service = DashboardService(db)
-    dashboard = service.get_dashboard(telegram_id=telegram_id, dashboard_id=dashboard_id)
-    return _to_dashboard_out(dashboard)
+async def get_dashboard(
+    dashboard_id: int, telegram_id: int, request: Request, db: AsyncDB = Depends(get_async_db)
+) -> Response:
+    service = AsyncService(DashboardService, db)
+    dashboard = await service.get_dashboard(telegram_id=telegram_id, dashboard_id=dashboard_id)
+    etag = _dashboard_etag(dashboard, wants_columnar(request))
+    headers = {**validator_headers(etag, dashboard.updated_at, PRIVATE_CACHE_CONTROL), "Vary": "Accept"}
+    if is_not_modified(request, etag, dashboard.updated_at):
+        return not_modified_response(headers)
+    return negotiated_response(request, _to_dashboard_out(dashboard), headers)
 
 
 @router.post("/{dashboard_id}/share", response_model=DashboardOut)
-def share_dashboard(dashboard_id: int, telegram_id: int, db: Session = Depends(get_db)) -> DashboardOut:
-    service = DashboardService(db)
-    dashboard = service.share_dashboard(telegram_id=telegram_id, dashboard_id=dashboard_id)
+async def share_dashboard(dashboard_id: int, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> DashboardOut:
+    service = AsyncService(DashboardService, db)
+    dashboard = await service.share_dashboard(telegram_id=telegram_id, dashboard_id=dashboard_id)
     return _to_dashboard_out(dashboard)
 
 
+@router.post("/{dashboard_id}/refresh", response_model=DashboardRefreshOut)
+async def refresh_dashboard_widgets(dashboard_id: int, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> DashboardRefreshOut:
+    service = AsyncService(DashboardService, db)
+    dashboard, stats = await refresh_dashboard(service, telegram_id=telegram_id, dashboard_id=dashboard_id)
+    return DashboardRefreshOut(
+        dashboard=_to_dashboard_out(dashboard),
+        recomputed=stats.recomputed,
+        cached=stats.cached,
+        unchanged=stats.unchanged,
+        skipped=stats.skipped,
+        errors=stats.errors,
+    )
+
+
 @router.post("/{dashboard_id}/team-share")
-def share_dashboard_to_team(dashboard_id: int, payload: DashboardTeamShareIn, db: Session = Depends(get_db)) -> dict:
-    service = DashboardService(db)
-    share = service.share_dashboard_to_team(
+async def share_dashboard_to_team(dashboard_id: int, payload: DashboardTeamShareIn, db: AsyncDB = Depends(get_async_db)) -> dict:
+    service = AsyncService(DashboardService, db)
+    share = await service.share_dashboard_to_team(
         telegram_id=payload.telegram_id,
         dashboard_id=dashboard_id,
         team_id=payload.team_id,
@@ -88,21 +141,88 @@ def share_dashboard_to_team(dashboard_id: int, payload: DashboardTeamShareIn, db
 
 
 @router.get("/{dashboard_id}/comments", response_model=list[DashboardCommentOut])
-def list_dashboard_comments(dashboard_id: int, telegram_id: int, db: Session = Depends(get_db)) -> list[DashboardCommentOut]:
-    service = DashboardService(db)
-    comments = service.list_comments(telegram_id=telegram_id, dashboard_id=dashboard_id)
-    return [_to_comment_out(db, c) for c in comments]
+async def list_dashboard_comments(
+    dashboard_id: int,
+    telegram_id: int,
+    response: Response,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncDB = Depends(get_async_db),
+) -> list[DashboardCommentOut]:
+    service = AsyncService(DashboardService, db)
+    comments, next_cursor = await service.list_comments(
+        telegram_id=telegram_id, dashboard_id=dashboard_id, cursor=cursor, limit=limit
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [_to_comment_out(c) for c in comments]
+
+
+def _format_event(event: DashboardEvent) -> str:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, separators=(',', ':'))}\n\n"
+
+
+async def _event_stream(request: Request, dashboard_id: int, last_event_id: str | None) -> AsyncIterator[str]:
+    async with get_event_broker().subscribe(dashboard_id, last_event_id) as subscription:
+        yield "retry: 3000\n\n"
+        while True:
+            event = await subscription.get(timeout=settings.dashboard_event_heartbeat_s)
+            if event is not None:
+                yield _format_event(event)
+                continue
+            if await request.is_disconnected():
+                return
+            yield ": keep-alive\n\n"
+
+
+# Server-sent events for one dashboard: comment.created, dashboard.updated, and resync when
+# missed events can no longer be replayed. Browsers resend the last id as Last-Event-ID on
+# reconnect; clients that manage their own reconnects can pass last_event_id instead.
+@router.get("/{dashboard_id}/events")
+async def dashboard_events(
+    dashboard_id: int,
+    telegram_id: int,
+    request: Request,
+    last_event_id: str | None = None,
+    db: AsyncDB = Depends(get_async_db),
+) -> StreamingResponse:
+    await AsyncService(DashboardService, db).get_dashboard(telegram_id=telegram_id, dashboard_id=dashboard_id)
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        _event_stream(request, dashboard_id, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/{dashboard_id}/comments", response_model=DashboardCommentOut)
-def add_dashboard_comment(dashboard_id: int, payload: DashboardCommentIn, db: Session = Depends(get_db)) -> DashboardCommentOut:
-    service = DashboardService(db)
-    comment = service.add_comment(telegram_id=payload.telegram_id, dashboard_id=dashboard_id, text=payload.text)
-    return _to_comment_out(db, comment)
+async def add_dashboard_comment(dashboard_id: int, payload: DashboardCommentIn, db: AsyncDB = Depends(get_async_db)) -> DashboardCommentOut:
+    service = AsyncService(DashboardService, db)
+    comment = await service.add_comment(telegram_id=payload.telegram_id, dashboard_id=dashboard_id, text=payload.text)
+    return _to_comment_out(comment)
 
 
 @public_router.get("/{token}", response_model=DashboardOut)
-def get_public_dashboard(token: str, db: Session = Depends(get_db)) -> DashboardOut:
-    service = DashboardService(db)
-    dashboard = service.get_public_dashboard(token)
-    return _to_dashboard_out(dashboard)
+async def get_public_dashboard(token: str, request: Request, db: AsyncDB = Depends(get_async_db)) -> Response:
+    cached = public_dashboard_cache.get(token)
+    if cached is None:
+        epoch = public_dashboard_cache.epoch
+        dashboard = await AsyncService(DashboardService, db).get_public_dashboard(token)
+        payload = _to_dashboard_out(dashboard).model_dump(mode="json")
+        cached = CachedDashboard(
+            body=json.dumps(payload, separators=(",", ":")).encode(),
+            columnar_body=json.dumps(pack_payload(payload), separators=(",", ":")).encode(),
+            etag=_dashboard_etag(dashboard),
+            columnar_etag=_dashboard_etag(dashboard, columnar=True),
+            last_modified=dashboard.updated_at,
+        )
+        public_dashboard_cache.put(token, cached, epoch)
+
+    columnar = wants_columnar(request)
+    etag = cached.columnar_etag if columnar else cached.etag
+    headers = {**validator_headers(etag, cached.last_modified, PUBLIC_CACHE_CONTROL), "Vary": "Accept"}
+    if is_not_modified(request, etag, cached.last_modified):
+        return not_modified_response(headers)
+    if columnar:
+        return Response(content=cached.columnar_body, media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
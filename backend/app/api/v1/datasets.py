@@ -1,23 +1,34 @@
+import hmac
 import json
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Form, Header, Query, Response, UploadFile
+from starlette.concurrency import run_in_threadpool
 
 from app.api.schemas import DatasetListItem, DatasetOut
-from app.models.database import get_db
-from app.services.dataset_service import DatasetService
+from app.models.database import AsyncDB, get_async_db
+from app.services.ai_jobs import schedule_profile
+from app.services.async_service import AsyncService
+from app.services.dataset_service import DatasetService, prepare_upload
+from app.services.query_stats import QueryStatsService, query_stats_writer
+from app.utils.middleware import AppException
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.utils.settings import get_settings
 
 router = APIRouter()
+settings = get_settings()
 
 
 @router.post("/upload", response_model=DatasetOut)
 async def upload_dataset(
     telegram_id: int = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncDB = Depends(get_async_db),
 ) -> DatasetOut:
-    service = DatasetService(db)
-    dataset = await service.upload_csv(telegram_id=telegram_id, file=file)
+    payload = await file.read()
+    upload = await run_in_threadpool(prepare_upload, file.filename, payload)
+    dataset = await AsyncService(DatasetService, db).create_dataset(telegram_id, upload)
+    if settings.profile_precompute:
+        schedule_profile(dataset.id, telegram_id)
     return DatasetOut(
         id=dataset.id,
         name=dataset.name,
@@ -29,9 +40,17 @@ async def upload_dataset(
 
 
 @router.get("", response_model=list[DatasetListItem])
-def list_datasets(telegram_id: int, db: Session = Depends(get_db)) -> list[DatasetListItem]:
-    service = DatasetService(db)
-    datasets = service.list_datasets(telegram_id)
+async def list_datasets(
+    telegram_id: int,
+    response: Response,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncDB = Depends(get_async_db),
+) -> list[DatasetListItem]:
+    service = AsyncService(DatasetService, db)
+    datasets, next_cursor = await service.list_datasets(telegram_id, cursor=cursor, limit=limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return [
         DatasetListItem(
             id=d.id,
@@ -44,10 +63,25 @@ def list_datasets(telegram_id: int, db: Session = Depends(get_db)) -> list[Datas
     ]
 
 
+def require_ops_token(x_ops_token: str | None = Header(None)) -> None:
+    # The report exposes every user's queries, so it is for operators only and stays
+    # hidden unless OPS_TOKEN is configured.
+    if not settings.ops_token:
+        raise AppException("Not found", 404)
+    if x_ops_token is None or not hmac.compare_digest(x_ops_token, settings.ops_token):
+        raise AppException("Invalid operator token", 403)
+
+
+@router.get("/query-stats", include_in_schema=False, dependencies=[Depends(require_ops_token)])
+async def query_stats_report(limit: int = Query(10, ge=1, le=100), db: AsyncDB = Depends(get_async_db)) -> dict:
+    await query_stats_writer.flush()
+    return await AsyncService(QueryStatsService, db).report(limit)
+
+
 @router.get("/{dataset_id}", response_model=DatasetOut)
-def get_dataset(dataset_id: int, telegram_id: int, db: Session = Depends(get_db)) -> DatasetOut:
-    service = DatasetService(db)
-    dataset = service.get_dataset(dataset_id=dataset_id, telegram_id=telegram_id)
+async def get_dataset(dataset_id: int, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> DatasetOut:
+    service = AsyncService(DatasetService, db)
+    dataset = await service.get_dataset(dataset_id=dataset_id, telegram_id=telegram_id)
     return DatasetOut(
         id=dataset.id,
         name=dataset.name,
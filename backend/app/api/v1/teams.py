@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 
 from app.api.schemas import TeamCreateIn, TeamMemberAddIn, TeamMemberOut, TeamOut
-from app.models.database import get_db
-from app.models.entities import User
+from app.models.database import AsyncDB, get_async_db
+from app.services.async_service import AsyncService
 from app.services.team_service import TeamService
 
 router = APIRouter()
@@ -13,20 +12,15 @@ def _to_team_out(team) -> TeamOut:
     return TeamOut(
         id=team.id,
         name=team.name,
-        owner_telegram_id=0,
+        owner_telegram_id=team.owner.telegram_id if team.owner else 0,
         created_at=team.created_at.isoformat(),
     )
 
 
-def _owner_telegram_id(db: Session, user_id: int) -> int:
-    owner = db.query(User).filter(User.id == user_id).first()
-    return owner.telegram_id if owner else 0
-
-
 @router.post("", response_model=TeamOut)
-def create_team(payload: TeamCreateIn, db: Session = Depends(get_db)) -> TeamOut:
-    service = TeamService(db)
-    team = service.create_team(payload.telegram_id, payload.name)
+async def create_team(payload: TeamCreateIn, db: AsyncDB = Depends(get_async_db)) -> TeamOut:
+    service = AsyncService(TeamService, db)
+    team = await service.create_team(payload.telegram_id, payload.name)
     return TeamOut(
         id=team.id,
         name=team.name,
@@ -36,28 +30,20 @@ def create_team(payload: TeamCreateIn, db: Session = Depends(get_db)) -> TeamOut
 
 
 @router.get("", response_model=list[TeamOut])
-def list_teams(telegram_id: int, db: Session = Depends(get_db)) -> list[TeamOut]:
-    service = TeamService(db)
-    teams = service.list_teams(telegram_id)
-    return [
-        TeamOut(
-            id=t.id,
-            name=t.name,
-            owner_telegram_id=_owner_telegram_id(db, t.owner_user_id),
-            created_at=t.created_at.isoformat(),
-        )
-        for t in teams
-    ]
+async def list_teams(telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> list[TeamOut]:
+    service = AsyncService(TeamService, db)
+    teams = await service.list_teams(telegram_id)
+    return [_to_team_out(t) for t in teams]
 
 
 @router.get("/{team_id}/members", response_model=list[TeamMemberOut])
-def list_members(team_id: int, telegram_id: int, db: Session = Depends(get_db)) -> list[TeamMemberOut]:
-    service = TeamService(db)
-    rows = service.list_members(telegram_id, team_id)
+async def list_members(team_id: int, telegram_id: int, db: AsyncDB = Depends(get_async_db)) -> list[TeamMemberOut]:
+    service = AsyncService(TeamService, db)
+    rows = await service.list_members(telegram_id, team_id)
     return [
         TeamMemberOut(
             team_id=r.team_id,
-            member_telegram_id=_owner_telegram_id(db, r.user_id),
+            member_telegram_id=r.user.telegram_id if r.user else 0,
             role=r.role,
             created_at=r.created_at.isoformat(),
         )
@@ -66,9 +52,9 @@ def list_members(team_id: int, telegram_id: int, db: Session = Depends(get_db))
 
 
 @router.post("/{team_id}/members", response_model=TeamMemberOut)
-def add_member(team_id: int, payload: TeamMemberAddIn, db: Session = Depends(get_db)) -> TeamMemberOut:
-    service = TeamService(db)
-    row = service.add_member(
+async def add_member(team_id: int, payload: TeamMemberAddIn, db: AsyncDB = Depends(get_async_db)) -> TeamMemberOut:
+    service = AsyncService(TeamService, db)
+    row = await service.add_member(
         actor_telegram_id=payload.actor_telegram_id,
         team_id=team_id,
         member_telegram_id=payload.member_telegram_id,
@@ -1,12 +1,34 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.ai.backend_pool import ollama_pool
+from app.ai.circuit_breaker import llm_breaker
+from app.ai.scheduler import llm_scheduler
 from app.api.routes import router
-from app.models.database import init_db
+from app.models.database import SessionLocal, dispose_async_engine
+from app.models.migrations import ensure_schema
+from app.services.ai_run_log import ai_run_writer
+from app.services.background import background_queue
+from app.services.dashboard_events import get_event_broker
+from app.services.identity import identity_cache
+from app.services.frame_cache import frame_cache
+from app.services.job_service import JobService
+from app.services.public_cache import public_dashboard_cache
+from app.services.query_stats import query_stats_writer
+from app.services.warmup import warm_up
+from app.services.widget_refresh import widget_cache
+from app.utils.compression import CompressionMiddleware
+from app.utils.http_cache import ETAG_HEADER, LAST_MODIFIED_HEADER
+from app.utils.metrics import METRICS_CONTENT_TYPE, register_cache, register_component, render_metrics
 from app.utils.middleware import register_exception_handlers
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.profiling import PROFILE_ID_HEADER, ProfilingMiddleware
+from app.utils.query_counter import QUERY_COUNT_HEADER, QUERY_TIME_HEADER, QueryCountMiddleware
+from app.utils.query_log import query_log
 from app.utils.settings import get_settings
 
 
@@ -21,9 +43,24 @@ logger = logging.getLogger("mini-bi")
 async def lifespan(_: FastAPI):
     settings = get_settings()
     logger.info("Starting app with database=%s", settings.database_url)
-    init_db()
+    ensure_schema()
+    with SessionLocal() as db:
+        interrupted = JobService(db).fail_interrupted()
+    if interrupted:
+        logger.warning("Marked %s interrupted AI jobs as failed", interrupted)
+    ollama_pool.start()
+    ai_run_writer.start()
+    background_queue.start()
+    query_stats_writer.start()
+    if settings.warmup_enabled:
+        background_queue.submit("warmup", warm_up)
     yield
     logger.info("Shutting down app")
+    await background_queue.stop()
+    await query_stats_writer.stop()
+    await ai_run_writer.stop()
+    await ollama_pool.stop()
+    await dispose_async_engine()
 
 
 app = FastAPI(title="Telegram Mini BI Platform", version="0.1.0", lifespan=lifespan)
@@ -34,12 +71,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        QUERY_COUNT_HEADER,
+        QUERY_TIME_HEADER,
+        NEXT_CURSOR_HEADER,
+        ETAG_HEADER,
+        LAST_MODIFIED_HEADER,
+        PROFILE_ID_HEADER,
+    ],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=get_settings().compression_min_bytes)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(QueryCountMiddleware)
 
 register_exception_handlers(app)
 app.include_router(router, prefix="/api")
 
+register_cache("identity", identity_cache.stats)
+register_cache("public_dashboard", public_dashboard_cache.stats)
+register_cache("widget_result", widget_cache.stats)
+register_cache("dataframe", frame_cache.stats)
+register_component("llm_scheduler", llm_scheduler.stats)
+register_component("llm_breaker", llm_breaker.stats)
+register_component("ai_run_writer", ai_run_writer.stats)
+register_component("query_log", query_log.stats)
+register_component("query_stats_writer", query_stats_writer.stats)
+register_component("dashboard_events", lambda: getattr(get_event_broker(), "stats", dict)())
+
 
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
+
+
+# Readiness for load balancers: 503 until the startup warm-up has finished, so traffic is
+# only routed to a worker once its hot datasets are in memory. /health stays a liveness probe.
+@app.get("/ready")
+async def ready() -> Response:
+    if background_queue.get("warmup") is not None:
+        return JSONResponse({"status": "warming"}, status_code=503)
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
@@ -1,3 +1,3 @@
-from app.models.entities import AIRun, Dashboard, DashboardComment, DashboardTeamShare, Dataset, Team, TeamMember, User
+from app.models.entities import AIJob, AIRun, Dashboard, DashboardComment, DashboardTeamShare, Dataset, Team, TeamMember, User
 
-__all__ = ["AIRun", "Dashboard", "DashboardComment", "DashboardTeamShare", "Dataset", "Team", "TeamMember", "User"]
+__all__ = ["AIJob", "AIRun", "Dashboard", "DashboardComment", "DashboardTeamShare", "Dataset", "Team", "TeamMember", "User"]
@@ -1,16 +1,128 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Callable, Generator
+from contextlib import asynccontextmanager
+from typing import Any, Protocol, TypeVar
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
+from app.utils.metrics import observe_stage
+from app.utils.query_counter import install_query_counter
 from app.utils.settings import get_settings
 
+T = TypeVar("T")
+
 settings = get_settings()
-engine = create_engine(settings.database_url, connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return _is_sqlite(url) and (":memory:" in url or url.rstrip("/").endswith("sqlite:"))
+
+
+def engine_options(url: str) -> dict:
+    options: dict[str, Any] = {}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if settings.storage_profile == "production":
+            # Python's sqlite3 waits 5s on a locked database by default; keep the driver and the pragma in step.
+            options["connect_args"]["timeout"] = settings.sqlite_busy_timeout_ms / 1000
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_s,
+            pool_recycle=settings.db_pool_recycle_s,
+            pool_pre_ping=not _is_sqlite(url),
+        )
+    return options
+
+
+def sqlite_pragmas() -> list[str]:
+    if settings.storage_profile != "production":
+        return []
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_mb * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def apply_storage_profile(target: Engine) -> None:
+    if target.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas()
+    if not pragmas:
+        return
+
+    @event.listens_for(target, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+# Times every commit as the db_commit pipeline stage.
+class TimedSession(Session):
+    def commit(self) -> None:
+        with observe_stage("db_commit"):
+            super().commit()
+
+
+engine = create_engine(settings.database_url, **engine_options(settings.database_url))
+apply_storage_profile(engine)
+install_query_counter(engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=TimedSession)
 Base = declarative_base()
 
 
+def async_database_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg://", 1)
+    return url
+
+
+async_engine = (
+    create_async_engine(async_database_url(settings.database_url), **engine_options(settings.database_url))
+    if settings.database_async
+    else None
+)
+if async_engine is not None:
+    apply_storage_profile(async_engine.sync_engine)
+    install_query_counter(async_engine.sync_engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False, sync_session_class=TimedSession)
+    if async_engine is not None
+    else None
+)
+
+
+class AsyncDB(Protocol):
+    async def run_sync(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T: ...
+
+
+class ThreadedSession:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
@@ -19,7 +131,24 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def init_db() -> None:
-    from app.models import entities  # noqa: F401
+@asynccontextmanager
+async def open_async_db() -> AsyncGenerator[AsyncDB, None]:
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        yield ThreadedSession(db)
+    finally:
+        await run_in_threadpool(db.close)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncDB, None]:
+    async with open_async_db() as db:
+        yield db
+
 
-    Base.metadata.create_all(bind=engine)
+async def dispose_async_engine() -> None:
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.database import Base
@@ -22,6 +22,7 @@ class User(Base):
 
 class Dataset(Base):
     __tablename__ = "datasets"
+    __table_args__ = (Index("ix_datasets_user_created", "user_id", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
@@ -40,6 +41,10 @@ class Dataset(Base):
 
 class Dashboard(Base):
     __tablename__ = "dashboards"
+    __table_args__ = (
+        Index("ix_dashboards_user_dataset", "user_id", "dataset_id"),
+        Index("ix_dashboards_user_updated", "user_id", "updated_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
@@ -59,6 +64,7 @@ class Dashboard(Base):
 
 class AIRun(Base):
     __tablename__ = "ai_runs"
+    __table_args__ = (Index("ix_ai_runs_dataset_type_created", "dataset_id", "run_type", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
@@ -66,6 +72,11 @@ class AIRun(Base):
     run_type: Mapped[str] = mapped_column(String(32), index=True)
     question: Mapped[str | None] = mapped_column(Text, nullable=True)
     response_json: Mapped[str] = mapped_column(Text)
+    # Copied out of response_json on save so history can list runs without loading payloads.
+    answer: Mapped[str | None] = mapped_column(Text, nullable=True)
+    pandas_query: Mapped[str | None] = mapped_column(Text, nullable=True)
+    chart_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    row_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
     error_log: Mapped[str | None] = mapped_column(Text, nullable=True)
     attempts: Mapped[int] = mapped_column(Integer, default=1)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -74,6 +85,23 @@ class AIRun(Base):
     dataset: Mapped["Dataset"] = relationship(back_populates="ai_runs")
 
 
+class AIJob(Base):
+    __tablename__ = "ai_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id"), index=True)
+    job_type: Mapped[str] = mapped_column(String(32))
+    status: Mapped[str] = mapped_column(String(16), default="queued", index=True)
+    request_json: Mapped[str] = mapped_column(Text, default="{}")
+    result_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    progress_done: Mapped[int] = mapped_column(Integer, default=0)
+    progress_total: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class Team(Base):
     __tablename__ = "teams"
 
@@ -82,12 +110,14 @@ class Team(Base):
     owner_user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    owner: Mapped["User"] = relationship(foreign_keys=[owner_user_id])
     members: Mapped[list["TeamMember"]] = relationship(back_populates="team")
     dashboard_shares: Mapped[list["DashboardTeamShare"]] = relationship(back_populates="team")
 
 
 class TeamMember(Base):
     __tablename__ = "team_members"
+    __table_args__ = (Index("ix_team_members_user_team", "user_id", "team_id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), index=True)
@@ -101,6 +131,7 @@ class TeamMember(Base):
 
 class DashboardTeamShare(Base):
     __tablename__ = "dashboard_team_shares"
+    __table_args__ = (Index("ix_dashboard_team_shares_team_dashboard", "team_id", "dashboard_id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     dashboard_id: Mapped[int] = mapped_column(ForeignKey("dashboards.id"), index=True)
@@ -114,6 +145,7 @@ class DashboardTeamShare(Base):
 
 class DashboardComment(Base):
     __tablename__ = "dashboard_comments"
+    __table_args__ = (Index("ix_dashboard_comments_dashboard_created", "dashboard_id", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     dashboard_id: Mapped[int] = mapped_column(ForeignKey("dashboards.id"), index=True)
@@ -123,3 +155,38 @@ class DashboardComment(Base):
 
     dashboard: Mapped["Dashboard"] = relationship(back_populates="comments")
     user: Mapped["User"] = relationship(back_populates="dashboard_comments")
+
+
+# Per-dataset access counters kept by the query log (app.utils.query_log). hotness is
+# log2(sum(2 ** (t / half-life))) over access times t: ordering by it ranks datasets by
+# recency-weighted frequency without rewriting rows as time passes.
+class DatasetUsage(Base):
+    __tablename__ = "dataset_usage"
+
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id"), primary_key=True)
+    access_count: Mapped[int] = mapped_column(Integer, default=0)
+    query_count: Mapped[int] = mapped_column(Integer, default=0)
+    query_ms: Mapped[float] = mapped_column(Float, default=0.0)
+    last_accessed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    hotness: Mapped[float | None] = mapped_column(Float, nullable=True, index=True)
+
+
+# One row per distinct pandas_query / chart aggregation run against a dataset, keyed like
+# widget results (spec_hash over pandas_query and chart_config).
+class QueryStatement(Base):
+    __tablename__ = "query_statements"
+    __table_args__ = (UniqueConstraint("dataset_id", "kind", "spec_hash", name="uq_query_statements_spec"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id"), index=True)
+    kind: Mapped[str] = mapped_column(String(16))
+    spec_hash: Mapped[str] = mapped_column(String(16))
+    pandas_query: Mapped[str | None] = mapped_column(Text, nullable=True)
+    chart_config_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    calls: Mapped[int] = mapped_column(Integer, default=0)
+    total_ms: Mapped[float] = mapped_column(Float, default=0.0)
+    max_ms: Mapped[float] = mapped_column(Float, default=0.0)
+    rows_in: Mapped[int] = mapped_column(Integer, default=0)
+    rows_out: Mapped[int] = mapped_column(Integer, default=0)
+    last_run_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    hotness: Mapped[float | None] = mapped_column(Float, nullable=True, index=True)
@@ -0,0 +1,129 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.database import Base, engine
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+version_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(128), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Engine], None]
+
+
+def _add_missing_columns(bind: Engine) -> None:
+    # create_all leaves existing tables alone; add nullable columns declared since they were created.
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                logger.warning("Cannot add non-nullable column %s.%s to an existing table", table.name, column.name)
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info("Added column %s.%s", table.name, column.name)
+
+
+def _create_schema(bind: Engine) -> None:
+    # Baseline. Databases from before versioned migrations were built by create_all on every
+    # boot; this brings them, or an empty database, up to the current models.
+    from app.models import entities  # noqa: F401
+
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(bind)
+    # create_all skips indexes on tables that already exist; add any declared since.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def _backfill_ai_run_metadata(bind: Engine) -> None:
+    from app.services.dataset_service import DatasetService
+
+    with Session(bind) as db:
+        filled = DatasetService(db).backfill_ai_run_metadata()
+    if filled:
+        logger.info("Backfilled history metadata for %s AI runs", filled)
+
+
+def _create_query_stats_tables(bind: Engine) -> None:
+    from app.models.entities import DatasetUsage, QueryStatement
+
+    Base.metadata.create_all(bind=bind, tables=[DatasetUsage.__table__, QueryStatement.__table__])
+
+
+# Append only. Migration 1 builds tables from the current models, so later migrations must
+# tolerate running on a schema that already has their change (check before altering).
+MIGRATIONS = [
+    Migration(1, "create schema", _create_schema),
+    Migration(2, "backfill ai_runs history metadata", _backfill_ai_run_metadata),
+    Migration(3, "create dataset_usage and query_statements", _create_query_stats_tables),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(bind: Engine = engine) -> int:
+    if not inspect(bind).has_table(schema_migrations.name):
+        return 0
+    with bind.connect() as conn:
+        return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def migrate(bind: Engine = engine) -> list[int]:
+    version_metadata.create_all(bind=bind)
+    version = current_version(bind)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        logger.info("Applying migration %s: %s", migration.version, migration.name)
+        migration.apply(bind)
+        with bind.begin() as conn:
+            conn.execute(
+                insert(schema_migrations).values(version=migration.version, name=migration.name, applied_at=datetime.utcnow())
+            )
+        applied.append(migration.version)
+    return applied
+
+
+# Called at startup. A migrated database costs one version lookup; otherwise the app migrates
+# itself when db_auto_migrate is on, or refuses to start so a deploy runs the migration step
+# (python -m app.models.migrations) once, before the workers.
+def ensure_schema(bind: Engine = engine) -> None:
+    version = current_version(bind)
+    if version >= LATEST_VERSION:
+        return
+    if not settings.db_auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {version}, expected {LATEST_VERSION}; run `python -m app.models.migrations`"
+        )
+    migrate(bind)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    applied = migrate()
+    logger.info("Schema at version %s (%s applied)", LATEST_VERSION, len(applied))
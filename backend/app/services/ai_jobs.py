@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+from collections.abc import Awaitable, Callable
+
+from starlette.concurrency import run_in_threadpool
+
+from app.ai.agents import AIAgentService
+from app.models.database import open_async_db
+from app.models.entities import AIJob
+from app.services.async_service import AsyncService
+from app.services.background import background_queue
+from app.services.dataset_service import DatasetService, load_dataframe
+from app.services.job_service import JobService
+from app.utils.middleware import AppException
+
+logger = logging.getLogger(__name__)
+
+
+def profile_job_key(dataset_id: int) -> str:
+    return f"profile:{dataset_id}"
+
+
+async def run_profile(dataset_service: AsyncService[DatasetService], dataset_id: int, telegram_id: int) -> dict:
+    dataset = await dataset_service.get_dataset(dataset_id)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
+    result = await ai_service.profile_dataset(dataset)
+
+    response = {
+        "summary": result["summary"],
+        "insights": result["insights"],
+        "suggested_visualizations": result["suggested_visualizations"],
+    }
+    if not result.get("fallback"):
+        await dataset_service.save_ai_run(
+            dataset=dataset,
+            telegram_id=telegram_id,
+            run_type="profile",
+            response=response,
+            attempts=result.get("attempts", 1),
+            error_log=result.get("error_log", []),
+        )
+    return response
+
+
+async def run_nl2dashboard(
+    dataset_service: AsyncService[DatasetService],
+    dataset_id: int,
+    telegram_id: int,
+    prompt: str,
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> dict:
+    dataset = await dataset_service.get_dataset(dataset_id)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
+    result = await ai_service.generate_dashboard(dataset=dataset, prompt_text=prompt, on_progress=on_progress)
+    if not result.get("fallback"):
+        await dataset_service.save_ai_run(
+            dataset=dataset,
+            telegram_id=telegram_id,
+            run_type="nl2dashboard",
+            response=result,
+            question=prompt,
+        )
+    return result
+
+
+async def _run_batch_item(coro: Awaitable[dict]) -> tuple[dict | None, str | None, int]:
+    try:
+        return await coro, None, 200
+    except AppException as exc:
+        return None, exc.message, exc.status_code
+    except Exception as exc:
+        logger.exception("batch item failed: %s", exc)
+        return None, "Internal server error", 500
+
+
+async def run_batch(
+    dataset_service: AsyncService[DatasetService], dataset_id: int, telegram_id: int, queries: list[str], comparisons: list[dict]
+) -> tuple[list[tuple[dict | None, str | None, int]], list[tuple[dict | None, str | None, int]]]:
+    dataset = await dataset_service.get_dataset(dataset_id, telegram_id)
+    df = await run_in_threadpool(load_dataframe, dataset)
+    ai_service = AIAgentService(dataset_service, telegram_id=telegram_id)
+
+    # Questions wait on the LLM scheduler and comparisons are pandas work; both run their pandas
+    # steps on the threadpool, so the comparisons overlap the model calls and the event loop
+    # stays free for other requests.
+    query_results, compare_results = await asyncio.gather(
+        asyncio.gather(*(_run_batch_item(ai_service.ask(dataset=dataset, question=question, df=df)) for question in queries)),
+        asyncio.gather(
+            *(_run_batch_item(ai_service.compare_periods(dataset=dataset, df=df, **comparison)) for comparison in comparisons)
+        ),
+    )
+
+    runs: list[dict] = []
+    query_responses = []
+    for question, (result, error, status_code) in zip(queries, query_results):
+        if result is None:
+            query_responses.append((None, error, status_code))
+            continue
+        response = {
+            "answer": result["answer"],
+            "pandas_query": result["pandas_query"],
+            "chart_config": result["chart_config"],
+            "chart_data": result["chart_data"],
+        }
+        query_responses.append((response, None, 200))
+        if not result.get("fallback"):
+            runs.append(
+                {
+                    "run_type": "query",
+                    "response": response,
+                    "question": question,
+                    "attempts": result.get("attempts", 1),
+                    "error_log": result.get("error_log", []),
+                }
+            )
+    for comparison, (result, _, _) in zip(comparisons, compare_results):
+        if result is not None:
+            question = f"compare:{comparison['period']}:{comparison['date_column']}:{comparison['value_column']}"
+            runs.append({"run_type": "compare", "response": result, "question": question})
+
+    await dataset_service.save_ai_runs(dataset, telegram_id, runs)
+    return query_responses, list(compare_results)
+
+
+async def _precompute_profile(dataset_id: int, telegram_id: int) -> dict:
+    async with open_async_db() as db:
+        return await run_profile(AsyncService(DatasetService, db), dataset_id, telegram_id)
+
+
+def schedule_profile(dataset_id: int, telegram_id: int) -> asyncio.Future | None:
+    if not background_queue.running:
+        return None
+    logger.info("Scheduling profile precompute dataset_id=%s", dataset_id)
+    return background_queue.submit(profile_job_key(dataset_id), lambda: _precompute_profile(dataset_id, telegram_id))
+
+
+def in_flight_profile(dataset_id: int) -> asyncio.Future | None:
+    return background_queue.get(profile_job_key(dataset_id))
+
+
+async def _execute_job(job_id: str, telegram_id: int) -> None:
+    async with open_async_db() as db:
+        job_service = AsyncService(JobService, db)
+        dataset_service = AsyncService(DatasetService, db)
+        job = await job_service.get_job(job_id)
+        request = json.loads(job.request_json)
+        await job_service.mark_running(job)
+
+        async def on_progress(done: int, total: int) -> None:
+            await job_service.update_progress(job, done, total)
+
+        try:
+            if job.job_type == "profile":
+                in_flight = in_flight_profile(job.dataset_id)
+                if in_flight is not None:
+                    result = await asyncio.shield(in_flight)
+                else:
+                    result = await run_profile(dataset_service, job.dataset_id, telegram_id)
+            elif job.job_type == "nl2dashboard":
+                result = await run_nl2dashboard(
+                    dataset_service,
+                    job.dataset_id,
+                    telegram_id,
+                    request["prompt"],
+                    on_progress=on_progress,
+                )
+            else:
+                raise AppException(f"Unknown job type: {job.job_type}", 400)
+        except Exception as exc:
+            await db.run_sync(lambda session: session.rollback())
+            await job_service.mark_failed(job, exc.message if isinstance(exc, AppException) else str(exc))
+            logger.warning("AI job %s (%s) failed: %s", job.id, job.job_type, exc)
+            return
+        await job_service.mark_succeeded(job, result)
+
+
+def submit_job(job: AIJob, telegram_id: int) -> None:
+    if not background_queue.running:
+        raise AppException("Background workers are not running", 503)
+    job_id = job.id
+    background_queue.submit(f"job:{job_id}", lambda: _execute_job(job_id, telegram_id))
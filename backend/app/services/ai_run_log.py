@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from app.models.database import open_async_db
+from app.models.entities import AIRun
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MAX_BACKOFF_S = 60.0
+
+
+def _insert_runs(session: Session, rows: list[dict]) -> None:
+    session.execute(insert(AIRun), rows)
+    session.commit()
+
+
+def _insert_runs_one_by_one(session: Session, rows: list[dict], rejected: list[dict]) -> None:
+    # Consumes rows from the front of the list as they are written or moved to rejected, so
+    # after a connection failure the caller re-queues only what is left.
+    while rows:
+        try:
+            session.execute(insert(AIRun), [rows[0]])
+            session.commit()
+        except (OperationalError, InterfaceError):
+            session.rollback()
+            raise
+        except Exception as exc:
+            session.rollback()
+            logger.error("Dropping AI run that cannot be saved (dataset=%s): %s", rows[0].get("dataset_id"), exc)
+            rejected.append(rows[0])
+        rows.pop(0)
+
+
+# Write-behind buffer for AIRun rows, flushed as one bulk insert per batch. enqueue() is called
+# from service code on worker threads or AsyncSession greenlets, hence the thread lock. Queued
+# and in-flight runs stay visible through pending() until their batch commits. A failed batch
+# is retried with exponential backoff; after max_retries failures it is written row by row so
+# a row the database rejects is logged and dropped instead of blocking every later run. While
+# the database is unreachable the buffer keeps at most max_buffered rows, dropping the oldest.
+class AIRunWriter:
+    def __init__(self, batch_size: int, flush_interval_s: float, max_buffered: int, max_retries: int) -> None:
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.max_buffered = max(self.batch_size, max_buffered)
+        self.max_retries = max(1, max_retries)
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._buffer: list[dict] = []
+        self._in_flight: list[dict] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.flushed = 0
+        self.batches = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping = True
+        assert self._wake is not None
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        self._loop = None
+
+    def enqueue(self, row: dict) -> None:
+        row.setdefault("created_at", datetime.utcnow())
+        with self._lock:
+            self._buffer.append(row)
+            self._trim()
+            full = len(self._buffer) >= self.batch_size
+        # While flushes are failing the writer backs off instead of being woken by a full batch.
+        if full and not self._failures and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _trim(self) -> None:
+        # Caller holds the lock.
+        overflow = len(self._buffer) + len(self._in_flight) - self.max_buffered
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+            logger.error("AI run buffer full, dropped %s oldest runs", overflow)
+
+    def pending(self, dataset_id: int) -> list[AIRun]:
+        with self._lock:
+            rows = [row for row in self._in_flight + self._buffer if row["dataset_id"] == dataset_id]
+        return [AIRun(**row) for row in reversed(rows)]
+
+    def has_pending(self, dataset_id: int) -> bool:
+        with self._lock:
+            return any(row["dataset_id"] == dataset_id for row in self._in_flight + self._buffer)
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            return 0
+        async with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                self._in_flight, self._buffer = self._buffer, []
+                batch = self._in_flight
+            remaining = list(batch)
+            rejected: list[dict] = []
+            failed = False
+            try:
+                async with open_async_db() as db:
+                    if self._failures < self.max_retries:
+                        await db.run_sync(_insert_runs, remaining)
+                        remaining = []
+                    else:
+                        await db.run_sync(_insert_runs_one_by_one, remaining, rejected)
+            except Exception as exc:
+                failed = True
+                self._failures += 1
+                logger.warning(
+                    "AI run flush of %s rows failed (attempt %s), will retry: %s", len(remaining), self._failures, exc
+                )
+            with self._lock:
+                self._in_flight = []
+                if failed:
+                    self._buffer[:0] = remaining
+                    self._trim()
+            written = len(batch) - len(remaining) - len(rejected)
+            self.dropped += len(rejected)
+            self.flushed += written
+            if failed:
+                return written
+            self._failures = 0
+            self.batches += 1
+            return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = len(self._buffer) + len(self._in_flight)
+        return {"queued": queued, "flushed": self.flushed, "batches": self.batches, "dropped": self.dropped}
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while not self._stopping:
+            timeout = min(self.flush_interval_s * 2**self._failures, MAX_BACKOFF_S)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+ai_run_writer = AIRunWriter(
+    settings.ai_run_batch_size, settings.ai_run_flush_interval_s, settings.ai_run_max_buffered, settings.ai_run_max_retries
+)
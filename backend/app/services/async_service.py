@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any, Generic, TypeVar
+
+from sqlalchemy.orm import Session
+
+from app.models.database import AsyncDB
+
+ServiceT = TypeVar("ServiceT")
+R = TypeVar("R")
+
+
+# Awaitable facade over a synchronous service: each call runs inside db.run_sync, i.e. on the
+# aiosqlite/asyncpg engine when DATABASE_ASYNC is enabled and on a worker thread otherwise.
+# Every call ends its transaction so no pooled connection is held across an LLM await.
+# Calls are serialised because a session must not be used by two tasks at once, which
+# happens when one service is shared by concurrently gathered coroutines.
+class AsyncService(Generic[ServiceT]):
+    def __init__(self, service_cls: Callable[[Session], ServiceT], db: AsyncDB) -> None:
+        self.service_cls = service_cls
+        self.db = db
+        self._lock = asyncio.Lock()
+
+    async def run(self, fn: Callable[[ServiceT], R]) -> R:
+        def call(session: Session) -> R:
+            try:
+                result = fn(self.service_cls(session))
+            except Exception:
+                session.rollback()
+                raise
+            session.commit()
+            return result
+
+        async with self._lock:
+            return await self.db.run_sync(call)
+
+    def __getattr__(self, name: str) -> Callable[..., Awaitable[Any]]:
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return await self.run(lambda service: getattr(service, name)(*args, **kwargs))
+
+        return call
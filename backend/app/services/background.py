@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class BackgroundTaskQueue:
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._jobs: dict[str, asyncio.Future] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        for future in self._jobs.values():
+            future.cancel()
+        self._worker_tasks = []
+        self._jobs = {}
+        self._queue = None
+
+    def submit(self, key: str, func: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        if self._queue is None:
+            raise RuntimeError("Background task queue is not running")
+        existing = self._jobs.get(key)
+        if existing is not None and not existing.done():
+            return existing
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._jobs[key] = future
+        self._queue.put_nowait((key, func, future))
+        return future
+
+    def get(self, key: str) -> asyncio.Future | None:
+        future = self._jobs.get(key)
+        if future is None or future.done():
+            return None
+        return future
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            key, func, future = await self._queue.get()
+            try:
+                if not future.done():
+                    future.set_result(await func())
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as exc:
+                logger.warning("background task %s failed: %s", key, exc)
+                if not future.done():
+                    future.set_exception(exc)
+            finally:
+                if self._jobs.get(key) is future:
+                    del self._jobs[key]
+                self._queue.task_done()
+
+
+background_queue = BackgroundTaskQueue(settings.background_workers)
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Protocol
+from uuid import uuid4
+
+from app.utils.settings import get_settings
+
+settings = get_settings()
+
+RESYNC_EVENT = "resync"
+
+
+@dataclass(frozen=True)
+class DashboardEvent:
+    id: str
+    dashboard_id: int
+    type: str
+    data: dict = field(default_factory=dict)
+
+
+def _last_sequence(event_id: str | None) -> int | None:
+    raw = (event_id or "").rpartition("-")[2]
+    return int(raw) if raw.isdigit() else None
+
+
+def _event_sequence(event: DashboardEvent) -> int:
+    return _last_sequence(event.id) or 0
+
+
+class Subscription:
+    def __init__(self, pending: list[DashboardEvent], queue: asyncio.Queue, sequence: int) -> None:
+        self._pending = deque(pending)
+        self._queue = queue
+        self._sequence = sequence
+
+    async def get(self, timeout: float) -> DashboardEvent | None:
+        if self._pending:
+            return self._pending.popleft()
+        while True:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            # Events published between registering and snapshotting the history arrive both
+            # as replay and on the queue; drop the queued copy.
+            if _event_sequence(event) > self._sequence:
+                self._sequence = _event_sequence(event)
+                return event
+
+
+class EventBroker(Protocol):
+    def publish(self, dashboard_id: int, event_type: str, data: dict) -> DashboardEvent: ...
+
+    def subscribe(self, dashboard_id: int, last_event_id: str | None = None) -> AbstractAsyncContextManager[Subscription]: ...
+
+
+# Single-process broker. Event ids are "<broker epoch>-<sequence>"; a client reconnecting with
+# Last-Event-ID gets the retained events after that id, or one resync event when the id is from
+# another process or older than the retained history, telling it to refetch the dashboard.
+# publish() is called from service code on worker threads, so delivery goes through
+# call_soon_threadsafe on each subscriber's loop.
+class InMemoryBroker:
+    def __init__(self, history_size: int) -> None:
+        self.history_size = max(1, history_size)
+        self.epoch = uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._sequence: dict[int, int] = {}
+        self._history: dict[int, deque[DashboardEvent]] = {}
+        self._subscribers: dict[int, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def publish(self, dashboard_id: int, event_type: str, data: dict) -> DashboardEvent:
+        with self._lock:
+            sequence = self._sequence.get(dashboard_id, 0) + 1
+            self._sequence[dashboard_id] = sequence
+            event = DashboardEvent(f"{self.epoch}-{sequence}", dashboard_id, event_type, data)
+            self._history.setdefault(dashboard_id, deque(maxlen=self.history_size)).append(event)
+            subscribers = list(self._subscribers.get(dashboard_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        return event
+
+    def _missed(self, dashboard_id: int, last_event_id: str | None) -> list[DashboardEvent] | None:
+        if last_event_id is None:
+            return []
+        epoch, _, raw_sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not raw_sequence.isdigit():
+            return None
+        last_sequence = int(raw_sequence)
+        history = self._history.get(dashboard_id, ())
+        missed = [event for event in history if _event_sequence(event) > last_sequence]
+        if missed and _event_sequence(missed[0]) != last_sequence + 1:
+            return None
+        return missed
+
+    @asynccontextmanager
+    async def subscribe(self, dashboard_id: int, last_event_id: str | None = None) -> AsyncIterator[Subscription]:
+        queue: asyncio.Queue[DashboardEvent] = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(dashboard_id, set()).add(subscriber)
+            missed = self._missed(dashboard_id, last_event_id)
+            sequence = self._sequence.get(dashboard_id, 0)
+        if missed is None:
+            pending = [DashboardEvent(f"{self.epoch}-{sequence}", dashboard_id, RESYNC_EVENT)]
+        else:
+            pending = missed
+            sequence = _event_sequence(missed[-1]) if missed else (_last_sequence(last_event_id) or 0)
+        try:
+            yield Subscription(pending, queue, sequence)
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(dashboard_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[dashboard_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "channels": len(self._history),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            }
+
+
+# Multi-worker deployments replace this with a broker-backed EventBroker (e.g. Redis pub/sub
+# plus a capped stream for replay) via set_event_broker() at startup.
+_broker: EventBroker = InMemoryBroker(settings.dashboard_event_history)
+
+
+def get_event_broker() -> EventBroker:
+    return _broker
+
+
+def set_event_broker(broker: EventBroker) -> None:
+    global _broker
+    _broker = broker
+
+
+def publish_dashboard_event(dashboard_id: int, event_type: str, data: dict) -> DashboardEvent:
+    return _broker.publish(dashboard_id, event_type, data)
@@ -1,136 +1,233 @@
 import json
 import secrets
+from dataclasses import dataclass
+from datetime import datetime
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session, joinedload
 
 from app.models.entities import Dashboard, DashboardComment, DashboardTeamShare, Dataset, TeamMember, User
+from app.services.dashboard_events import publish_dashboard_event
+from app.services.identity import identity_cache, resolve_user_id
+from app.services.public_cache import public_dashboard_cache
+from app.utils.chart_format import dumps_compact
 from app.utils.middleware import AppException
+from app.utils.pagination import DEFAULT_PAGE_SIZE, paginate
+from app.utils.safe_query import SafeQueryError, validate_query_expression
+
+TEAM_EDIT_ROLES = ("owner", "editor")
+
+
+def _validate_widget_queries(config: dict, dataset: Dataset) -> None:
+    # Saved pandas_query strings are run again on every refresh, so they get the same check
+    # as queries coming from the LLM before they are stored.
+    widgets = config.get("widgets") if isinstance(config, dict) else None
+    if not isinstance(widgets, list):
+        return
+    columns = [column["name"] for column in json.loads(dataset.schema_json)]
+    for index, widget in enumerate(widgets):
+        if not isinstance(widget, dict) or widget.get("pandas_query") is None:
+            continue
+        query = widget["pandas_query"]
+        if not isinstance(query, str):
+            raise AppException(f"Widget {widget.get('id', index)} has an invalid pandas_query", 400)
+        if not query:
+            continue
+        try:
+            validate_query_expression(query, columns)
+        except SafeQueryError as exc:
+            raise AppException(f"Widget {widget.get('id', index)} has an invalid pandas_query: {exc}", 400) from exc
+
+
+@dataclass
+class DashboardAccess:
+    dashboard: Dashboard
+    user: User
+    permission: str  # owner | editor | viewer
 
 
 class DashboardService:
     def __init__(self, db: Session):
         self.db = db
+        # Lives on the session, so it is shared by every service call made for one request.
+        self._access_memo: dict[tuple[int, int], DashboardAccess | None] = db.info.setdefault("dashboard_access", {})
 
-    def _get_user(self, telegram_id: int) -> User:
-        user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
+    def _get_user_id(self, telegram_id: int) -> int:
+        user_id = resolve_user_id(self.db, telegram_id, create=False)
+        if user_id is None:
             raise AppException("User not found", 404)
-        return user
+        return user_id
 
-    def _user_team_ids(self, user_id: int) -> list[int]:
-        rows = self.db.query(TeamMember.team_id).filter(TeamMember.user_id == user_id).all()
-        return [r[0] for r in rows]
+    def resolve_access(self, telegram_id: int, dashboard_id: int) -> DashboardAccess | None:
+        key = (telegram_id, dashboard_id)
+        if key in self._access_memo:
+            return self._access_memo[key]
 
-    def _has_team_edit(self, user_id: int, dashboard_id: int) -> bool:
-        membership = (
-            self.db.query(TeamMember)
-            .join(DashboardTeamShare, DashboardTeamShare.team_id == TeamMember.team_id)
-            .filter(
-                DashboardTeamShare.dashboard_id == dashboard_id,
-                TeamMember.user_id == user_id,
-                TeamMember.role.in_(["owner", "editor"]),
-                DashboardTeamShare.permission == "editor",
+        team_level = (
+            select(
+                func.max(
+                    case(
+                        (and_(DashboardTeamShare.permission == "editor", TeamMember.role.in_(TEAM_EDIT_ROLES)), 2),
+                        else_=1,
+                    )
+                )
             )
-            .first()
+            .join(TeamMember, TeamMember.team_id == DashboardTeamShare.team_id)
+            .where(DashboardTeamShare.dashboard_id == Dashboard.id, TeamMember.user_id == User.id)
+            .correlate(Dashboard, User)
+            .scalar_subquery()
         )
-        return membership is not None
-
-    def _can_access_dashboard(self, user_id: int, dashboard_id: int) -> bool:
-        own = self.db.query(Dashboard).filter(Dashboard.id == dashboard_id, Dashboard.user_id == user_id).first()
-        if own:
-            return True
-        team_ids = self._user_team_ids(user_id)
-        if not team_ids:
-            return False
-        shared = (
-            self.db.query(DashboardTeamShare)
-            .filter(DashboardTeamShare.dashboard_id == dashboard_id, DashboardTeamShare.team_id.in_(team_ids))
-            .first()
+        row = self.db.execute(
+            select(User, Dashboard, team_level)
+            .select_from(User)
+            .outerjoin(Dashboard, Dashboard.id == dashboard_id)
+            .where(User.telegram_id == telegram_id)
+        ).first()
+        if row is None:
+            raise AppException("User not found", 404)
+
+        user, dashboard, level = row
+        identity_cache.put(telegram_id, user.id)
+        access = None
+        if dashboard is not None:
+            if dashboard.user_id == user.id:
+                access = DashboardAccess(dashboard, user, "owner")
+            elif level:
+                access = DashboardAccess(dashboard, user, "editor" if level == 2 else "viewer")
+        self._access_memo[key] = access
+        return access
+
+    def _require_access(self, telegram_id: int, dashboard_id: int) -> DashboardAccess:
+        access = self.resolve_access(telegram_id, dashboard_id)
+        if access is None:
+            raise AppException("Dashboard not found", 404)
+        return access
+
+    def _publish_update(self, dashboard: Dashboard, config: dict) -> None:
+        publish_dashboard_event(
+            dashboard.id,
+            "dashboard.updated",
+            {
+                "id": dashboard.id,
+                "title": dashboard.title,
+                "dataset_id": dashboard.dataset_id,
+                "config": config,
+                "updated_at": dashboard.updated_at.isoformat(),
+            },
         )
-        return shared is not None
 
     def save_dashboard(self, telegram_id: int, dataset_id: int, title: str, config: dict, dashboard_id: int | None = None) -> Dashboard:
-        user = self._get_user(telegram_id)
-        dataset = self.db.query(Dataset).filter(Dataset.id == dataset_id, Dataset.user_id == user.id).first()
+        user_id = self._get_user_id(telegram_id)
+        dataset = self.db.query(Dataset).filter(Dataset.id == dataset_id, Dataset.user_id == user_id).first()
         if not dataset:
             raise AppException("Dataset not found", 404)
 
         if dashboard_id:
-            dashboard = self.db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-            if not dashboard:
-                raise AppException("Dashboard not found", 404)
-            if dashboard.user_id != user.id and not self._has_team_edit(user.id, dashboard_id):
+            access = self.resolve_access(telegram_id, dashboard_id)
+            if access is None:
+                if self.db.get(Dashboard, dashboard_id) is None:
+                    raise AppException("Dashboard not found", 404)
+                raise AppException("No permission to edit dashboard", 403)
+            if access.permission not in TEAM_EDIT_ROLES:
                 raise AppException("No permission to edit dashboard", 403)
+            dashboard = access.dashboard
+            if dashboard.dataset_id != dataset.id:
+                dataset = self.db.get(Dataset, dashboard.dataset_id) or dataset
+            _validate_widget_queries(config, dataset)
             dashboard.title = title
-            dashboard.config_json = json.dumps(config)
+            dashboard.config_json = dumps_compact(config)
         else:
+            _validate_widget_queries(config, dataset)
             dashboard = Dashboard(
-                user_id=user.id,
+                user_id=user_id,
                 dataset_id=dataset_id,
                 title=title,
-                config_json=json.dumps(config),
+                config_json=dumps_compact(config),
             )
             self.db.add(dashboard)
 
         self.db.commit()
         self.db.refresh(dashboard)
+        if dashboard.share_token:
+            public_dashboard_cache.invalidate(dashboard.share_token)
+        self._publish_update(dashboard, config)
         return dashboard
 
-    def list_dashboards(self, telegram_id: int, dataset_id: int | None = None) -> list[Dashboard]:
-        user = self._get_user(telegram_id)
-        own_query = self.db.query(Dashboard).filter(Dashboard.user_id == user.id)
-        if dataset_id is not None:
-            own_query = own_query.filter(Dashboard.dataset_id == dataset_id)
-        own_dashboards = own_query.all()
-
-        team_ids = self._user_team_ids(user.id)
-        if not team_ids:
-            return sorted(own_dashboards, key=lambda d: d.updated_at, reverse=True)
-
-        shared_query = (
-            self.db.query(Dashboard)
-            .join(DashboardTeamShare, DashboardTeamShare.dashboard_id == Dashboard.id)
-            .filter(DashboardTeamShare.team_id.in_(team_ids), Dashboard.user_id != user.id)
+    def list_dashboards(
+        self,
+        telegram_id: int,
+        dataset_id: int | None = None,
+        cursor: str | None = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> tuple[list[Dashboard], str | None]:
+        user_id = self._get_user_id(telegram_id)
+        shared_ids = (
+            select(DashboardTeamShare.dashboard_id)
+            .join(TeamMember, TeamMember.team_id == DashboardTeamShare.team_id)
+            .where(TeamMember.user_id == user_id)
         )
+        query = self.db.query(Dashboard).filter(or_(Dashboard.user_id == user_id, Dashboard.id.in_(shared_ids)))
         if dataset_id is not None:
-            shared_query = shared_query.filter(Dashboard.dataset_id == dataset_id)
+            query = query.filter(Dashboard.dataset_id == dataset_id)
+        return paginate(query, Dashboard.updated_at, Dashboard.id, cursor, limit)
 
-        all_dashboards = {d.id: d for d in own_dashboards}
-        for d in shared_query.all():
-            all_dashboards[d.id] = d
+    def get_dashboard(self, telegram_id: int, dashboard_id: int) -> Dashboard:
+        return self._require_access(telegram_id, dashboard_id).dashboard
 
-        return sorted(all_dashboards.values(), key=lambda d: d.updated_at, reverse=True)
+    def get_refresh_target(self, telegram_id: int, dashboard_id: int) -> tuple[Dashboard, Dataset, bool]:
+        access = self._require_access(telegram_id, dashboard_id)
+        dataset = self.db.get(Dataset, access.dashboard.dataset_id)
+        if not dataset:
+            raise AppException("Dataset not found", 404)
+        return access.dashboard, dataset, access.permission in TEAM_EDIT_ROLES
 
-    def get_dashboard(self, telegram_id: int, dashboard_id: int) -> Dashboard:
-        user = self._get_user(telegram_id)
-        if not self._can_access_dashboard(user.id, dashboard_id):
-            raise AppException("Dashboard not found", 404)
-        dashboard = self.db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-        if not dashboard:
-            raise AppException("Dashboard not found", 404)
+    def apply_refresh(self, telegram_id: int, dashboard_id: int, loaded_at: datetime, config: dict) -> Dashboard:
+        # Persisting refreshed chart data needs edit access, and never overwrites a save that
+        # landed while the widgets were being recomputed.
+        access = self._require_access(telegram_id, dashboard_id)
+        if access.permission not in TEAM_EDIT_ROLES:
+            raise AppException("No permission to edit dashboard", 403)
+        dashboard = access.dashboard
+        result = self.db.execute(
+            update(Dashboard)
+            .where(Dashboard.id == dashboard_id, Dashboard.updated_at == loaded_at)
+            .values(config_json=dumps_compact(config), updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            self.db.rollback()
+            raise AppException("Dashboard changed during refresh, retry", 409)
+        self.db.commit()
+        self.db.refresh(dashboard)
+        if dashboard.share_token:
+            public_dashboard_cache.invalidate(dashboard.share_token)
+        self._publish_update(dashboard, config)
         return dashboard
 
     def share_dashboard(self, telegram_id: int, dashboard_id: int) -> Dashboard:
-        dashboard = self.get_dashboard(telegram_id, dashboard_id)
-        user = self._get_user(telegram_id)
-        if dashboard.user_id != user.id:
+        access = self._require_access(telegram_id, dashboard_id)
+        if access.permission != "owner":
             raise AppException("Only owner can create public link", 403)
+        dashboard = access.dashboard
+        previous_token = dashboard.share_token
         dashboard.share_token = secrets.token_urlsafe(24)
         dashboard.is_public = True
         self.db.commit()
         self.db.refresh(dashboard)
+        public_dashboard_cache.invalidate(previous_token)
         return dashboard
 
     def share_dashboard_to_team(self, telegram_id: int, dashboard_id: int, team_id: int, permission: str) -> DashboardTeamShare:
-        user = self._get_user(telegram_id)
-        dashboard = self.db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-        if not dashboard:
-            raise AppException("Dashboard not found", 404)
-        if dashboard.user_id != user.id:
+        access = self.resolve_access(telegram_id, dashboard_id)
+        if access is None:
+            if self.db.get(Dashboard, dashboard_id) is None:
+                raise AppException("Dashboard not found", 404)
+            raise AppException("Only owner can share dashboard to team", 403)
+        if access.permission != "owner":
             raise AppException("Only owner can share dashboard to team", 403)
         team_access = (
             self.db.query(TeamMember)
-            .filter(TeamMember.team_id == team_id, TeamMember.user_id == user.id, TeamMember.role.in_(["owner", "editor"]))
+            .filter(TeamMember.team_id == team_id, TeamMember.user_id == access.user.id, TeamMember.role.in_(TEAM_EDIT_ROLES))
             .first()
         )
         if not team_access:
@@ -141,6 +238,7 @@ class DashboardService:
             .filter(DashboardTeamShare.dashboard_id == dashboard_id, DashboardTeamShare.team_id == team_id)
             .first()
         )
+        self._access_memo.clear()
         if exists:
             exists.permission = permission
             self.db.commit()
@@ -153,25 +251,36 @@ class DashboardService:
         self.db.refresh(share)
         return share
 
-    def list_comments(self, telegram_id: int, dashboard_id: int) -> list[DashboardComment]:
-        user = self._get_user(telegram_id)
-        if not self._can_access_dashboard(user.id, dashboard_id):
-            raise AppException("Dashboard not found", 404)
-        return (
+    def list_comments(
+        self, telegram_id: int, dashboard_id: int, cursor: str | None = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> tuple[list[DashboardComment], str | None]:
+        self._require_access(telegram_id, dashboard_id)
+        query = (
             self.db.query(DashboardComment)
+            .options(joinedload(DashboardComment.user))
             .filter(DashboardComment.dashboard_id == dashboard_id)
-            .order_by(DashboardComment.created_at.asc())
-            .all()
         )
+        comments, next_cursor = paginate(query, DashboardComment.created_at, DashboardComment.id, cursor, limit)
+        # Pages walk back from the newest comment; each page is still returned oldest first.
+        comments.reverse()
+        return comments, next_cursor
 
     def add_comment(self, telegram_id: int, dashboard_id: int, text: str) -> DashboardComment:
-        user = self._get_user(telegram_id)
-        if not self._can_access_dashboard(user.id, dashboard_id):
-            raise AppException("Dashboard not found", 404)
-        comment = DashboardComment(dashboard_id=dashboard_id, user_id=user.id, text=text)
+        access = self._require_access(telegram_id, dashboard_id)
+        comment = DashboardComment(dashboard_id=dashboard_id, user=access.user, text=text)
         self.db.add(comment)
         self.db.commit()
-        self.db.refresh(comment)
+        publish_dashboard_event(
+            dashboard_id,
+            "comment.created",
+            {
+                "id": comment.id,
+                "dashboard_id": dashboard_id,
+                "user_telegram_id": access.user.telegram_id,
+                "text": comment.text,
+                "created_at": comment.created_at.isoformat(),
+            },
+        )
         return comment
 
     def get_public_dashboard(self, token: str) -> Dashboard:
@@ -1,114 +1,176 @@
 import json
 import logging
 from pathlib import Path
+from typing import TYPE_CHECKING
 from uuid import uuid4
 
-import pandas as pd
-from fastapi import UploadFile
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session, load_only
 
-from app.models.entities import AIRun, Dataset, User
+from app.models.entities import AIRun, Dataset
+from app.services.ai_run_log import ai_run_writer
+from app.services.frame_cache import frame_cache
+from app.services.identity import resolve_user_id
+from app.utils.chart_format import dumps_compact, loads_compact
+from app.utils.metrics import DATASET_BYTES, DATASET_ROWS, current_run_type, observe_stage
 from app.utils.middleware import AppException
+from app.utils.pagination import DEFAULT_PAGE_SIZE, paginate
+from app.utils.query_log import query_log
 from app.utils.settings import get_settings
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+DEFAULT_ANSWER = "Analysis complete."
 
-class DatasetService:
-    def __init__(self, db: Session):
-        self.db = db
 
-    def get_or_create_user(self, telegram_id: int) -> User:
-        user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
-        if user:
-            return user
-        user = User(telegram_id=telegram_id)
-        self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
-        return user
+def prepare_upload(filename: str | None, payload: bytes) -> dict:
+    import pandas as pd
+
+    if not filename or not filename.lower().endswith(".csv"):
+        raise AppException("Only CSV files are allowed", 400)
+
+    max_size = settings.max_file_size_mb * 1024 * 1024
+    if len(payload) > max_size:
+        raise AppException(f"File exceeds {settings.max_file_size_mb}MB", 400)
+
+    upload_dir = Path(settings.upload_dir)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    safe_name = f"{uuid4().hex}_{Path(filename).name}"
+    file_path = upload_dir / safe_name
+    file_path.write_bytes(payload)
+
+    try:
+        df = pd.read_csv(file_path)
+    except Exception as exc:
+        file_path.unlink(missing_ok=True)
+        raise AppException(f"Invalid CSV file: {exc}", 400) from exc
+
+    if len(df) > settings.max_rows:
+        raise AppException(f"CSV row limit exceeded ({settings.max_rows})", 400)
+
+    for col in df.columns:
+        if df[col].dtype == "object":
+            parsed = pd.to_datetime(df[col], errors="coerce", utc=False)
+            if parsed.notna().sum() > max(5, len(df) * 0.5):
+                df[col] = parsed
+
+    schema = []
+    for col in df.columns:
+        schema.append(
+            {
+                "name": str(col),
+                "dtype": str(df[col].dtype),
+                "missing": int(df[col].isna().sum()),
+                "unique": int(df[col].nunique(dropna=True)),
+            }
+        )
+
+    sample = json.loads(df.head(20).fillna("").to_json(orient="records", date_format="iso"))
+
+    return {
+        "name": filename,
+        "file_path": str(file_path),
+        "row_count": int(len(df)),
+        "column_count": int(len(df.columns)),
+        "schema_json": json.dumps(schema),
+        "sample_json": json.dumps(sample),
+    }
 
-    async def upload_csv(self, telegram_id: int, file: UploadFile) -> Dataset:
-        if not file.filename or not file.filename.lower().endswith(".csv"):
-            raise AppException("Only CSV files are allowed", 400)
 
-        payload = await file.read()
-        max_size = settings.max_file_size_mb * 1024 * 1024
-        if len(payload) > max_size:
-            raise AppException(f"File exceeds {settings.max_file_size_mb}MB", 400)
+def ai_run_metadata(response: dict) -> dict:
+    answer = response.get("answer", response.get("summary", response.get("explanation")))
+    chart_config = response.get("chart_config")
+    chart_data = response.get("chart_data")
+    return {
+        "answer": str(answer) if answer is not None else None,
+        "pandas_query": response.get("pandas_query"),
+        "chart_type": chart_config.get("type") if isinstance(chart_config, dict) else None,
+        "row_count": len(chart_data) if isinstance(chart_data, list) else None,
+    }
 
-        upload_dir = Path(settings.upload_dir)
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        safe_name = f"{uuid4().hex}_{Path(file.filename).name}"
-        file_path = upload_dir / safe_name
-        file_path.write_bytes(payload)
 
+def load_dataframe(dataset: Dataset) -> "pd.DataFrame":
+    import pandas as pd
+
+    query_log.record_access(dataset.id)
+    with observe_stage("load_dataframe"):
+        df = frame_cache.get(dataset.id, dataset.file_path)
+        if df is not None:
+            return df
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(dataset.file_path)
         except Exception as exc:
-            file_path.unlink(missing_ok=True)
-            raise AppException(f"Invalid CSV file: {exc}", 400) from exc
-
-        if len(df) > settings.max_rows:
-            raise AppException(f"CSV row limit exceeded ({settings.max_rows})", 400)
-
-        for col in df.columns:
-            if df[col].dtype == "object":
-                parsed = pd.to_datetime(df[col], errors="coerce", utc=False)
-                if parsed.notna().sum() > max(5, len(df) * 0.5):
-                    df[col] = parsed
-
-        schema = []
-        for col in df.columns:
-            schema.append(
-                {
-                    "name": str(col),
-                    "dtype": str(df[col].dtype),
-                    "missing": int(df[col].isna().sum()),
-                    "unique": int(df[col].nunique(dropna=True)),
-                }
-            )
+            raise AppException(f"Failed to load dataset: {exc}", 500) from exc
+    # Carried through query and aggregation results, so the query log knows the dataset.
+    df.attrs["dataset_id"] = dataset.id
+    frame_cache.put(dataset.id, dataset.file_path, df)
+    run_type = current_run_type()
+    DATASET_BYTES.labels(run_type).inc(Path(dataset.file_path).stat().st_size)
+    DATASET_ROWS.labels(run_type).inc(len(df))
+    return df
 
-        sample = json.loads(df.head(20).fillna("").to_json(orient="records", date_format="iso"))
-
-        user = self.get_or_create_user(telegram_id)
-        dataset = Dataset(
-            user_id=user.id,
-            name=file.filename,
-            file_path=str(file_path),
-            row_count=int(len(df)),
-            column_count=int(len(df.columns)),
-            schema_json=json.dumps(schema),
-            sample_json=json.dumps(sample),
-        )
+
+class DatasetService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_user_id(self, telegram_id: int) -> int:
+        return resolve_user_id(self.db, telegram_id)
+
+    def create_dataset(self, telegram_id: int, upload: dict) -> Dataset:
+        dataset = Dataset(user_id=self.get_user_id(telegram_id), **upload)
         self.db.add(dataset)
         self.db.commit()
         self.db.refresh(dataset)
         logger.info("Dataset uploaded id=%s telegram_id=%s", dataset.id, telegram_id)
         return dataset
 
-    def list_datasets(self, telegram_id: int) -> list[Dataset]:
-        user = self.get_or_create_user(telegram_id)
-        return (
-            self.db.query(Dataset)
-            .filter(Dataset.user_id == user.id)
-            .order_by(Dataset.created_at.desc())
-            .all()
-        )
+    def upload_csv(self, telegram_id: int, filename: str | None, payload: bytes) -> Dataset:
+        return self.create_dataset(telegram_id, prepare_upload(filename, payload))
+
+    def list_datasets(
+        self, telegram_id: int, cursor: str | None = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> tuple[list[Dataset], str | None]:
+        query = self.db.query(Dataset).filter(Dataset.user_id == self.get_user_id(telegram_id))
+        return paginate(query, Dataset.created_at, Dataset.id, cursor, limit)
 
     def get_dataset(self, dataset_id: int, telegram_id: int | None = None) -> Dataset:
         query = self.db.query(Dataset).filter(Dataset.id == dataset_id)
         if telegram_id is not None:
-            user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
-            if not user:
+            user_id = resolve_user_id(self.db, telegram_id, create=False)
+            if user_id is None:
                 raise AppException("User not found", 404)
-            query = query.filter(Dataset.user_id == user.id)
+            query = query.filter(Dataset.user_id == user_id)
         dataset = query.first()
         if not dataset:
             raise AppException("Dataset not found", 404)
         return dataset
 
+    def _ai_run_row(
+        self,
+        dataset: Dataset,
+        telegram_id: int,
+        run_type: str,
+        response: dict,
+        question: str | None = None,
+        error_log: list[str] | None = None,
+        attempts: int = 1,
+    ) -> dict:
+        return {
+            "user_id": self.get_user_id(telegram_id),
+            "dataset_id": dataset.id,
+            "run_type": run_type,
+            "question": question,
+            "response_json": dumps_compact(response),
+            **ai_run_metadata(response),
+            "error_log": json.dumps(error_log or []),
+            "attempts": attempts,
+        }
+
     def save_ai_run(
         self,
         dataset: Dataset,
@@ -118,57 +180,134 @@ class DatasetService:
         question: str | None = None,
         error_log: list[str] | None = None,
         attempts: int = 1,
-    ) -> AIRun:
-        user = self.get_or_create_user(telegram_id)
-        run = AIRun(
-            user_id=user.id,
-            dataset_id=dataset.id,
-            run_type=run_type,
-            question=question,
-            response_json=json.dumps(response),
-            error_log=json.dumps(error_log or []),
-            attempts=attempts,
-        )
-        self.db.add(run)
+    ) -> None:
+        row = self._ai_run_row(dataset, telegram_id, run_type, response, question, error_log, attempts)
+        if ai_run_writer.running:
+            ai_run_writer.enqueue(row)
+            return
+        self.db.add(AIRun(**row))
         self.db.commit()
-        self.db.refresh(run)
-        return run
 
-    def get_ai_history(self, dataset_id: int, telegram_id: int) -> tuple[dict | None, list[dict]]:
-        dataset = self.get_dataset(dataset_id, telegram_id)
-        records = (
+    def save_ai_runs(self, dataset: Dataset, telegram_id: int, runs: list[dict]) -> int:
+        # One multi-row INSERT for a whole batch; each run takes save_ai_run's keyword arguments.
+        if not runs:
+            return 0
+        rows = [self._ai_run_row(dataset, telegram_id, **run) for run in runs]
+        self.db.execute(insert(AIRun), rows)
+        self.db.commit()
+        return len(rows)
+
+    def get_latest_profile(self, dataset_id: int) -> dict | None:
+        for run in ai_run_writer.pending(dataset_id):
+            if run.run_type == "profile":
+                return loads_compact(run.response_json)
+        record = (
+            self.db.query(AIRun)
+            .filter(AIRun.dataset_id == dataset_id, AIRun.run_type == "profile")
+            .order_by(AIRun.created_at.desc())
+            .first()
+        )
+        return loads_compact(record.response_json) if record else None
+
+    def recently_used_datasets(self, limit: int, scan: int = 500) -> list[Dataset]:
+        # Walks the newest AI runs by primary key, so the cost does not grow with the table.
+        recent = self.db.query(AIRun.dataset_id).order_by(AIRun.id.desc()).limit(scan)
+        dataset_ids = list(dict.fromkeys(dataset_id for (dataset_id,) in recent))[:limit]
+        if not dataset_ids:
+            return []
+        datasets = {dataset.id: dataset for dataset in self.db.query(Dataset).filter(Dataset.id.in_(dataset_ids))}
+        return [datasets[dataset_id] for dataset_id in dataset_ids if dataset_id in datasets]
+
+    def get_cached_query(self, dataset_id: int, question: str) -> dict | None:
+        for run in ai_run_writer.pending(dataset_id):
+            if run.run_type == "query" and run.question == question:
+                return loads_compact(run.response_json)
+        record = (
             self.db.query(AIRun)
-            .filter(AIRun.dataset_id == dataset.id)
+            .filter(AIRun.dataset_id == dataset_id, AIRun.run_type == "query", AIRun.question == question)
             .order_by(AIRun.created_at.desc())
-            .all()
+            .first()
         )
+        return loads_compact(record.response_json) if record else None
 
-        latest_profile: dict | None = None
-        queries: list[dict] = []
-
-        for rec in records:
-            parsed = json.loads(rec.response_json)
-            if rec.run_type == "profile" and latest_profile is None:
-                latest_profile = parsed
-            if rec.run_type == "query":
-                queries.append(
-                    {
-                        "id": rec.id,
-                        "question": rec.question,
-                        "answer": str(parsed.get("answer", "Analysis complete.")),
-                        "pandas_query": parsed.get("pandas_query"),
-                        "chart_config": parsed.get("chart_config"),
-                        "chart_data": parsed.get("chart_data"),
-                        "attempts": rec.attempts,
-                        "created_at": rec.created_at.isoformat(),
-                    }
+    def get_ai_history(
+        self, dataset_id: int, telegram_id: int, cursor: str | None = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> tuple[dict | None, list[AIRun], str | None]:
+        dataset = self.get_dataset(dataset_id, telegram_id)
+        latest_profile = self.get_latest_profile(dataset.id) if cursor is None else None
+        # Runs still in the write-behind buffer (a flush is due or failing) are newer than any
+        # stored one, so they go on top of the first page. Read before the table so a batch
+        # committing in between shows up twice at worst, and is deduplicated below.
+        pending = []
+        if cursor is None:
+            pending = [run for run in ai_run_writer.pending(dataset.id) if run.run_type == "query"][:limit]
+        query = (
+            self.db.query(AIRun)
+            .options(
+                load_only(
+                    AIRun.id,
+                    AIRun.question,
+                    AIRun.answer,
+                    AIRun.pandas_query,
+                    AIRun.chart_type,
+                    AIRun.row_count,
+                    AIRun.attempts,
+                    AIRun.created_at,
                 )
+            )
+            .filter(AIRun.dataset_id == dataset.id, AIRun.run_type == "query")
+        )
+        records, next_cursor = paginate(query, AIRun.created_at, AIRun.id, cursor, limit)
+        stored = {(record.created_at, record.question) for record in records}
+        records = [run for run in pending if (run.created_at, run.question) not in stored] + records
 
-        queries.reverse()
-        return latest_profile, queries
+        # Pages walk back in time; each page is still returned oldest first.
+        records.reverse()
+        return latest_profile, records, next_cursor
 
-    def load_dataframe(self, dataset: Dataset) -> pd.DataFrame:
-        try:
-            return pd.read_csv(dataset.file_path)
-        except Exception as exc:
-            raise AppException(f"Failed to load dataset: {exc}", 500) from exc
+    def get_ai_run_payload(self, dataset_id: int, run_id: int, telegram_id: int) -> dict:
+        dataset = self.get_dataset(dataset_id, telegram_id)
+        record = (
+            self.db.query(AIRun)
+            .filter(AIRun.id == run_id, AIRun.dataset_id == dataset.id, AIRun.run_type == "query")
+            .first()
+        )
+        if not record:
+            raise AppException("AI run not found", 404)
+        parsed = loads_compact(record.response_json)
+        if not isinstance(parsed, dict):
+            parsed = {}
+        return {
+            "answer": str(parsed.get("answer", DEFAULT_ANSWER)),
+            "pandas_query": parsed.get("pandas_query"),
+            "chart_config": parsed.get("chart_config") or {},
+            "chart_data": parsed.get("chart_data") or [],
+        }
+
+    def backfill_ai_run_metadata(self, batch_size: int = 500) -> int:
+        filled = 0
+        while True:
+            rows = self.db.execute(
+                self.db.query(AIRun.id, AIRun.response_json)
+                .filter(AIRun.run_type == "query", AIRun.answer.is_(None))
+                .limit(batch_size)
+                .statement
+            ).all()
+            if not rows:
+                return filled
+            updates = []
+            for run_id, response_json in rows:
+                try:
+                    response = loads_compact(response_json)
+                except (TypeError, ValueError):
+                    response = {}
+                # Old rows may hold null or a bare list; aborting here would fail the migration.
+                metadata = ai_run_metadata(response if isinstance(response, dict) else {})
+                metadata["answer"] = metadata["answer"] or DEFAULT_ANSWER
+                updates.append({"id": run_id, **metadata})
+            self.db.execute(update(AIRun), updates)
+            self.db.commit()
+            filled += len(updates)
+
+    def load_dataframe(self, dataset: Dataset) -> "pd.DataFrame":
+        return load_dataframe(dataset)
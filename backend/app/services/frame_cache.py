@@ -0,0 +1,83 @@
+import threading
+from typing import TYPE_CHECKING
+
+from app.utils.settings import get_settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+settings = get_settings()
+
+SIZE_SAMPLE_ROWS = 1000
+
+
+def frame_bytes(df: "pd.DataFrame") -> int:
+    # memory_usage(deep=True) walks every Python string, which costs more than read_csv on
+    # text-heavy uploads. Fixed-width columns are sized exactly; object columns from a strided
+    # sample of SIZE_SAMPLE_ROWS values scaled to the full length.
+    size = int(df.memory_usage(index=True, deep=False).sum())
+    rows = len(df)
+    if not rows:
+        return size
+    step = max(1, rows // SIZE_SAMPLE_ROWS)
+    for position, dtype in enumerate(df.dtypes):
+        if dtype != object:
+            continue
+        sample = df.iloc[::step, position]
+        extra = int(sample.memory_usage(index=False, deep=True)) - int(sample.memory_usage(index=False, deep=False))
+        size += extra * rows // len(sample)
+    return size
+
+
+# LRU of parsed datasets keyed by (dataset id, file path), bounded by the frames' memory
+# footprint. Uploads are written once under a unique name, so an entry never goes stale.
+# Frames are shared between requests; callers treat them as read-only (every query and
+# chart helper returns a new frame).
+class DataFrameCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: dict[tuple[int, str], tuple["pd.DataFrame", int]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dataset_id: int, file_path: str) -> "pd.DataFrame | None":
+        with self._lock:
+            entry = self._entries.pop((dataset_id, file_path), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[(dataset_id, file_path)] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, dataset_id: int, file_path: str, df: "pd.DataFrame") -> None:
+        size = frame_bytes(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((dataset_id, file_path), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._bytes -= self._entries.pop(oldest)[1]
+            self._entries[(dataset_id, file_path)] = (df, size)
+            self._bytes += size
+
+    def contains(self, dataset_id: int, file_path: str) -> bool:
+        with self._lock:
+            return (dataset_id, file_path) in self._entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+frame_cache = DataFrameCache(settings.dataframe_cache_mb * 1024 * 1024)
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.entities import User
+from app.utils.settings import get_settings
+
+settings = get_settings()
+
+
+class IdentityCache:
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._entries: dict[int, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> int | None:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, telegram_id: int, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[telegram_id] = (user_id, time.monotonic() + self.ttl_s)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+identity_cache = IdentityCache(settings.identity_cache_ttl_s, settings.identity_cache_max_entries)
+
+
+def _insert_user(db: Session, telegram_id: int) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        db.execute(sqlite.insert(User).values(telegram_id=telegram_id).on_conflict_do_nothing(index_elements=["telegram_id"]))
+    elif dialect == "postgresql":
+        db.execute(postgresql.insert(User).values(telegram_id=telegram_id).on_conflict_do_nothing(index_elements=["telegram_id"]))
+    else:
+        try:
+            with db.begin_nested():
+                db.execute(insert(User).values(telegram_id=telegram_id))
+        except IntegrityError:
+            pass
+
+
+def resolve_user_id(db: Session, telegram_id: int, create: bool = True) -> int | None:
+    cached = identity_cache.get(telegram_id)
+    if cached is not None:
+        return cached
+
+    user_id = db.execute(select(User.id).where(User.telegram_id == telegram_id)).scalar_one_or_none()
+    if user_id is not None:
+        identity_cache.put(telegram_id, user_id)
+        return user_id
+    if not create:
+        return None
+
+    # Concurrent first requests for the same user race here; the unique index on telegram_id
+    # turns the loser's insert into a no-op. The row only becomes durable with the caller's
+    # commit, so it is left out of the cache until a later lookup finds it committed.
+    _insert_user(db, telegram_id)
+    return db.execute(select(User.id).where(User.telegram_id == telegram_id)).scalar_one()
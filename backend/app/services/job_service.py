@@ -0,0 +1,68 @@
+import json
+from uuid import uuid4
+
+from sqlalchemy.orm import Session
+
+from app.models.entities import AIJob, Dataset, User
+from app.services.identity import resolve_user_id
+from app.utils.chart_format import dumps_compact
+from app.utils.middleware import AppException
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_job(self, dataset: Dataset, telegram_id: int, job_type: str, request: dict) -> AIJob:
+        job = AIJob(
+            id=uuid4().hex,
+            user_id=resolve_user_id(self.db, telegram_id),
+            dataset_id=dataset.id,
+            job_type=job_type,
+            request_json=json.dumps(request),
+        )
+        self.db.add(job)
+        self.db.commit()
+        self.db.refresh(job)
+        return job
+
+    def get_job(self, job_id: str, telegram_id: int | None = None) -> AIJob:
+        query = self.db.query(AIJob).filter(AIJob.id == job_id)
+        if telegram_id is not None:
+            query = query.join(User, User.id == AIJob.user_id).filter(User.telegram_id == telegram_id)
+        job = query.first()
+        if not job:
+            raise AppException("Job not found", 404)
+        return job
+
+    def mark_running(self, job: AIJob) -> None:
+        job.status = "running"
+        self.db.commit()
+
+    def update_progress(self, job: AIJob, done: int, total: int) -> None:
+        job.progress_done = done
+        job.progress_total = total
+        self.db.commit()
+
+    def mark_succeeded(self, job: AIJob, result: dict) -> None:
+        job.status = "succeeded"
+        job.result_json = dumps_compact(result)
+        if job.progress_total:
+            job.progress_done = job.progress_total
+        self.db.commit()
+
+    def mark_failed(self, job: AIJob, error: str) -> None:
+        job.status = "failed"
+        job.error = error
+        self.db.commit()
+
+    def fail_interrupted(self) -> int:
+        count = (
+            self.db.query(AIJob)
+            .filter(AIJob.status.in_(ACTIVE_STATUSES))
+            .update({AIJob.status: "failed", AIJob.error: "Interrupted by server restart"}, synchronize_session=False)
+        )
+        self.db.commit()
+        return count
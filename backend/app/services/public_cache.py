@@ -0,0 +1,73 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.utils.settings import get_settings
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class CachedDashboard:
+    body: bytes
+    columnar_body: bytes
+    etag: str
+    columnar_etag: str
+    last_modified: datetime
+
+
+# Serialised public dashboards keyed by share token. Writers invalidate after committing;
+# a reader that loaded the row before an invalidation passes its stale epoch to put() and is
+# dropped, so a racing save cannot be overwritten by the older body. The TTL bounds staleness
+# across worker processes, which do not see each other's invalidations.
+class PublicDashboardCache:
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._entries: dict[str, tuple[CachedDashboard, float]] = {}
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def epoch(self) -> int:
+        with self._lock:
+            return self._epoch
+
+    def get(self, token: str) -> CachedDashboard | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, value: CachedDashboard, epoch: int) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries.pop(token, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[token] = (value, time.monotonic() + self.ttl_s)
+
+    def invalidate(self, token: str | None) -> None:
+        with self._lock:
+            self._epoch += 1
+            if token is not None:
+                self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+public_dashboard_cache = PublicDashboardCache(settings.public_cache_ttl_s, settings.public_cache_max_entries)
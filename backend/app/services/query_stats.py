@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from app.models.database import open_async_db
+from app.models.entities import Dataset, DatasetUsage, QueryStatement
+from app.utils.query_log import QueryLogBatch, add_hotness, decayed_count, query_log
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+AGGREGATE_KINDS = ("chart", "compare")
+
+
+def _merge_batch(session: Session, batch: QueryLogBatch) -> None:
+    dataset_ids = [stats.dataset_id for stats in batch.datasets]
+    usage = {row.dataset_id: row for row in session.query(DatasetUsage).filter(DatasetUsage.dataset_id.in_(dataset_ids))}
+    for stats in batch.datasets:
+        row = usage.get(stats.dataset_id)
+        if row is None:
+            row = DatasetUsage(dataset_id=stats.dataset_id, access_count=0, query_count=0, query_ms=0.0)
+            session.add(row)
+        row.access_count += stats.accesses
+        row.query_count += stats.queries
+        row.query_ms += stats.query_ms
+        if stats.accesses:
+            row.last_accessed_at = datetime.utcfromtimestamp(stats.last_at)
+        row.hotness = add_hotness(row.hotness, stats.hotness)
+
+    keys = [(stats.dataset_id, stats.kind, stats.spec_hash) for stats in batch.statements]
+    existing = {}
+    if keys:
+        columns = tuple_(QueryStatement.dataset_id, QueryStatement.kind, QueryStatement.spec_hash)
+        existing = {(row.dataset_id, row.kind, row.spec_hash): row for row in session.query(QueryStatement).filter(columns.in_(keys))}
+    for key, stats in zip(keys, batch.statements):
+        row = existing.get(key)
+        if row is None:
+            row = QueryStatement(
+                dataset_id=stats.dataset_id,
+                kind=stats.kind,
+                spec_hash=stats.spec_hash,
+                pandas_query=stats.pandas_query,
+                chart_config_json=json.dumps(stats.chart_config) if stats.chart_config is not None else None,
+                calls=0,
+                total_ms=0.0,
+                max_ms=0.0,
+            )
+            session.add(row)
+        row.calls += stats.calls
+        row.total_ms += stats.total_ms
+        row.max_ms = max(row.max_ms, stats.max_ms)
+        row.rows_in = stats.rows_in
+        row.rows_out = stats.rows_out
+        row.last_run_at = datetime.utcfromtimestamp(stats.last_at)
+        row.hotness = add_hotness(row.hotness, stats.hotness)
+    session.commit()
+
+
+# Drains the in-memory query log into dataset_usage / query_statements every
+# query_stats_flush_interval_s, and once more on shutdown so a restart keeps the hotness
+# ranking the warm-up relies on. A failed flush puts the batch back for the next round;
+# after max_retries failures in a row the batch is dropped so an unreachable database does
+# not keep every counter since the outage in memory.
+class QueryStatsWriter:
+    def __init__(self, flush_interval_s: float, max_retries: int) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.max_retries = max(0, max_retries)
+        self._flush_lock: asyncio.Lock | None = None
+        self._stop: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.dropped = 0
+        self._failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._flush_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        assert self._stop is not None
+        self._stop.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            return 0
+        async with self._flush_lock:
+            batch = query_log.drain()
+            if not batch.statements and not batch.datasets:
+                return 0
+            try:
+                async with open_async_db() as db:
+                    await db.run_sync(_merge_batch, batch)
+            except Exception as exc:
+                self._failures += 1
+                if self._failures > self.max_retries:
+                    entries = len(batch.statements) + len(batch.datasets)
+                    logger.error("Query stats flush failed %d times, dropping %d entries: %s", self._failures, entries, exc)
+                    self.dropped += entries
+                    self._failures = 0
+                else:
+                    logger.warning("Query stats flush failed, will retry: %s", exc)
+                    query_log.restore(batch)
+                return 0
+            self._failures = 0
+            self.flushes += 1
+            return len(batch.statements) + len(batch.datasets)
+
+    def stats(self) -> dict:
+        return {"flushes": self.flushes, "failures": self._failures, "dropped": self.dropped}
+
+    async def _run(self) -> None:
+        assert self._stop is not None
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+query_stats_writer = QueryStatsWriter(settings.query_stats_flush_interval_s, settings.query_stats_max_retries)
+
+
+def _statement_out(row: QueryStatement, now: float) -> dict:
+    return {
+        "dataset_id": row.dataset_id,
+        "kind": row.kind,
+        "pandas_query": row.pandas_query,
+        "chart_config": json.loads(row.chart_config_json) if row.chart_config_json else None,
+        "calls": row.calls,
+        "avg_ms": round(row.total_ms / row.calls, 2) if row.calls else None,
+        "max_ms": round(row.max_ms, 2),
+        "rows_in": row.rows_in,
+        "rows_out": row.rows_out,
+        "last_run_at": row.last_run_at.isoformat(),
+        "score": round(decayed_count(row.hotness, now), 3),
+    }
+
+
+class QueryStatsService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def hot_datasets(self, limit: int) -> list[tuple[Dataset, DatasetUsage]]:
+        rows = (
+            self.db.query(Dataset, DatasetUsage)
+            .join(DatasetUsage, DatasetUsage.dataset_id == Dataset.id)
+            .filter(DatasetUsage.hotness.is_not(None))
+            .order_by(DatasetUsage.hotness.desc())
+            .limit(limit)
+            .all()
+        )
+        return [(dataset, usage) for dataset, usage in rows]
+
+    def hot_statements(
+        self, limit: int, dataset_ids: list[int] | None = None, kinds: tuple[str, ...] | None = None
+    ) -> list[QueryStatement]:
+        query = self.db.query(QueryStatement).filter(QueryStatement.hotness.is_not(None))
+        if dataset_ids is not None:
+            query = query.filter(QueryStatement.dataset_id.in_(dataset_ids))
+        if kinds is not None:
+            query = query.filter(QueryStatement.kind.in_(kinds))
+        return query.order_by(QueryStatement.hotness.desc()).limit(limit).all()
+
+    def slowest_statements(self, limit: int) -> list[QueryStatement]:
+        return self.db.query(QueryStatement).order_by(QueryStatement.max_ms.desc()).limit(limit).all()
+
+    def report(self, limit: int) -> dict:
+        now = time.time()
+        return {
+            "half_life_h": settings.hotness_half_life_h,
+            "slow_query_ms": settings.slow_query_ms,
+            "datasets": [
+                {
+                    "dataset_id": dataset.id,
+                    "name": dataset.name,
+                    "row_count": dataset.row_count,
+                    "accesses": usage.access_count,
+                    "queries": usage.query_count,
+                    "avg_query_ms": round(usage.query_ms / usage.query_count, 2) if usage.query_count else None,
+                    "last_accessed_at": usage.last_accessed_at.isoformat(),
+                    "score": round(decayed_count(usage.hotness, now), 3),
+                }
+                for dataset, usage in self.hot_datasets(limit)
+            ],
+            "statements": [_statement_out(row, now) for row in self.hot_statements(limit)],
+            "slowest": [_statement_out(row, now) for row in self.slowest_statements(limit)],
+            "recent_slow": query_log.slow_queries(limit),
+        }
@@ -1,6 +1,7 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from app.models.entities import Team, TeamMember, User
+from app.models.entities import Team, TeamMember
+from app.services.identity import resolve_user_id
 from app.utils.middleware import AppException
 
 
@@ -8,15 +9,8 @@ class TeamService:
     def __init__(self, db: Session):
         self.db = db
 
-    def _get_or_create_user(self, telegram_id: int) -> User:
-        user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
-        if user:
-            return user
-        user = User(telegram_id=telegram_id)
-        self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
-        return user
+    def _user_id(self, telegram_id: int) -> int:
+        return resolve_user_id(self.db, telegram_id)
 
     def _require_team_role(self, team_id: int, user_id: int, allowed_roles: set[str]) -> TeamMember:
         member = self.db.query(TeamMember).filter(TeamMember.team_id == team_id, TeamMember.user_id == user_id).first()
@@ -25,50 +19,49 @@ class TeamService:
         return member
 
     def create_team(self, telegram_id: int, name: str) -> Team:
-        owner = self._get_or_create_user(telegram_id)
-        team = Team(name=name, owner_user_id=owner.id)
+        owner_id = self._user_id(telegram_id)
+        team = Team(name=name, owner_user_id=owner_id)
         self.db.add(team)
-        self.db.commit()
-        self.db.refresh(team)
+        self.db.flush()
 
-        membership = TeamMember(team_id=team.id, user_id=owner.id, role="owner")
+        membership = TeamMember(team_id=team.id, user_id=owner_id, role="owner")
         self.db.add(membership)
         self.db.commit()
         return team
 
     def list_teams(self, telegram_id: int) -> list[Team]:
-        user = self._get_or_create_user(telegram_id)
+        user_id = self._user_id(telegram_id)
         return (
             self.db.query(Team)
+            .options(joinedload(Team.owner))
             .join(TeamMember, TeamMember.team_id == Team.id)
-            .filter(TeamMember.user_id == user.id)
+            .filter(TeamMember.user_id == user_id)
             .order_by(Team.created_at.desc())
             .all()
         )
 
     def list_members(self, telegram_id: int, team_id: int) -> list[TeamMember]:
-        user = self._get_or_create_user(telegram_id)
-        self._require_team_role(team_id, user.id, {"owner", "editor", "viewer"})
+        self._require_team_role(team_id, self._user_id(telegram_id), {"owner", "editor", "viewer"})
         return (
             self.db.query(TeamMember)
+            .options(joinedload(TeamMember.user))
             .filter(TeamMember.team_id == team_id)
             .order_by(TeamMember.created_at.asc())
             .all()
         )
 
     def add_member(self, actor_telegram_id: int, team_id: int, member_telegram_id: int, role: str) -> TeamMember:
-        actor = self._get_or_create_user(actor_telegram_id)
-        self._require_team_role(team_id, actor.id, {"owner"})
-        member_user = self._get_or_create_user(member_telegram_id)
+        self._require_team_role(team_id, self._user_id(actor_telegram_id), {"owner"})
+        member_user_id = self._user_id(member_telegram_id)
 
-        existing = self.db.query(TeamMember).filter(TeamMember.team_id == team_id, TeamMember.user_id == member_user.id).first()
+        existing = self.db.query(TeamMember).filter(TeamMember.team_id == team_id, TeamMember.user_id == member_user_id).first()
         if existing:
             existing.role = role
             self.db.commit()
             self.db.refresh(existing)
             return existing
 
-        member = TeamMember(team_id=team_id, user_id=member_user.id, role=role)
+        member = TeamMember(team_id=team_id, user_id=member_user_id, role=role)
         self.db.add(member)
         self.db.commit()
         self.db.refresh(member)
@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.ai.ollama_client import PromptLoader
+from app.models.database import SessionLocal
+from app.services.dataset_service import DatasetService, load_dataframe
+from app.services.query_stats import AGGREGATE_KINDS, QueryStatsService
+from app.services.widget_refresh import compute_widget, dataset_version, widget_cache, widget_spec_hash
+from app.utils.metrics import set_run_type
+from app.utils.middleware import AppException
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+# Loads the hottest datasets into the frame cache and precomputes their most frequent chart
+# aggregations into the widget result cache. Falls back to the datasets of the newest AI runs
+# until the query log has ranked any.
+def _preload(dataset_limit: int, aggregate_limit: int) -> tuple[int, int]:
+    # The analytics stack is imported lazily; pay for it here rather than in the first AI request.
+    import httpx  # noqa: F401
+    import pandas  # noqa: F401
+
+    with SessionLocal(expire_on_commit=False) as db:
+        stats = QueryStatsService(db)
+        datasets = [dataset for dataset, _ in stats.hot_datasets(dataset_limit)]
+        if not datasets:
+            datasets = DatasetService(db).recently_used_datasets(dataset_limit)
+        statements = stats.hot_statements(aggregate_limit, [dataset.id for dataset in datasets], AGGREGATE_KINDS)
+
+    frames = {}
+    for dataset in datasets:
+        try:
+            frames[dataset.id] = load_dataframe(dataset)
+        except AppException as exc:
+            logger.warning("Warm-up could not load dataset=%s: %s", dataset.id, exc.message)
+
+    versions = {dataset.id: dataset_version(dataset) for dataset in datasets}
+    aggregates = 0
+    for statement in statements:
+        df = frames.get(statement.dataset_id)
+        if df is None or statement.chart_config_json is None:
+            continue
+        widget = {"pandas_query": statement.pandas_query, "chart_config": json.loads(statement.chart_config_json)}
+        try:
+            chart_data = compute_widget(df, widget)
+        except Exception as exc:
+            logger.warning("Warm-up could not compute aggregate for dataset=%s: %s", statement.dataset_id, exc)
+            continue
+        widget_cache.put(versions[statement.dataset_id], widget_spec_hash(widget), chart_data)
+        aggregates += 1
+    return len(frames), aggregates
+
+
+# Runs on the background queue after startup, so the worker serves requests while it warms.
+async def warm_up() -> dict:
+    set_run_type("warmup")
+    started = time.perf_counter()
+    prompts = PromptLoader.preload()
+    datasets, aggregates = await run_in_threadpool(_preload, settings.warmup_datasets, settings.warmup_aggregates)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        "Warm-up loaded %s prompts, %s datasets and %s aggregates in %.0fms", prompts, datasets, aggregates, elapsed_ms
+    )
+    return {"prompts": prompts, "datasets": datasets, "aggregates": aggregates, "elapsed_ms": round(elapsed_ms, 1)}
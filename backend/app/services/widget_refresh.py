@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from starlette.concurrency import run_in_threadpool
+
+from app.models.entities import Dashboard, Dataset
+from app.services.async_service import AsyncService
+from app.services.dashboard_service import DashboardService
+from app.services.dataset_service import load_dataframe
+from app.utils.chart_format import dumps_compact, loads_compact
+from app.utils.charts import build_chart_data, build_comparison_data
+from app.utils.query_log import spec_hash
+from app.utils.safe_query import execute_safe_query, sanitize_chart_config
+from app.utils.settings import get_settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def dataset_version(dataset: Dataset) -> str:
+    # Uploads are written once under a unique name; size and mtime catch a file replaced in place.
+    try:
+        stat = os.stat(dataset.file_path)
+    except OSError:
+        return f"{dataset.id}:missing"
+    return f"{dataset.id}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def widget_spec_hash(widget: dict) -> str:
+    # Same key as the query log's statements, so the warm-up can fill this cache from them.
+    return spec_hash(widget.get("pandas_query"), widget.get("chart_config"))
+
+
+def is_executable(widget: dict) -> bool:
+    # Widgets saved before specs were stored carry only a chart_data snapshot and no pandas_query;
+    # re-running their chart_config over the whole dataset would silently drop the original filter.
+    config = widget.get("chart_config")
+    if not isinstance(config, dict):
+        return False
+    return "pandas_query" in widget or bool(config.get("comparison"))
+
+
+def compute_widget(df: "pd.DataFrame", widget: dict) -> list[dict]:
+    config = widget["chart_config"]
+    if config.get("comparison"):
+        return build_comparison_data(df, config["x"], config["y"], config.get("period") or "month")
+    filtered = execute_safe_query(df, widget.get("pandas_query"))
+    return build_chart_data(filtered, sanitize_chart_config(config, list(df.columns)))
+
+
+class WidgetResultCache:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._entries: dict[tuple[str, str], list[dict]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: str, spec_hash: str) -> list[dict] | None:
+        with self._lock:
+            chart_data = self._entries.pop((version, spec_hash), None)
+            if chart_data is None:
+                self.misses += 1
+                return None
+            self._entries[(version, spec_hash)] = chart_data
+            self.hits += 1
+            return chart_data
+
+    def put(self, version: str, spec_hash: str, chart_data: list[dict]) -> None:
+        with self._lock:
+            self._entries.pop((version, spec_hash), None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[(version, spec_hash)] = chart_data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+widget_cache = WidgetResultCache(settings.widget_cache_max_entries)
+
+
+@dataclass
+class RefreshStats:
+    recomputed: int = 0
+    cached: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    errors: dict[str, str] = field(default_factory=dict)
+
+
+# Runs in a worker thread. The dataset is read at most once, and only if some widget misses
+# both its stored snapshot and the result cache.
+def refresh_widgets(widgets: list[dict], version: str, load: Callable[[], "pd.DataFrame"]) -> tuple[list[dict], RefreshStats]:
+    stats = RefreshStats()
+    df: "pd.DataFrame | None" = None
+    refreshed: list[dict] = []
+    for index, widget in enumerate(widgets):
+        if not isinstance(widget, dict) or not is_executable(widget):
+            stats.skipped += 1
+            refreshed.append(widget)
+            continue
+
+        spec_hash = widget_spec_hash(widget)
+        if widget.get("spec_hash") == spec_hash and widget.get("data_version") == version and "chart_data" in widget:
+            stats.unchanged += 1
+            refreshed.append(widget)
+            continue
+
+        chart_data = widget_cache.get(version, spec_hash)
+        if chart_data is not None:
+            stats.cached += 1
+        else:
+            try:
+                if df is None:
+                    df = load()
+                chart_data = compute_widget(df, widget)
+            except Exception as exc:
+                logger.warning("widget refresh failed index=%s: %s", index, exc)
+                stats.errors[str(widget.get("id", index))] = str(exc)
+                refreshed.append({**widget, "refresh_error": str(exc)})
+                continue
+            widget_cache.put(version, spec_hash, chart_data)
+            stats.recomputed += 1
+
+        updated = {**widget, "chart_data": chart_data, "spec_hash": spec_hash, "data_version": version}
+        updated.pop("refresh_error", None)
+        refreshed.append(updated)
+    return refreshed, stats
+
+
+def _unsaved_copy(dashboard: Dashboard, config: dict) -> Dashboard:
+    return Dashboard(
+        id=dashboard.id,
+        user_id=dashboard.user_id,
+        dataset_id=dashboard.dataset_id,
+        title=dashboard.title,
+        config_json=dumps_compact(config),
+        share_token=dashboard.share_token,
+        is_public=dashboard.is_public,
+        created_at=dashboard.created_at,
+        updated_at=dashboard.updated_at,
+    )
+
+
+async def refresh_dashboard(
+    dashboard_service: AsyncService[DashboardService], telegram_id: int, dashboard_id: int
+) -> tuple[Dashboard, RefreshStats]:
+    dashboard, dataset, can_edit = await dashboard_service.get_refresh_target(telegram_id, dashboard_id)
+    config = loads_compact(dashboard.config_json)
+    widgets = config.get("widgets") if isinstance(config, dict) else None
+    if not isinstance(widgets, list) or not widgets:
+        return dashboard, RefreshStats()
+
+    version = dataset_version(dataset)
+    refreshed, stats = await run_in_threadpool(refresh_widgets, widgets, version, lambda: load_dataframe(dataset))
+    if refreshed == widgets:
+        return dashboard, stats
+    if not can_edit:
+        # Viewers get the recomputed widgets, but only editors write them back.
+        return _unsaved_copy(dashboard, {**config, "widgets": refreshed}), stats
+    dashboard = await dashboard_service.apply_refresh(
+        telegram_id, dashboard_id, dashboard.updated_at, {**config, "widgets": refreshed}
+    )
+    return dashboard, stats
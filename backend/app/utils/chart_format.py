@@ -0,0 +1,85 @@
+import json
+from typing import Any
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.minibi.columnar+json"
+
+
+def pack_chart_data(rows: Any) -> Any:
+    # [{"x": "a", "y": 1}, {"x": "b", "y": 2}] -> {"x": ["a", "b"], "y": [1, 2]}
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return rows
+    keys: list[str] = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def unpack_chart_data(columns: Any) -> Any:
+    if not isinstance(columns, dict) or not all(isinstance(values, list) for values in columns.values()):
+        return columns
+    length = max((len(values) for values in columns.values()), default=0)
+    return [{key: values[i] if i < len(values) else None for key, values in columns.items()} for i in range(length)]
+
+
+def _walk(payload: Any, convert) -> Any:
+    if isinstance(payload, dict):
+        return {key: convert(value) if key == "chart_data" else _walk(value, convert) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [_walk(item, convert) for item in payload]
+    return payload
+
+
+def pack_payload(payload: Any) -> Any:
+    return _walk(payload, pack_chart_data)
+
+
+def unpack_payload(payload: Any) -> Any:
+    return _walk(payload, unpack_chart_data)
+
+
+# Stored responses and dashboard configs keep chart_data columnar; rows written before the
+# compact format are plain lists and pass through unpack_payload unchanged.
+def dumps_compact(payload: Any) -> str:
+    return json.dumps(pack_payload(payload), separators=(",", ":"))
+
+
+def loads_compact(raw: str) -> Any:
+    return unpack_payload(json.loads(raw))
+
+
+def _accept_qualities(accept: str) -> dict[str, float]:
+    qualities: dict[str, float] = {}
+    for media_range in accept.split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            qualities[media_type.lower()] = quality
+    return qualities
+
+
+# Columnar only when the client lists it with a non-zero q that is not below plain JSON's.
+def wants_columnar(request: Request) -> bool:
+    qualities = _accept_qualities(request.headers.get("accept", ""))
+    columnar = qualities.get(COLUMNAR_MEDIA_TYPE, 0.0)
+    return columnar > 0 and columnar >= qualities.get("application/json", 0.0)
+
+
+def negotiated_response(request: Request, content: Any, headers: dict[str, str] | None = None) -> JSONResponse:
+    payload = jsonable_encoder(content)
+    all_headers = {"Vary": "Accept", **(headers or {})}
+    if wants_columnar(request):
+        return JSONResponse(pack_payload(payload), media_type=COLUMNAR_MEDIA_TYPE, headers=all_headers)
+    return JSONResponse(payload, headers=all_headers)
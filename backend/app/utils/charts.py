@@ -0,0 +1,72 @@
+from typing import TYPE_CHECKING
+
+from app.utils.metrics import timed_stage
+from app.utils.middleware import AppException
+from app.utils.query_log import tracked_query
+from app.utils.safe_query import ALLOWED_AGGREGATIONS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PERIOD_CODES = {"day": "D", "week": "W", "month": "M"}
+
+
+def comparison_chart_config(date_column: str, value_column: str, period: str) -> dict:
+    return {"type": "line", "x": date_column, "y": value_column, "comparison": True, "period": period}
+
+
+@timed_stage("build_chart")
+@tracked_query("chart", lambda df, chart_config: (df.attrs.get("pandas_query"), chart_config))
+def build_chart_data(df: "pd.DataFrame", chart_config: dict[str, str | None]) -> list[dict]:
+    x_col = chart_config["x"]
+    y_col = chart_config["y"]
+    agg = chart_config.get("aggregation")
+    chart_type = chart_config["type"]
+
+    if x_col is None:
+        raise AppException("Unable to build chart: dataset has no columns", 400)
+
+    if chart_type == "histogram":
+        values = df[x_col].dropna()
+        bins = min(20, max(5, int(values.nunique() / 2) if hasattr(values, "nunique") else 10))
+        hist = values.value_counts(bins=bins).sort_index()
+        return [{"x": str(idx), "y": float(val)} for idx, val in hist.items()]
+
+    if y_col and y_col in df.columns:
+        series = df[[x_col, y_col]].dropna()
+        if agg in ALLOWED_AGGREGATIONS:
+            grouped = series.groupby(x_col)[y_col].agg(agg).reset_index()
+            return [{"x": str(r[x_col]), "y": float(r[y_col])} for _, r in grouped.head(200).iterrows()]
+        return [{"x": str(r[x_col]), "y": float(r[y_col])} for _, r in series.head(200).iterrows()]
+
+    counts = df[x_col].value_counts().head(50)
+    return [{"x": str(idx), "y": int(val)} for idx, val in counts.items()]
+
+
+@timed_stage("compare_periods")
+@tracked_query("compare", lambda df, *args: (None, comparison_chart_config(*args)))
+def build_comparison_data(df: "pd.DataFrame", date_column: str, value_column: str, period: str) -> list[dict]:
+    import pandas as pd
+
+    if date_column not in df.columns or value_column not in df.columns:
+        raise AppException("Invalid columns for period comparison", 400)
+
+    dates = pd.to_datetime(df[date_column], errors="coerce")
+    values = pd.to_numeric(df[value_column], errors="coerce")
+    local = pd.DataFrame({"date": dates, "value": values}).dropna()
+    if local.empty:
+        raise AppException("Insufficient data for period comparison", 400)
+
+    code = PERIOD_CODES.get(period, "M")
+    grouped = local.groupby(local["date"].dt.to_period(code))["value"].sum().sort_index()
+    tail = grouped.tail(12)
+    prev = tail.shift(1)
+
+    return [
+        {
+            "x": str(idx),
+            "current": float(cur),
+            "previous": float(prev.loc[idx]) if pd.notna(prev.loc[idx]) else None,
+        }
+        for idx, cur in tail.items()
+    ]
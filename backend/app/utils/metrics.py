@@ -0,0 +1,134 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app.utils.settings import get_settings
+
+settings = get_settings()
+
+MODEL = settings.ollama_model
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+registry = CollectorRegistry()
+
+STAGE_SECONDS = Histogram(
+    "minibi_stage_duration_seconds",
+    "Time spent in each stage of the AI and dashboard pipeline",
+    ["stage", "run_type", "model"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+    registry=registry,
+)
+RUN_ATTEMPTS = Histogram(
+    "minibi_llm_attempts",
+    "LLM attempts needed per successful AI run",
+    ["run_type", "model"],
+    buckets=(1, 2, 3, 4, 6, 8),
+    registry=registry,
+)
+LLM_FAILURES = Counter(
+    "minibi_llm_failures",
+    "Failed LLM attempts by exception type",
+    ["kind", "run_type", "model"],
+    registry=registry,
+)
+QUERY_REPAIRS = Counter(
+    "minibi_query_repairs",
+    "Local repair rules applied to model output",
+    ["rule", "run_type", "model"],
+    registry=registry,
+)
+AI_CACHE_REQUESTS = Counter(
+    "minibi_ai_cache_requests",
+    "Stored AI results served instead of calling the LLM",
+    ["cache", "result", "run_type"],
+    registry=registry,
+)
+DATASET_BYTES = Counter("minibi_dataset_bytes_loaded", "CSV bytes read from disk", ["run_type"], registry=registry)
+DATASET_ROWS = Counter("minibi_dataset_rows_loaded", "CSV rows parsed into DataFrames", ["run_type"], registry=registry)
+
+# Set at the entry of each AI operation; asyncio tasks and threadpool calls inherit it, so
+# nested stages (CSV load, query, chart) are labelled with the run that caused them.
+_run_type: ContextVar[str] = ContextVar("metrics_run_type", default="none")
+
+
+def set_run_type(run_type: str) -> None:
+    _run_type.set(run_type)
+
+
+def current_run_type() -> str:
+    return _run_type.get()
+
+
+def record_stage(stage: str, seconds: float, run_type: str | None = None) -> None:
+    STAGE_SECONDS.labels(stage, run_type or _run_type.get(), MODEL).observe(seconds)
+
+
+@contextmanager
+def observe_stage(stage: str, run_type: str | None = None) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, run_type)
+
+
+def timed_stage(stage: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe_stage(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class _StatsCollector(Collector):
+    # Components keep their own counters (cache hits, scheduler admissions, writer batches);
+    # they are read at scrape time instead of being mirrored on every hot-path call.
+    def __init__(self) -> None:
+        self.caches: dict[str, Callable[[], dict]] = {}
+        self.components: dict[str, Callable[[], dict]] = {}
+
+    def collect(self):
+        hits = CounterMetricFamily("minibi_cache_hits", "In-process cache hits", labels=["cache"])
+        misses = CounterMetricFamily("minibi_cache_misses", "In-process cache misses", labels=["cache"])
+        entries = GaugeMetricFamily("minibi_cache_entries", "Entries held by in-process caches", labels=["cache"])
+        for name, stats_fn in self.caches.items():
+            stats = stats_fn()
+            hits.add_metric([name], stats.get("hits", 0))
+            misses.add_metric([name], stats.get("misses", 0))
+            entries.add_metric([name], stats.get("size", 0))
+        yield hits
+        yield misses
+        yield entries
+
+        component = GaugeMetricFamily("minibi_component_stat", "Numeric stats reported by runtime components", labels=["component", "stat"])
+        for name, stats_fn in self.components.items():
+            for key, value in stats_fn().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    component.add_metric([name, key], value)
+        yield component
+
+
+_stats_collector = _StatsCollector()
+registry.register(_stats_collector)
+
+
+def register_cache(name: str, stats_fn: Callable[[], dict]) -> None:
+    _stats_collector.caches[name] = stats_fn
+
+
+def register_component(name: str, stats_fn: Callable[[], dict]) -> None:
+    _stats_collector.components[name] = stats_fn
+
+
+def render_metrics() -> bytes:
+    return generate_latest(registry)
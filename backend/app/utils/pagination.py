@@ -0,0 +1,57 @@
+import base64
+from datetime import datetime
+from typing import Any, TypeVar
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from app.utils.middleware import AppException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+T = TypeVar("T")
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = f"{sort_value.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        sort_value, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise AppException("Invalid cursor", 400) from exc
+
+
+# Keyset page over (sort_column, id_column); the cursor encodes the last row of the previous page.
+def paginate(
+    query: Query,
+    sort_column: Any,
+    id_column: Any,
+    cursor: str | None,
+    limit: int,
+    descending: bool = True,
+) -> tuple[list[T], str | None]:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > row_id)))
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
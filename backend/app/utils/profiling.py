@@ -0,0 +1,208 @@
+import cProfile
+import hmac
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.query_counter import current_query_stats
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PROFILE_REQUEST_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILING_MODES = ("sampling", "deterministic")
+TAGGED_PARAMS = ("dataset_id", "dashboard_id", "telegram_id")
+IDLE_MODULES = ("threading", "queue", "concurrent.futures.thread")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({'/'.join(path.parts[-2:])}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_globals.get("__name__") in IDLE_MODULES
+
+
+# Samples the event loop thread and the threadpool workers (where pandas and the sync DB
+# work run) and aggregates stacks in the folded format read by flamegraph.pl, speedscope
+# and inferno: "root;...;leaf count". Each stack is rooted at its thread name. Worker
+# samples parked in the pool's idle wait are dropped. Samples from other requests running
+# at the same time are included, so profiles are clearest on a quiet worker.
+class StackSampler:
+    def __init__(self, interval_s: float, loop_thread_id: int, max_s: float) -> None:
+        self.interval_s = interval_s
+        self.loop_thread_id = loop_thread_id
+        self.max_s = max_s
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.truncated = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        names = {}
+        deadline = time.monotonic() + self.max_s
+        while not self._stop.wait(self.interval_s):
+            if time.monotonic() > deadline:
+                # A request that outlives the cap keeps its first max_s of samples.
+                self.truncated = True
+                return
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, "")
+                if thread_id != self.loop_thread_id and not name.startswith("AnyIO worker"):
+                    continue
+                if thread_id != self.loop_thread_id and _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append("event loop" if thread_id == self.loop_thread_id else "worker thread")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9]+", "-", text).strip("-")[:60] or "root"
+
+
+def _is_streaming(scope: Scope) -> bool:
+    # Event streams stay open for the life of the connection; profiling one would hold the
+    # profile slot and keep sampling for hours.
+    accept = Headers(scope=scope).get("accept", "")
+    return "text/event-stream" in accept or scope["path"].rstrip("/").endswith("/events")
+
+
+def _should_profile(scope: Scope) -> bool:
+    if _is_streaming(scope):
+        return False
+    token = Headers(scope=scope).get(PROFILE_REQUEST_HEADER.lower())
+    if token is not None and settings.profiling_token and hmac.compare_digest(token, settings.profiling_token):
+        return True
+    return settings.profiling_enabled and random.random() < settings.profiling_sample_rate
+
+
+# Profiles one request at a time, chosen either by an X-Profile header carrying the
+# configured profiling token or at random with the configured sample rate. Requests that
+# arrive while a profile is running are served normally. Each profile is written to
+# profiling_dir with a JSON sidecar holding the endpoint, dataset/dashboard ids and
+# timings; the response carries X-Profile-Id so the files can be found.
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _should_profile(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid4().hex[:12]
+        status_code = 0
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        mode = settings.profiling_mode if settings.profiling_mode in PROFILING_MODES else "sampling"
+        sampler = None
+        profiler = None
+        if mode == "sampling":
+            sampler = StackSampler(settings.profiling_interval_ms / 1000, threading.get_ident(), settings.profiling_max_s)
+            sampler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            wall_s = time.perf_counter() - started
+            if sampler is not None:
+                sampler.stop()
+            if profiler is not None:
+                profiler.disable()
+            try:
+                self._write(scope, profile_id, mode, status_code, started_at, wall_s, sampler, profiler)
+            except OSError as exc:
+                logger.warning("Failed to write profile %s: %s", profile_id, exc)
+            finally:
+                self._busy.release()
+
+    def _write(
+        self,
+        scope: Scope,
+        profile_id: str,
+        mode: str,
+        status_code: int,
+        started_at: datetime,
+        wall_s: float,
+        sampler: StackSampler | None,
+        profiler: cProfile.Profile | None,
+    ) -> None:
+        route = scope.get("route")
+        endpoint = getattr(route, "path", scope["path"])
+        params = {**QueryParams(scope.get("query_string", b"")), **scope.get("path_params", {})}
+        query_stats = current_query_stats()
+
+        directory = Path(settings.profiling_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{started_at:%Y%m%dT%H%M%S}_{scope['method']}_{_slug(endpoint)}_{wall_s * 1000:.0f}ms_{profile_id}"
+        if sampler is not None:
+            profile_path = directory / f"{stem}.folded"
+            profile_path.write_text(sampler.folded(), encoding="utf-8")
+        else:
+            profile_path = directory / f"{stem}.prof"
+            profiler.dump_stats(profile_path)
+
+        meta = {
+            "id": profile_id,
+            "mode": mode,
+            "file": profile_path.name,
+            "method": scope["method"],
+            "endpoint": endpoint,
+            "path": scope["path"],
+            "status": status_code,
+            **{name: params[name] for name in TAGGED_PARAMS if name in params},
+            "started_at": started_at.isoformat(),
+            "wall_ms": round(wall_s * 1000, 1),
+            "db_queries": query_stats.count if query_stats else None,
+            "db_ms": round(query_stats.seconds * 1000, 1) if query_stats else None,
+            "samples": sampler.samples if sampler is not None else None,
+            "truncated": sampler.truncated if sampler is not None else None,
+            "interval_ms": settings.profiling_interval_ms if sampler is not None else None,
+        }
+        (directory / f"{stem}.json").write_text(json.dumps(meta, indent=2, default=str), encoding="utf-8")
+        logger.info("Profiled %s %s in %.1fms -> %s", scope["method"], scope["path"], wall_s * 1000, profile_path)
@@ -0,0 +1,124 @@
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# The stats object is shared by reference, so statements issued from threadpool workers
+# (which run in a copy of the request context) still land on the request's counter.
+_current: ContextVar[QueryStats | None] = ContextVar("db_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started")
+    stats.count += 1
+    if started:
+        stats.seconds += time.perf_counter() - started.pop()
+
+
+def install_query_counter(target: Engine) -> None:
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def current_query_stats() -> QueryStats | None:
+    return _current.get()
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(budget: int) -> Iterator[QueryStats]:
+    with count_queries() as stats:
+        yield stats
+    if stats.count > budget:
+        raise QueryBudgetExceeded(f"{stats.count} queries issued, budget is {budget}")
+
+
+def assert_query_budget(response, budget: int) -> int:
+    count = int(response.headers[QUERY_COUNT_HEADER])
+    if count > budget:
+        raise QueryBudgetExceeded(
+            f"{response.request.method} {response.request.url.path} issued {count} queries, budget is {budget}"
+        )
+    return count
+
+
+class QueryCountMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+        status_code = 0
+
+        async def send_with_stats(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.lower().encode(), str(stats.count).encode()))
+                headers.append((QUERY_TIME_HEADER.lower().encode(), f"{stats.seconds * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            level = logging.WARNING if stats.count > settings.db_query_warn_threshold else logging.DEBUG
+            logger.log(
+                level,
+                "%s %s -> %s: %s queries in %.1fms",
+                scope["method"],
+                scope["path"],
+                status_code,
+                stats.count,
+                stats.seconds * 1000,
+            )
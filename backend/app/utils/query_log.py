@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import wraps
+from typing import TYPE_CHECKING
+
+from app.utils.metrics import current_run_type
+from app.utils.settings import get_settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+settings = get_settings()
+
+# The warm-up replays the hottest statements; counting those runs would keep them hot forever.
+UNTRACKED_RUN_TYPES = frozenset({"warmup"})
+HALF_LIFE_S = settings.hotness_half_life_h * 3600
+
+
+def spec_hash(pandas_query: str | None, chart_config: dict | None) -> str:
+    spec = {"pandas_query": pandas_query, "chart_config": chart_config}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def access_hotness(at: float) -> float:
+    return at / HALF_LIFE_S
+
+
+# Forward decay: hotness is log2(sum(2 ** (t / half-life))) over access times t, so two
+# hotness values combine with a log-add and ordering by the stored value ranks by
+# recency-weighted frequency at any later time.
+def add_hotness(left: float | None, right: float | None) -> float | None:
+    if left is None or right is None:
+        return right if left is None else left
+    high, low = max(left, right), min(left, right)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def decayed_count(hotness: float | None, now: float) -> float:
+    # Accesses, each discounted by half per half-life of age.
+    return 0.0 if hotness is None else 2 ** (hotness - access_hotness(now))
+
+
+@dataclass
+class StatementStats:
+    dataset_id: int
+    kind: str
+    spec_hash: str
+    pandas_query: str | None
+    chart_config: dict | None
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    last_at: float = 0.0
+    hotness: float | None = None
+
+    def merge(self, other: "StatementStats") -> None:
+        self.calls += other.calls
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        if other.last_at >= self.last_at:
+            self.rows_in, self.rows_out, self.last_at = other.rows_in, other.rows_out, other.last_at
+        self.hotness = add_hotness(self.hotness, other.hotness)
+
+
+@dataclass
+class DatasetStats:
+    dataset_id: int
+    accesses: int = 0
+    queries: int = 0
+    query_ms: float = 0.0
+    last_at: float = 0.0
+    hotness: float | None = None
+
+    def merge(self, other: "DatasetStats") -> None:
+        self.accesses += other.accesses
+        self.queries += other.queries
+        self.query_ms += other.query_ms
+        self.last_at = max(self.last_at, other.last_at)
+        self.hotness = add_hotness(self.hotness, other.hotness)
+
+
+@dataclass
+class QueryLogBatch:
+    statements: list[StatementStats] = field(default_factory=list)
+    datasets: list[DatasetStats] = field(default_factory=list)
+
+
+# Records every pandas_query, chart aggregation and period comparison with its duration,
+# input/output row counts and dataset id (read from the frame's attrs, set by
+# load_dataframe), plus dataset loads. Counters accumulate in memory until the query stats
+# writer drains them into the database; runs over slow_query_ms are also written to the
+# app.slow_queries logger and kept in a ring for the operator report. Called from worker
+# threads, hence the lock.
+class QueryLog:
+    def __init__(self, slow_query_ms: float, slow_log_size: int) -> None:
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._statements: dict[tuple[int, str, str], StatementStats] = {}
+        self._datasets: dict[int, DatasetStats] = {}
+        self._slow: deque[dict] = deque(maxlen=max(1, slow_log_size))
+        self.recorded = 0
+        self.slow_total = 0
+
+    def _dataset(self, dataset_id: int) -> DatasetStats:
+        stats = self._datasets.get(dataset_id)
+        if stats is None:
+            stats = self._datasets[dataset_id] = DatasetStats(dataset_id)
+        return stats
+
+    def record_access(self, dataset_id: int) -> None:
+        if current_run_type() in UNTRACKED_RUN_TYPES:
+            return
+        now = time.time()
+        with self._lock:
+            stats = self._dataset(dataset_id)
+            stats.accesses += 1
+            stats.last_at = now
+            stats.hotness = add_hotness(stats.hotness, access_hotness(now))
+
+    def record(
+        self,
+        kind: str,
+        df: "pd.DataFrame",
+        pandas_query: str | None,
+        chart_config: dict | None,
+        seconds: float,
+        rows_out: int,
+    ) -> None:
+        if current_run_type() in UNTRACKED_RUN_TYPES:
+            return
+        dataset_id = df.attrs.get("dataset_id")
+        elapsed_ms = seconds * 1000
+        now = time.time()
+        if elapsed_ms >= self.slow_query_ms:
+            self._log_slow(kind, dataset_id, pandas_query, chart_config, elapsed_ms, len(df), rows_out, now)
+        if dataset_id is None:
+            return
+
+        key = (dataset_id, kind, spec_hash(pandas_query, chart_config))
+        with self._lock:
+            self.recorded += 1
+            statement = self._statements.get(key)
+            if statement is None:
+                statement = self._statements[key] = StatementStats(dataset_id, kind, key[2], pandas_query, chart_config)
+            statement.calls += 1
+            statement.total_ms += elapsed_ms
+            statement.max_ms = max(statement.max_ms, elapsed_ms)
+            statement.rows_in, statement.rows_out, statement.last_at = len(df), rows_out, now
+            statement.hotness = add_hotness(statement.hotness, access_hotness(now))
+            dataset = self._dataset(dataset_id)
+            dataset.queries += 1
+            dataset.query_ms += elapsed_ms
+
+    def _log_slow(
+        self,
+        kind: str,
+        dataset_id: int | None,
+        pandas_query: str | None,
+        chart_config: dict | None,
+        elapsed_ms: float,
+        rows_in: int,
+        rows_out: int,
+        at: float,
+    ) -> None:
+        entry = {
+            "at": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+            "kind": kind,
+            "dataset_id": dataset_id,
+            "run_type": current_run_type(),
+            "elapsed_ms": round(elapsed_ms, 1),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "pandas_query": pandas_query,
+            "chart_config": chart_config,
+        }
+        slow_query_logger.warning("slow %s %s", kind, json.dumps(entry, default=str))
+        with self._lock:
+            self.slow_total += 1
+            self._slow.append(entry)
+
+    def slow_queries(self, limit: int) -> list[dict]:
+        with self._lock:
+            return list(self._slow)[-limit:][::-1]
+
+    def drain(self) -> QueryLogBatch:
+        with self._lock:
+            batch = QueryLogBatch(list(self._statements.values()), list(self._datasets.values()))
+            self._statements = {}
+            self._datasets = {}
+        return batch
+
+    def restore(self, batch: QueryLogBatch) -> None:
+        # Puts back a batch whose flush failed, merged with whatever was recorded meanwhile.
+        with self._lock:
+            for statement in batch.statements:
+                key = (statement.dataset_id, statement.kind, statement.spec_hash)
+                current = self._statements.get(key)
+                if current is not None:
+                    statement.merge(current)
+                self._statements[key] = statement
+            for dataset in batch.datasets:
+                current = self._datasets.get(dataset.dataset_id)
+                if current is not None:
+                    dataset.merge(current)
+                self._datasets[dataset.dataset_id] = dataset
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_statements": len(self._statements),
+                "pending_datasets": len(self._datasets),
+                "recorded": self.recorded,
+                "slow": self.slow_total,
+            }
+
+
+query_log = QueryLog(settings.slow_query_ms, settings.slow_query_log_size)
+
+
+def tracked_query(kind: str, describe: Callable[..., tuple[str | None, dict | None] | None]) -> Callable:
+    # describe(df, *args, **kwargs) returns the (pandas_query, chart_config) spec of the call,
+    # or None for calls that run nothing.
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(df: "pd.DataFrame", *args, **kwargs):
+            started = time.perf_counter()
+            result = func(df, *args, **kwargs)
+            elapsed = time.perf_counter() - started
+            spec = describe(df, *args, **kwargs)
+            if spec is not None:
+                query_log.record(kind, df, *spec, elapsed, len(result))
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,151 @@
+import copy
+import difflib
+import keyword
+import re
+from collections import Counter
+from collections.abc import Sequence
+
+from app.utils.safe_query import ALLOWED_AGGREGATIONS, ALLOWED_WORDS
+
+QUOTED_SEGMENT = re.compile(r"(`[^`]*`|'[^']*'|\"[^\"]*\")")
+IDENTIFIER = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\b")
+SMART_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "«": '"', "»": '"'})
+
+AGGREGATION_ALIASES = {
+    "avg": "mean",
+    "average": "mean",
+    "total": "sum",
+    "cnt": "count",
+    "size": "count",
+    "nunique": "count",
+    "count_distinct": "count",
+    "maximum": "max",
+    "minimum": "min",
+}
+
+FUZZY_CUTOFF = 0.75
+
+_rule_counts: Counter[str] = Counter()
+
+
+def get_repair_stats() -> dict[str, int]:
+    return dict(_rule_counts)
+
+
+def _is_plain_identifier(name: str) -> bool:
+    return name.isidentifier() and name.isascii() and not keyword.iskeyword(name)
+
+
+def _match_column(name: str, columns: Sequence[str]) -> str | None:
+    if name in columns:
+        return name
+    lowered = {c.lower(): c for c in columns}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    match = difflib.get_close_matches(name, list(columns), n=1, cutoff=FUZZY_CUTOFF)
+    if match:
+        return match[0]
+    match = difflib.get_close_matches(name.lower(), list(lowered), n=1, cutoff=FUZZY_CUTOFF)
+    return lowered[match[0]] if match else None
+
+
+def _column_ref(column: str) -> str:
+    return column if _is_plain_identifier(column) else f"`{column}`"
+
+
+def _fix_quote_styles(expr: str, columns: Sequence[str]) -> str:
+    expr = expr.translate(SMART_QUOTES)
+    parts = QUOTED_SEGMENT.split(expr)
+    for i in range(1, len(parts), 2):
+        part = parts[i]
+        if part.startswith("`") and _match_column(part[1:-1], columns) is None:
+            parts[i] = "'" + part[1:-1].replace("'", "") + "'"
+    return "".join(parts)
+
+
+def _quote_columns(expr: str, columns: Sequence[str]) -> str:
+    candidates = sorted((c for c in columns if not _is_plain_identifier(c)), key=len, reverse=True)
+    if not candidates:
+        return expr
+    pattern = re.compile("|".join(rf"(?<![\w`]){re.escape(c)}(?![\w`])" for c in candidates))
+    parts = QUOTED_SEGMENT.split(expr)
+    for i in range(0, len(parts), 2):
+        parts[i] = pattern.sub(lambda m: f"`{m.group(0)}`", parts[i])
+    return "".join(parts)
+
+
+def _fuzzy_identifiers(expr: str, columns: Sequence[str]) -> str:
+    def replace(match: re.Match) -> str:
+        word = match.group(1)
+        if word in ALLOWED_WORDS or word in columns:
+            return word
+        column = _match_column(word, columns)
+        return _column_ref(column) if column else word
+
+    parts = QUOTED_SEGMENT.split(expr)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            parts[i] = IDENTIFIER.sub(replace, part)
+        elif part.startswith("`") and part[1:-1] not in columns:
+            column = _match_column(part[1:-1], columns)
+            if column:
+                parts[i] = f"`{column}`"
+    return "".join(parts)
+
+
+def _repair_chart_config(config: dict, columns: Sequence[str], fired: list[str]) -> dict:
+    agg = config.get("aggregation")
+    if isinstance(agg, str) and agg not in ALLOWED_AGGREGATIONS:
+        normalized = agg.strip().lower()
+        normalized = AGGREGATION_ALIASES.get(normalized, normalized)
+        if normalized in ALLOWED_AGGREGATIONS:
+            config["aggregation"] = normalized
+            fired.append("aggregation_alias")
+        else:
+            config["aggregation"] = None
+            fired.append("aggregation_dropped")
+
+    # Unmatched axes end up where sanitize_chart_config would put them: x on the first
+    # column, y dropped so the sanitiser picks another one.
+    for axis in ("x", "y"):
+        value = config.get(axis)
+        if value is None or value in columns:
+            continue
+        column = _match_column(value, columns) if isinstance(value, str) else None
+        if column:
+            config[axis] = column
+            fired.append("chart_column_fuzzy")
+        elif axis == "x":
+            config[axis] = columns[0] if columns else None
+            fired.append("chart_column_fallback")
+        else:
+            config[axis] = None
+            fired.append("chart_column_dropped")
+    return config
+
+
+def repair_query_output(output: dict, columns: Sequence[str]) -> tuple[dict, list[str]]:
+    repaired = copy.deepcopy(output)
+    fired: list[str] = []
+
+    query = repaired.get("pandas_query")
+    if isinstance(query, str) and query.strip():
+        steps = (
+            ("quote_style", _fix_quote_styles),
+            ("backtick_column", _quote_columns),
+            ("fuzzy_identifier", _fuzzy_identifiers),
+        )
+        for rule, step in steps:
+            updated = step(query, columns)
+            if updated != query:
+                fired.append(rule)
+                query = updated
+        repaired["pandas_query"] = query
+
+    chart_config = repaired.get("chart_config")
+    if isinstance(chart_config, dict):
+        repaired["chart_config"] = _repair_chart_config(chart_config, columns, fired)
+
+    for rule in fired:
+        _rule_counts[rule] += 1
+    return repaired, fired
@@ -1,8 +1,13 @@
 import json
 import re
 from collections.abc import Sequence
+from typing import TYPE_CHECKING
 
-import pandas as pd
+from app.utils.metrics import timed_stage
+from app.utils.query_log import tracked_query
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class SafeQueryError(ValueError):
@@ -22,23 +27,34 @@ FORBIDDEN_TOKENS = {
 }
 
 ALLOWED_OPERATORS = r"^[a-zA-Z0-9_\s\(\)\[\]\'\"\>\<\=\!\&\|\+\-\*\./,]+$"
+ALLOWED_WORDS = {"and", "or", "not", "in", "True", "False", "None"}
+ALLOWED_AGGREGATIONS = {"sum", "mean", "count", "max", "min"}
 
 
-def _validate_query_expression(expr: str, columns: Sequence[str]) -> None:
+def validate_query_expression(expr: str, columns: Sequence[str]) -> None:
     if len(expr) > 500:
         raise SafeQueryError("Query too long")
     lowered = expr.lower()
     if any(token in lowered for token in FORBIDDEN_TOKENS):
         raise SafeQueryError("Query contains forbidden token")
-    if not re.match(ALLOWED_OPERATORS, expr):
+    allowed_columns = set(columns)
+    for quoted in re.findall(r"`([^`]*)`", expr):
+        if quoted not in allowed_columns:
+            raise SafeQueryError(f"Unknown identifier in query: {quoted}")
+
+    # Backtick-quoted names were checked above; everything else, string literals included,
+    # must stay within the character whitelist (no backslash escapes, no @ references).
+    unquoted = re.sub(r"`[^`]*`", " ", expr)
+    if not re.match(ALLOWED_OPERATORS, unquoted):
         raise SafeQueryError("Query contains unsupported characters")
 
-    scrubbed = re.sub(r"'[^']*'|\"[^\"]*\"", "", expr)
+    scrubbed = re.sub(r"'[^']*'|\"[^\"]*\"", "", unquoted)
+    if re.search(r"\.\s*[A-Za-z_]", scrubbed):
+        raise SafeQueryError("Query contains attribute access")
+
     bad_identifiers = re.findall(r"\b([A-Za-z_][A-Za-z0-9_]*)\b", scrubbed)
-    allowed_words = {"and", "or", "not", "in", "True", "False", "None"}
-    allowed_columns = set(columns)
     for identifier in bad_identifiers:
-        if identifier in allowed_words or identifier in allowed_columns:
+        if identifier in ALLOWED_WORDS or identifier in allowed_columns:
             continue
         raise SafeQueryError(f"Unknown identifier in query: {identifier}")
 
@@ -58,17 +74,22 @@ def sanitize_chart_config(config: dict[str, str | None], columns: Sequence[str])
     if y not in columns:
         numeric_fallback = next((c for c in columns if c != x), None)
         y = numeric_fallback
-    if agg and agg not in {"sum", "mean", "count", "max", "min"}:
+    if agg and agg not in ALLOWED_AGGREGATIONS:
         agg = None
 
     return {"type": chart_type, "x": x, "y": y, "aggregation": agg}
 
 
-def execute_safe_query(df: pd.DataFrame, pandas_query: str | None) -> pd.DataFrame:
+@timed_stage("execute_query")
+@tracked_query("query", lambda df, pandas_query: (pandas_query, None) if pandas_query else None)
+def execute_safe_query(df: "pd.DataFrame", pandas_query: str | None) -> "pd.DataFrame":
     if not pandas_query:
         return df
-    _validate_query_expression(pandas_query, list(df.columns))
-    return df.query(pandas_query, engine="python")
+    validate_query_expression(pandas_query, list(df.columns))
+    filtered = df.query(pandas_query, engine="python")
+    # Lets the query log attribute a chart built from this frame to the filter that produced it.
+    filtered.attrs["pandas_query"] = pandas_query
+    return filtered
 
 
 def parse_json_payload(text: str) -> dict:
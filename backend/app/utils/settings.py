@@ -5,13 +5,64 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./data/mini_bi.db"
+    database_async: bool = False
+    storage_profile: str = "production"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size_mb: int = 256
+    sqlite_cache_size_mb: int = 64
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_s: float = 30.0
+    db_pool_recycle_s: int = 1800
+    db_query_warn_threshold: int = 25
+    identity_cache_ttl_s: float = 300.0
+    identity_cache_max_entries: int = 10000
+    public_cache_ttl_s: float = 30.0
+    public_cache_max_entries: int = 1000
+    widget_cache_max_entries: int = 2000
+    dataframe_cache_mb: int = 256
+    compression_min_bytes: int = 500
+    dashboard_event_history: int = 200
+    dashboard_event_heartbeat_s: float = 15.0
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01
+    profiling_token: str = ""
+    profiling_mode: str = "sampling"
+    profiling_interval_ms: float = 5.0
+    profiling_max_s: float = 60.0
+    profiling_dir: str = "./data/profiles"
     ollama_base_url: str = "http://localhost:11434"
+    ollama_base_urls: str = ""
+    ollama_health_interval_s: float = 15.0
+    ollama_unhealthy_after: int = 2
     ollama_model: str = "kimi-k2.5:cloud"
     telegram_bot_token: str = ""
     max_file_size_mb: int = 10
     max_rows: int = 100000
     upload_dir: str = "./data/uploads"
     llm_max_attempts: int = 4
+    llm_timeout_s: float = 60.0
+    llm_breaker_threshold: int = 5
+    llm_breaker_reset_s: float = 30.0
+    llm_max_concurrency: int = 2
+    llm_queue_max: int = 32
+    background_workers: int = 2
+    profile_precompute: bool = True
+    db_auto_migrate: bool = True
+    warmup_enabled: bool = True
+    warmup_datasets: int = 5
+    warmup_aggregates: int = 20
+    slow_query_ms: float = 250.0
+    slow_query_log_size: int = 200
+    query_stats_flush_interval_s: float = 10.0
+    query_stats_max_retries: int = 3
+    ops_token: str = ""
+    hotness_half_life_h: float = 24.0
+    ai_run_batch_size: int = 50
+    ai_run_flush_interval_s: float = 1.0
+    ai_run_max_buffered: int = 10000
+    ai_run_max_retries: int = 3
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
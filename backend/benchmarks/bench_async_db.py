@@ -0,0 +1,150 @@
+"""Compare DB access strategies under concurrent simulated AI requests.
+
+Each simulated request does what the AI endpoints do around the LLM call:
+load the dataset, wait for the model, store the AIRun. Modes:
+
+  sync      - plain Session used directly on the event loop (the old behaviour);
+              keep --concurrency within the connection pool size (5 + 10 overflow),
+              beyond it the blocking pool checkout stalls the loop for good
+  threaded  - ThreadedSession: sync Session offloaded to the threadpool
+  native    - AsyncSession on aiosqlite/asyncpg
+
+Usage (from backend/):
+  python -m benchmarks.bench_async_db --requests 200 --concurrency 12 --llm-ms 200
+  python -m benchmarks.bench_async_db --requests 500 --concurrency 100 --modes threaded,native
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def _configure_env() -> None:
+    tmp = tempfile.mkdtemp(prefix="bench_async_db_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+    os.environ["DATABASE_ASYNC"] = "true"
+    os.environ["UPLOAD_DIR"] = f"{tmp}/uploads"
+
+
+async def _lag_probe(stop: asyncio.Event, samples: list[float], interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def _run_mode(mode: str, dataset_id: int, args: argparse.Namespace) -> dict:
+    from app.models.database import AsyncSessionLocal, SessionLocal, ThreadedSession
+    from app.services.async_service import AsyncService
+    from app.services.dataset_service import DatasetService
+
+    def simulate_db_work(service: DatasetService) -> None:
+        dataset = service.get_dataset(dataset_id, args.telegram_id)
+        service.save_ai_run(
+            dataset=dataset,
+            telegram_id=args.telegram_id,
+            run_type="query",
+            response={"answer": "bench", "pandas_query": "", "chart_config": {}, "chart_data": []},
+            question="bench",
+        )
+
+    async def one_request() -> float:
+        started = time.perf_counter()
+        if mode == "sync":
+            with SessionLocal(expire_on_commit=False) as session:
+                service = DatasetService(session)
+                dataset = service.get_dataset(dataset_id, args.telegram_id)
+                await asyncio.sleep(args.llm_ms / 1000)
+                service.save_ai_run(
+                    dataset=dataset,
+                    telegram_id=args.telegram_id,
+                    run_type="query",
+                    response={"answer": "bench", "pandas_query": "", "chart_config": {}, "chart_data": []},
+                    question="bench",
+                )
+        else:
+            if mode == "threaded":
+                session = SessionLocal(expire_on_commit=False)
+                db = ThreadedSession(session)
+            else:
+                session = AsyncSessionLocal()
+                db = session
+            try:
+                service = AsyncService(DatasetService, db)
+                await service.get_dataset(dataset_id, args.telegram_id)
+                await asyncio.sleep(args.llm_ms / 1000)
+                await service.run(simulate_db_work)
+            finally:
+                if mode == "threaded":
+                    session.close()
+                else:
+                    await session.close()
+        return time.perf_counter() - started
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded() -> float:
+        async with semaphore:
+            return await one_request()
+
+    stop = asyncio.Event()
+    lag: list[float] = []
+    probe = asyncio.create_task(_lag_probe(stop, lag))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(bounded() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    latencies = sorted(latencies)
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "loop_lag_max_ms": round(max(lag, default=0.0) * 1000, 1),
+        "loop_lag_p95_ms": round(sorted(lag)[int(len(lag) * 0.95) - 1] * 1000, 1) if lag else 0.0,
+    }
+
+
+def _seed_dataset(telegram_id: int) -> int:
+    from app.models.database import SessionLocal
+    from app.models.migrations import migrate
+    from app.services.dataset_service import DatasetService
+
+    migrate()
+    csv = "region,price\n" + "\n".join(f"r{i % 5},{i}" for i in range(100))
+    with SessionLocal() as session:
+        return DatasetService(session).upload_csv(telegram_id, "bench.csv", csv.encode()).id
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--llm-ms", type=float, default=200.0)
+    parser.add_argument("--modes", default="sync,threaded,native")
+    parser.add_argument("--telegram-id", type=int, default=1)
+    args = parser.parse_args()
+
+    _configure_env()
+    dataset_id = _seed_dataset(args.telegram_id)
+    from app.models.database import dispose_async_engine
+
+    for mode in args.modes.split(","):
+        print(json.dumps(await _run_mode(mode.strip(), dataset_id, args)))
+    await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""Measure cold-start cost: importing app.main, booting a worker, and its first requests.
+
+import      time to `import app.main` in a fresh interpreter (median of --imports runs),
+            and whether pandas / httpx were pulled in by it
+boot        process start until /health answers, for the first boot on an empty database
+            and for a restart on the now-initialised one (the deploy case); ready is when
+            /ready stops answering 503, i.e. once the startup warm-up has finished
+first_*     latency of the first request of each kind after the restart is ready: a dashboard
+            list (no analytics) and an AI query against a deterministic fake Ollama
+
+Pass --backend-dir to measure another checkout (e.g. a git worktree of the previous
+release) with the same script.
+
+Usage (from backend/):
+  python -m benchmarks.bench_cold_start
+  git worktree add /tmp/before HEAD~1 && python -m benchmarks.bench_cold_start --backend-dir /tmp/before/backend
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fake_ollama import FakeOllamaServer  # noqa: E402
+from benchmarks.synthetic import synthetic_csv  # noqa: E402
+
+IMPORT_PROBE = (
+    "import sys, time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started, 'pandas' in sys.modules, 'httpx' in sys.modules)"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _measure_import(backend_dir: Path, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=backend_dir, capture_output=True, text=True, check=True
+        ).stdout.split()
+        samples.append(float(output[0]))
+    return {
+        "import_ms": round(statistics.median(samples) * 1000, 1),
+        "imports_pandas": output[1] == "True",
+        "imports_httpx": output[2] == "True",
+    }
+
+
+def _wait_ready(url: str, started: float) -> float:
+    # Checkouts without /ready (404) count as ready as soon as they are healthy.
+    while httpx.get(f"{url}/ready", timeout=5).status_code == 503:
+        time.sleep(0.01)
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _boot(backend_dir: Path, env: dict) -> tuple[subprocess.Popen, str, float, float]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                healthy_ms = round((time.perf_counter() - started) * 1000, 1)
+                return process, url, healthy_ms, _wait_ready(url, started)
+        except httpx.HTTPError:
+            time.sleep(0.01)
+
+
+def _stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    process.wait(timeout=30)
+
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    response = fn()
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url} returned {response.status_code}: {response.text}")
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend-dir", type=Path, default=Path(__file__).resolve().parents[1])
+    parser.add_argument("--imports", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--telegram-id", type=int, default=1)
+    args = parser.parse_args()
+
+    backend_dir = args.backend_dir.resolve()
+    result = _measure_import(backend_dir, args.imports)
+
+    tmp = tempfile.mkdtemp(prefix="bench_cold_start_")
+    ollama = FakeOllamaServer().start()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp}/cold.db",
+        "UPLOAD_DIR": f"{tmp}/uploads",
+        "OLLAMA_BASE_URL": ollama.url,
+        "OLLAMA_BASE_URLS": "",
+        "PROFILE_PRECOMPUTE": "false",
+    }
+    user = {"telegram_id": args.telegram_id}
+    try:
+        process, url, result["first_boot_ms"], _ = _boot(backend_dir, env)
+        with httpx.Client(base_url=url, timeout=60) as client:
+            upload = client.post(
+                "/api/datasets/upload",
+                data={"telegram_id": str(args.telegram_id)},
+                files={"file": ("cold.csv", synthetic_csv(args.rows), "text/csv")},
+            )
+            dataset_id = upload.json()["id"]
+            client.post(f"/api/ai/query/{dataset_id}", params=user, json={"question": "Total amount by region"})
+        _stop(process)
+
+        process, url, result["restart_boot_ms"], result["restart_ready_ms"] = _boot(backend_dir, env)
+        try:
+            with httpx.Client(base_url=url, timeout=60) as client:
+                result["first_dashboard_list_ms"] = _timed(lambda: client.get("/api/dashboards", params=user))
+                result["first_ai_query_ms"] = _timed(
+                    lambda: client.post(f"/api/ai/query/{dataset_id}", params=user, json={"question": "Amount by category"})
+                )
+                result["second_ai_query_ms"] = _timed(
+                    lambda: client.post(f"/api/ai/query/{dataset_id}", params=user, json={"question": "Quantity by region"})
+                )
+        finally:
+            _stop(process)
+    finally:
+        ollama.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
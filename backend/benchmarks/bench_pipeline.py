@@ -0,0 +1,191 @@
+"""Benchmark the dataset and AI query pipeline on synthetic CSVs.
+
+For every shape (narrow, wide) and row count the suite times:
+
+  upload_csv          DatasetService.upload_csv (write, parse, infer schema, insert)
+  load_dataframe      reading the stored CSV back (frame cache cleared each run)
+  execute_safe_query  the validated pandas filter used by /ai/query
+  build_chart_data    the grouped bar chart built from the filtered frame
+  compare_periods     the month-over-month comparison series
+  ai_query            POST /api/ai/query end to end, against a deterministic fake Ollama
+                      (the dataset is in the frame cache, as for a returning user)
+
+Each case runs once untimed to warm caches, then --repeat times. Both the median and the
+best run are recorded; regressions are judged on the best run, which is far less sensitive
+to scheduler noise on shared CI machines than the median. Datasets come from
+benchmarks.synthetic with a fixed seed, so runs on the same machine are comparable.
+
+Baselines live in benchmarks/baselines/. Record one on a quiet machine with --save-baseline,
+then run with --compare in review: a case fails when its best run is more than --tolerance
+slower than the baseline and the difference is above --min-delta-ms (to ignore noise on the
+millisecond-scale cases). The exit code is 1 when any case regressed.
+
+Usage (from backend/):
+  python -m benchmarks.bench_pipeline --sizes 1000,10000 --compare
+  python -m benchmarks.bench_pipeline --save-baseline
+  python -m benchmarks.bench_pipeline --sizes 1000000 --shapes wide --repeat 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fake_ollama import FakeOllamaServer  # noqa: E402
+from benchmarks.synthetic import SHAPES, synthetic_csv  # noqa: E402
+
+CASES = ("upload_csv", "load_dataframe", "execute_safe_query", "build_chart_data", "compare_periods", "ai_query")
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "pipeline.json"
+QUERY = "amount > 250 and quantity >= 2"
+CHART_CONFIG = {"type": "bar", "x": "region", "y": "amount", "aggregation": "sum"}
+QUESTION = "Total amount by region"
+
+
+def _configure_env(tmp: str, ollama_url: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["UPLOAD_DIR"] = f"{tmp}/uploads"
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    os.environ["OLLAMA_BASE_URLS"] = ""
+    os.environ["PROFILE_PRECOMPUTE"] = "false"
+    os.environ["MAX_ROWS"] = str(10_000_000)
+    os.environ["MAX_FILE_SIZE_MB"] = str(4096)
+
+
+def _time(fn: Callable[[], object], repeat: int) -> dict:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+    }
+
+
+def _bench_dataset(client, shape: str, rows: int, args: argparse.Namespace) -> dict[str, dict]:
+    from app.models.database import SessionLocal
+    from app.services.dataset_service import DatasetService, load_dataframe
+    from app.services.frame_cache import frame_cache
+    from app.utils.charts import build_chart_data, build_comparison_data
+    from app.utils.safe_query import execute_safe_query
+
+    payload = synthetic_csv(rows, shape, args.seed)
+    uploaded = []
+
+    def upload() -> None:
+        with SessionLocal(expire_on_commit=False) as session:
+            uploaded.append(DatasetService(session).upload_csv(args.telegram_id, f"{shape}_{rows}.csv", payload))
+
+    def ask() -> None:
+        response = client.post(f"/api/ai/query/{dataset.id}?telegram_id={args.telegram_id}", json={"question": QUESTION})
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/ai/query returned {response.status_code}: {response.text}")
+
+    results = {"upload_csv": _time(upload, args.repeat)}
+    dataset = uploaded[-1]
+    # Cold read from disk; the in-process frame cache would otherwise answer every repeat.
+    results["load_dataframe"] = _time(lambda: (frame_cache.clear(), load_dataframe(dataset)), args.repeat)
+    df = load_dataframe(dataset)
+    results["execute_safe_query"] = _time(lambda: execute_safe_query(df, QUERY), args.repeat)
+    filtered = execute_safe_query(df, QUERY)
+    results["build_chart_data"] = _time(lambda: build_chart_data(filtered, CHART_CONFIG), args.repeat)
+    results["compare_periods"] = _time(lambda: build_comparison_data(df, "date", "amount", "month"), args.repeat)
+    results["ai_query"] = _time(ask, args.repeat)
+    for stored in uploaded:
+        Path(stored.file_path).unlink(missing_ok=True)
+    return results
+
+
+def _machine() -> dict:
+    import pandas as pd
+
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _compare(results: dict[str, dict], baseline: dict, args: argparse.Namespace) -> list[str]:
+    if baseline["meta"]["machine"] != _machine():
+        print(f"warning: baseline was recorded on {baseline['meta']['machine']}, timings may not be comparable")
+    regressions = []
+    print(f"{'case':45} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for key, current in results.items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"{key:45} {'-':>12} {current['min_ms']:12.2f} {'new':>8}")
+            continue
+        change = current["min_ms"] / before["min_ms"] - 1 if before["min_ms"] else 0.0
+        regressed = change > args.tolerance and current["min_ms"] - before["min_ms"] > args.min_delta_ms
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:45} {before['min_ms']:12.2f} {current['min_ms']:12.2f} {change:+8.1%}{flag}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--shapes", default=",".join(SHAPES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--telegram-id", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    shapes = [shape.strip() for shape in args.shapes.split(",")]
+    tmp = tempfile.mkdtemp(prefix="bench_pipeline_")
+    ollama = FakeOllamaServer().start()
+    _configure_env(tmp, ollama.url)
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    results: dict[str, dict] = {}
+    try:
+        with TestClient(app) as client:
+            for shape in shapes:
+                for rows in sizes:
+                    for case, timing in _bench_dataset(client, shape, rows, args).items():
+                        key = f"{shape}/{rows}/{case}"
+                        results[key] = timing
+                        print(json.dumps({"case": key, **timing}), flush=True)
+    finally:
+        ollama.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = _compare(results, baseline, args)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+    if args.save_baseline:
+        meta = {"machine": _machine(), "repeat": args.repeat, "seed": args.seed, "query": QUERY, "chart_config": CHART_CONFIG}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"meta": meta, "results": results}, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Concurrency benchmark for the SQLite storage profile and the composite indexes.
+
+Part 1 runs a mixed workload against a fresh database for each pragma set. Writer threads
+insert AI runs and comments, the way save_ai_run and add_comment do, one commit per row.
+Reader threads run the AI history query. Each configuration adds one setting on top of the
+previous, so every row shows what that setting buys.
+
+Part 2 fills ai_runs and times the hot lookups (latest profile, cached query, history)
+with and without the composite indexes.
+
+Usage (from backend/):
+  python -m benchmarks.bench_storage_profile --writers 8 --readers 4 --seconds 5 --dir ./data
+"""
+
+import argparse
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, event, insert, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app.models.database import Base  # noqa: E402
+from app.models.entities import AIRun, Dashboard, DashboardComment, Dataset, User  # noqa: E402
+
+PROFILES: list[tuple[str, list[str], float]] = [
+    ("default (rollback journal, FULL)", [], 5.0),
+    ("+ WAL", ["PRAGMA journal_mode=WAL"], 5.0),
+    ("+ synchronous=NORMAL", ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"], 5.0),
+    ("  (same, no busy timeout)", ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA busy_timeout=0"], 0.0),
+    (
+        "+ busy_timeout, mmap, cache",
+        [
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA busy_timeout=5000",
+            "PRAGMA mmap_size=268435456",
+            "PRAGMA cache_size=-65536",
+            "PRAGMA temp_store=MEMORY",
+        ],
+        5.0,
+    ),
+]
+
+HISTORY_SQL = text(
+    "SELECT id, question, answer, chart_type, row_count, attempts, created_at FROM ai_runs "
+    "WHERE dataset_id = :d AND run_type = 'query' ORDER BY created_at DESC, id DESC LIMIT 50"
+)
+PROFILE_SQL = text(
+    "SELECT response_json FROM ai_runs WHERE dataset_id = :d AND run_type = 'profile' ORDER BY created_at DESC LIMIT 1"
+)
+CACHED_SQL = text(
+    "SELECT response_json FROM ai_runs WHERE dataset_id = :d AND run_type = 'query' AND question = :q "
+    "ORDER BY created_at DESC LIMIT 1"
+)
+COMPOSITE_INDEXES = ["ix_ai_runs_dataset_type_created"]
+
+
+def _make_engine(path: str, pragmas: list[str], timeout: float):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": timeout},
+        pool_size=32,
+        max_overflow=0,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def _seed(engine, datasets: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "telegram_id": 1}])
+        conn.execute(
+            insert(Dataset),
+            [
+                {"id": i, "user_id": 1, "name": "d", "file_path": "x", "row_count": 1, "column_count": 1, "schema_json": "[]", "sample_json": "[]"}
+                for i in range(1, datasets + 1)
+            ],
+        )
+        conn.execute(insert(Dashboard), [{"id": 1, "user_id": 1, "dataset_id": 1, "config_json": "{}"}])
+
+
+def _run_mixed(name: str, pragmas: list[str], timeout: float, args: argparse.Namespace) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench_storage_", dir=args.dir)
+    engine = _make_engine(f"{tmp}/bench.db", pragmas, timeout)
+    _seed(engine, datasets=20)
+    payload = "x" * args.payload_bytes
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    write_latency: list[float] = []
+    read_latency: list[float] = []
+    errors = {"locked": 0}
+
+    def writer(worker: int) -> None:
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    if i % 4:
+                        conn.execute(
+                            insert(AIRun),
+                            {"user_id": 1, "dataset_id": 1 + (worker + i) % 20, "run_type": "query", "question": f"q{i}", "response_json": payload, "error_log": "[]", "attempts": 1},
+                        )
+                    else:
+                        conn.execute(insert(DashboardComment), {"dashboard_id": 1, "user_id": 1, "text": "comment"})
+            except OperationalError:
+                with lock:
+                    errors["locked"] += 1
+                continue
+            with lock:
+                write_latency.append(time.perf_counter() - started)
+
+    def reader(worker: int) -> None:
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(HISTORY_SQL, {"d": 1 + (worker + i) % 20}).fetchall()
+            except OperationalError:
+                with lock:
+                    errors["locked"] += 1
+                continue
+            with lock:
+                read_latency.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(r,)) for r in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    def p95(values: list[float]) -> float:
+        return round(sorted(values)[int(len(values) * 0.95) - 1] * 1000, 2) if values else 0.0
+
+    return {
+        "profile": name,
+        "writes_per_s": round(len(write_latency) / args.seconds),
+        "write_p50_ms": round(statistics.median(write_latency) * 1000, 2) if write_latency else 0.0,
+        "write_p95_ms": p95(write_latency),
+        "reads_per_s": round(len(read_latency) / args.seconds),
+        "read_p95_ms": p95(read_latency),
+        "locked_errors": errors["locked"],
+    }
+
+
+def _time_query(engine, sql, params: list[dict]) -> float:
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        for p in params:
+            conn.execute(sql, p).fetchall()
+        return (time.perf_counter() - started) / len(params) * 1000
+
+
+def _run_indexes(args: argparse.Namespace) -> list[dict]:
+    tmp = tempfile.mkdtemp(prefix="bench_indexes_", dir=args.dir)
+    engine = _make_engine(f"{tmp}/bench.db", PROFILES[-1][1], 5.0)
+    _seed(engine, datasets=args.index_datasets)
+    base = datetime(2024, 1, 1)
+    rows = [
+        {
+            "user_id": 1,
+            "dataset_id": 1 + i % args.index_datasets,
+            "run_type": ("query", "query", "query", "explain", "profile")[i % 5],
+            "question": f"question {i % 500}",
+            "response_json": "{}",
+            "error_log": "[]",
+            "attempts": 1,
+            "created_at": base + timedelta(seconds=i),
+        }
+        for i in range(args.index_rows)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(AIRun), rows)
+        conn.execute(text("ANALYZE"))
+
+    samples = [{"d": 1 + i % args.index_datasets, "q": f"question {i % 500}"} for i in range(200)]
+    queries = [("latest profile", PROFILE_SQL), ("cached query", CACHED_SQL), ("history", HISTORY_SQL)]
+    results = []
+    with_indexes = {name: _time_query(engine, sql, samples) for name, sql in queries}
+    with engine.begin() as conn:
+        for index in COMPOSITE_INDEXES:
+            conn.execute(text(f"DROP INDEX {index}"))
+        conn.execute(text("ANALYZE"))
+    for name, sql in queries:
+        results.append(
+            {
+                "query": name,
+                "rows": args.index_rows,
+                "without_composite_ms": round(_time_query(engine, sql, samples), 3),
+                "with_composite_ms": round(with_indexes[name], 3),
+            }
+        )
+    engine.dispose()
+    shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--payload-bytes", type=int, default=4096)
+    parser.add_argument("--index-rows", type=int, default=200_000)
+    parser.add_argument("--index-datasets", type=int, default=200)
+    parser.add_argument("--skip-indexes", action="store_true")
+    parser.add_argument("--dir", default=None, help="Directory for the scratch databases; use the data volume to measure real fsync cost")
+    args = parser.parse_args()
+
+    for name, pragmas, timeout in PROFILES:
+        print(_run_mixed(name, pragmas, timeout, args))
+    if not args.skip_indexes:
+        for row in _run_indexes(args):
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
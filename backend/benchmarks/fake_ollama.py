@@ -0,0 +1,244 @@
+"""Local stand-in for the Ollama HTTP API, for benchmarks and load tests.
+
+Serves /api/tags (backend health checks), /api/generate and /stats (request counters).
+The generate response is picked from the prompt template (query, dashboard, explanation,
+profile), so the app's prompts work unchanged.
+
+With the default config it answers instantly with fixed output. For capacity planning it
+can add latency drawn from a distribution, fail a share of requests with HTTP 500, return
+output that is not valid JSON, and stream the response as NDJSON chunks when the request
+sets "stream": true, as Ollama does. Random choices use a seeded generator, so a run
+with the same config and request order behaves the same.
+
+Latency distributions (--latency-ms is the fixed value, mean or median):
+  fixed      always --latency-ms
+  uniform    --latency-ms +/- --jitter-ms
+  normal     mean --latency-ms, standard deviation --jitter-ms, floored at 0
+  lognormal  median --latency-ms, sigma --jitter-ms / --latency-ms (long right tail,
+             closest to real model latency)
+
+Usage (from backend/):
+  python -m benchmarks.fake_ollama --port 11500
+  python -m benchmarks.fake_ollama --port 11500 --latency lognormal --latency-ms 1500 --jitter-ms 600 \
+      --failure-rate 0.02 --invalid-json-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+STREAM_CHUNK_CHARS = 24
+
+QUERY_OUTPUT = {
+    "answer": "Sales are concentrated in two regions.",
+    "pandas_query": "amount > 250 and quantity >= 2",
+    "chart_config": {"type": "bar", "x": "region", "y": "amount", "aggregation": "sum"},
+}
+DASHBOARD_OUTPUT = {
+    "widgets": [
+        {"title": "Amount by region", "question": "Total amount by region"},
+        {"title": "Top categories", "question": "Amount by category"},
+    ]
+}
+EXPLAIN_OUTPUT = {"explanation": "Totals are stable across periods."}
+PROFILE_OUTPUT = {
+    "summary": "Synthetic sales dataset.",
+    "insights": ["Amounts are right-skewed.", "Regions are evenly sampled."],
+    "suggested_visualizations": [],
+}
+
+
+@dataclass
+class FakeOllamaConfig:
+    latency: str = "fixed"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+    invalid_json_rate: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {self.latency}")
+
+
+def sample_latency_s(config: FakeOllamaConfig, rng: random.Random) -> float:
+    if config.latency == "uniform":
+        value = rng.uniform(config.latency_ms - config.jitter_ms, config.latency_ms + config.jitter_ms)
+    elif config.latency == "normal":
+        value = rng.gauss(config.latency_ms, config.jitter_ms)
+    elif config.latency == "lognormal" and config.latency_ms > 0:
+        value = config.latency_ms * math.exp(rng.gauss(0.0, config.jitter_ms / config.latency_ms))
+    else:
+        value = config.latency_ms
+    return max(0.0, value) / 1000
+
+
+def model_output(prompt: str) -> dict:
+    if "widgets" in prompt:
+        return DASHBOARD_OUTPUT
+    if "pandas_query" in prompt:
+        return QUERY_OUTPUT
+    if "explanation" in prompt:
+        return EXPLAIN_OUTPUT
+    return PROFILE_OUTPUT
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server: "FakeOllamaServer"
+    # Headers and body go out as separate writes; without TCP_NODELAY, Nagle plus delayed
+    # ACKs add ~40 ms to every response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, model: str | None, text: str, latency_s: float) -> None:
+        chunks = [text[i : i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for chunk in chunks:
+            time.sleep(latency_s / len(chunks))
+            line = {"model": model, "response": chunk, "done": False}
+            self.wfile.write(json.dumps(line).encode() + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n")
+
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "fake"}]})
+        elif self.path == "/stats":
+            self._send_json(self.server.stats())
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, 404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        latency_s, outcome = self.server.plan_request()
+        if outcome == "failure":
+            time.sleep(latency_s)
+            self._send_json({"error": "fake failure"}, 500)
+            return
+
+        text = json.dumps(model_output(request.get("prompt", "")))
+        if outcome == "invalid_json":
+            text = text[: len(text) // 2]
+        if request.get("stream"):
+            self._send_stream(request.get("model"), text, latency_s)
+            return
+        time.sleep(latency_s)
+        self._send_json({"model": request.get("model"), "response": text, "done": True})
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: FakeOllamaConfig | None = None) -> None:
+        super().__init__((host, port), FakeOllamaHandler)
+        self.config = config or FakeOllamaConfig()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.invalid_json = 0
+        self._rng = random.Random(self.config.seed)
+        self._thread: threading.Thread | None = None
+
+    def plan_request(self) -> tuple[float, str]:
+        # Drawn under the lock so the sequence of outcomes depends only on the seed and
+        # the order requests arrive in.
+        with self.lock:
+            self.calls += 1
+            latency_s = sample_latency_s(self.config, self._rng)
+            roll = self._rng.random()
+            if roll < self.config.failure_rate:
+                self.failures += 1
+                return latency_s, "failure"
+            if roll < self.config.failure_rate + self.config.invalid_json_rate:
+                self.invalid_json += 1
+                return latency_s, "invalid_json"
+            return latency_s, "ok"
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients that give up mid-response (timeouts, app shutdown) are expected under load.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"calls": self.calls, "failures": self.failures, "invalid_json": self.invalid_json, "config": asdict(self.config)}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--invalid-json-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeOllamaConfig:
+    return FakeOllamaConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        invalid_json_rate=args.invalid_json_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, config_from_args(args))
+    print(f"fake Ollama listening on {server.url} with {asdict(server.config)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
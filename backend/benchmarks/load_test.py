@@ -0,0 +1,278 @@
+"""Concurrent load test of the real FastAPI app with simulated Telegram users.
+
+Each virtual user walks the Mini App flow: upload a CSV, then for every iteration ask
+--questions AI queries, generate a dashboard from a prompt, save it, open it, post
+--comments comments, list them and refresh the widgets. Users start spread over --ramp-s
+and pause up to --think-ms between steps.
+
+By default the app is started as a uvicorn subprocess on a temporary SQLite database and
+pointed at an in-process fake Ollama (benchmarks.fake_ollama), whose latency, failure and
+invalid-JSON rates come from the same flags as the standalone fake. With --target the test
+runs against an already running deployment instead, using whatever Ollama it is configured
+with.
+
+The report lists, per endpoint: requests, errors (HTTP >= 400 or transport failures),
+error rate, throughput and latency percentiles.
+
+Usage (from backend/):
+  python -m benchmarks.load_test --users 50 --iterations 2 --latency lognormal --latency-ms 800 --jitter-ms 300
+  python -m benchmarks.load_test --users 20 --failure-rate 0.05 --invalid-json-rate 0.05 --json ./data/load.json
+  python -m benchmarks.load_test --target http://localhost:8000 --users 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fake_ollama import FakeOllamaServer, add_config_arguments, config_from_args  # noqa: E402
+from benchmarks.synthetic import synthetic_csv  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+QUESTIONS = ["Total amount by region", "Amount by category", "Quantity by region", "Average amount by region"]
+DASHBOARD_PROMPT = "Sales overview by region and category"
+
+
+class LoadStats:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.statuses: dict[str, Counter[str]] = defaultdict(Counter)
+
+    def record(self, endpoint: str, latency_s: float, status: str, ok: bool) -> None:
+        self.latencies[endpoint].append(latency_s)
+        self.statuses[endpoint][status] += 1
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed_s: float) -> list[dict]:
+        rows = []
+        for endpoint, samples in self.latencies.items():
+            ordered = sorted(samples)
+            rows.append(
+                {
+                    "endpoint": endpoint,
+                    "requests": len(ordered),
+                    "errors": self.errors[endpoint],
+                    "error_rate": round(self.errors[endpoint] / len(ordered), 4),
+                    "rps": round(len(ordered) / elapsed_s, 2),
+                    "p50_ms": _percentile_ms(ordered, 0.50),
+                    "p90_ms": _percentile_ms(ordered, 0.90),
+                    "p99_ms": _percentile_ms(ordered, 0.99),
+                    "max_ms": round(ordered[-1] * 1000, 1),
+                    "statuses": dict(self.statuses[endpoint]),
+                }
+            )
+        return rows
+
+
+def _percentile_ms(ordered: list[float], q: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return round(ordered[index] * 1000, 1)
+
+
+async def _call(
+    client: httpx.AsyncClient, stats: LoadStats, endpoint: str, method: str, url: str, **kwargs
+) -> httpx.Response | None:
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as exc:
+        stats.record(endpoint, time.perf_counter() - started, type(exc).__name__, ok=False)
+        return None
+    stats.record(endpoint, time.perf_counter() - started, str(response.status_code), ok=response.status_code < 400)
+    return response if response.status_code < 400 else None
+
+
+async def _virtual_user(index: int, client: httpx.AsyncClient, stats: LoadStats, args: argparse.Namespace) -> None:
+    rng = random.Random(index)
+    telegram_id = args.telegram_base + index
+
+    async def think() -> None:
+        if args.think_ms > 0:
+            await asyncio.sleep(rng.uniform(0, args.think_ms) / 1000)
+
+    await asyncio.sleep(args.ramp_s * index / max(1, args.users))
+    upload = await _call(
+        client,
+        stats,
+        "POST /api/datasets/upload",
+        "POST",
+        "/api/datasets/upload",
+        data={"telegram_id": str(telegram_id)},
+        files={"file": (f"user_{index}.csv", synthetic_csv(args.rows, "narrow", seed=index), "text/csv")},
+    )
+    if upload is None:
+        return
+    dataset_id = upload.json()["id"]
+    user = {"telegram_id": telegram_id}
+
+    for _ in range(args.iterations):
+        for question in rng.sample(QUESTIONS, k=min(args.questions, len(QUESTIONS))):
+            await think()
+            await _call(
+                client, stats, "POST /api/ai/query/{id}", "POST", f"/api/ai/query/{dataset_id}", params=user, json={"question": question}
+            )
+
+        await think()
+        generated = await _call(
+            client,
+            stats,
+            "POST /api/ai/nl2dashboard/{id}",
+            "POST",
+            f"/api/ai/nl2dashboard/{dataset_id}",
+            params=user,
+            json={"prompt": DASHBOARD_PROMPT},
+        )
+        widgets = generated.json()["widgets"] if generated is not None else []
+        saved = await _call(
+            client,
+            stats,
+            "POST /api/dashboards/save",
+            "POST",
+            "/api/dashboards/save",
+            json={"telegram_id": telegram_id, "dataset_id": dataset_id, "title": "Load test", "config": {"widgets": widgets}},
+        )
+        if saved is None:
+            continue
+        dashboard_id = saved.json()["id"]
+
+        await think()
+        await _call(client, stats, "GET /api/dashboards/{id}", "GET", f"/api/dashboards/{dashboard_id}", params=user)
+        for n in range(args.comments):
+            await think()
+            await _call(
+                client,
+                stats,
+                "POST /api/dashboards/{id}/comments",
+                "POST",
+                f"/api/dashboards/{dashboard_id}/comments",
+                json={"telegram_id": telegram_id, "text": f"Comment {n} from user {index}"},
+            )
+        await _call(
+            client, stats, "GET /api/dashboards/{id}/comments", "GET", f"/api/dashboards/{dashboard_id}/comments", params=user
+        )
+        await think()
+        await _call(
+            client, stats, "POST /api/dashboards/{id}/refresh", "POST", f"/api/dashboards/{dashboard_id}/refresh", params=user
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_app(tmp: str, ollama_url: str, args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp}/load.db",
+        "UPLOAD_DIR": f"{tmp}/uploads",
+        "OLLAMA_BASE_URL": ollama_url,
+        "OLLAMA_BASE_URLS": "",
+    }
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)]
+    command += ["--log-level", "warning", "--workers", str(args.workers)]
+    log = open(args.app_log, "ab") if args.app_log else subprocess.DEVNULL
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("app did not become healthy within 60s")
+
+
+def _print_report(rows: list[dict], elapsed_s: float, ollama_stats: dict | None) -> None:
+    print(f"{'endpoint':36} {'reqs':>6} {'errors':>7} {'err%':>6} {'rps':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for row in rows:
+        print(
+            f"{row['endpoint']:36} {row['requests']:6d} {row['errors']:7d} {row['error_rate']:6.1%} {row['rps']:7.2f} "
+            f"{row['p50_ms']:9.1f} {row['p90_ms']:9.1f} {row['p99_ms']:9.1f} {row['max_ms']:9.1f}"
+        )
+        if row["errors"]:
+            print(f"{'':36} statuses: {row['statuses']}")
+    total = sum(row["requests"] for row in rows)
+    errors = sum(row["errors"] for row in rows)
+    print(f"total: {total} requests, {errors} errors, {total / elapsed_s:.1f} req/s over {elapsed_s:.1f}s")
+    if ollama_stats is not None:
+        print(f"fake Ollama: {ollama_stats}")
+
+
+async def _run(base_url: str, args: argparse.Namespace) -> tuple[LoadStats, float]:
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout_s, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(_virtual_user(i, client, stats, args) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    return stats, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running app; default starts one locally")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--comments", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--ramp-s", type=float, default=2.0)
+    parser.add_argument("--think-ms", type=float, default=200.0)
+    parser.add_argument("--timeout-s", type=float, default=120.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--telegram-base", type=int, default=900_000_000)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    parser.add_argument("--app-log", type=Path, help="write the local app's output here instead of discarding it")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    ollama = None
+    process = None
+    tmp = tempfile.mkdtemp(prefix="load_test_")
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            ollama = FakeOllamaServer(config=config_from_args(args)).start()
+            process, base_url = _start_app(tmp, ollama.url, args)
+        stats, elapsed = asyncio.run(_run(base_url, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if ollama is not None:
+            ollama.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    rows = stats.report(elapsed)
+    ollama_stats = ollama.stats() if ollama is not None else None
+    _print_report(rows, elapsed, ollama_stats)
+    if args.json:
+        args.json.write_text(json.dumps({"elapsed_s": round(elapsed, 2), "endpoints": rows, "ollama": ollama_stats}, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
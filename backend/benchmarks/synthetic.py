@@ -0,0 +1,64 @@
+"""Deterministic synthetic CSVs for the benchmarks.
+
+narrow: date, region, category, amount, quantity
+wide:   the narrow columns plus 20 numeric metrics and 3 categorical attributes
+
+The same (rows, shape, seed) always produces byte-identical files, so timings from
+different runs are comparable.
+
+Usage (from backend/):
+  python -m benchmarks.synthetic --rows 100000 --shape wide --out ./data/bench_wide_100k.csv
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SHAPES = ("narrow", "wide")
+REGIONS = ["North", "South", "East", "West", "Central"]
+CATEGORIES = [f"cat_{i:02d}" for i in range(24)]
+WIDE_METRICS = 20
+WIDE_ATTRIBUTES = {"channel": ["web", "store", "partner", "phone"], "tier": ["free", "pro", "team"], "segment": ["smb", "mid", "enterprise"]}
+
+
+def synthetic_frame(rows: int, shape: str = "narrow", seed: int = 42) -> pd.DataFrame:
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape: {shape}")
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2022-01-01")
+    frame = {
+        "date": (start + rng.integers(0, 3 * 365, rows).astype("timedelta64[D]")).astype(str),
+        "region": np.array(REGIONS)[rng.integers(0, len(REGIONS), rows)],
+        "category": np.array(CATEGORIES)[rng.zipf(1.6, rows).clip(1, len(CATEGORIES)) - 1],
+        "amount": rng.gamma(2.0, 250.0, rows).round(2),
+        "quantity": rng.poisson(4, rows),
+    }
+    if shape == "wide":
+        for i in range(1, WIDE_METRICS + 1):
+            frame[f"metric_{i:02d}"] = rng.normal(100.0, 15.0 * i, rows).round(3)
+        for name, values in WIDE_ATTRIBUTES.items():
+            frame[name] = np.array(values)[rng.integers(0, len(values), rows)]
+    return pd.DataFrame(frame)
+
+
+def synthetic_csv(rows: int, shape: str = "narrow", seed: int = 42) -> bytes:
+    return synthetic_frame(rows, shape, seed).to_csv(index=False).encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--shape", choices=SHAPES, default="narrow")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_bytes(synthetic_csv(args.rows, args.shape, args.seed))
+    print(f"{args.out} {args.out.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
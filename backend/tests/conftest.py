@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Settings are read once on first import, so point the app at a scratch database and
+# upload dir (and an unreachable model server) before any test imports it.
+_tmp = tempfile.mkdtemp(prefix="mini_bi_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["UPLOAD_DIR"] = f"{_tmp}/uploads"
+os.environ.setdefault("OLLAMA_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("OLLAMA_BASE_URLS", "")
+os.environ.setdefault("PROFILE_PRECOMPUTE", "false")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SAMPLE_CSV = "date,region,price,Sales Amount\n" + "\n".join(
+    f"2024-0{1 + i % 9}-01,{'North' if i % 2 else 'South'},{i},{i * 2}" for i in range(40)
+)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def dataset_id(client) -> int:
+    response = client.post(
+        "/api/datasets/upload", data={"telegram_id": "1"}, files={"file": ("sales.csv", SAMPLE_CSV, "text/csv")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.ai import agents, ollama_client
+from app.ai.backend_pool import OllamaBackendPool
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.synthetic import synthetic_csv
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    server = FakeOllamaServer().start()
+    monkeypatch.setattr(ollama_client, "ollama_pool", OllamaBackendPool([server.url], unhealthy_after=2, probe_interval_s=0))
+    yield server
+    server.stop()
+
+
+def test_batch_runs_pandas_work_off_the_event_loop(client, stub_model, monkeypatch):
+    on_loop: list[tuple[str, bool]] = []
+
+    def spy(name, func):
+        def wrapper(*args, **kwargs):
+            on_loop.append((name, _on_event_loop()))
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(agents, "build_comparison_data", spy("compare", agents.build_comparison_data))
+    monkeypatch.setattr(
+        agents.AIAgentService, "_materialize_query", spy("query", agents.AIAgentService._materialize_query)
+    )
+
+    dataset_id = client.post(
+        "/api/datasets/upload", data={"telegram_id": "1"}, files={"file": ("sales.csv", synthetic_csv(2000), "text/csv")}
+    ).json()["id"]
+    body = {
+        "queries": [{"question": f"amount by region {i}"} for i in range(3)],
+        "comparisons": [{"date_column": "date", "value_column": "amount", "period": period} for period in ("week", "month")],
+    }
+    response = client.post(f"/api/ai/batch/{dataset_id}", params={"telegram_id": 1}, json=body)
+
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert [item["status_code"] for item in result["queries"] + result["comparisons"]] == [200] * 5
+    assert sorted(name for name, _ in on_loop) == ["compare"] * 2 + ["query"] * 3
+    assert not any(loop for _, loop in on_loop)
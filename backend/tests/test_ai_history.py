@@ -0,0 +1,26 @@
+from app.models.database import SessionLocal
+from app.models.entities import AIRun, Dataset
+from app.services.dataset_service import DEFAULT_ANSWER, DatasetService
+
+
+def test_backfill_tolerates_payloads_that_are_not_objects(client, dataset_id):
+    with SessionLocal() as db:
+        dataset = db.get(Dataset, dataset_id)
+        payloads = ["null", "[1, 2]", '"text"', "not json", '{"answer": "ok", "chart_data": [{"x": "a", "y": 1}]}']
+        runs = [
+            AIRun(user_id=dataset.user_id, dataset_id=dataset_id, run_type="query", question=f"q{i}", response_json=payload)
+            for i, payload in enumerate(payloads)
+        ]
+        db.add_all(runs)
+        db.commit()
+
+        assert DatasetService(db).backfill_ai_run_metadata() >= len(runs)
+        for run in runs:
+            db.refresh(run)
+        assert [run.answer for run in runs] == [DEFAULT_ANSWER] * 4 + ["ok"]
+        assert runs[-1].row_count == 1
+        run_id = runs[0].id
+
+    response = client.get(f"/api/ai/history/{dataset_id}/runs/{run_id}", params={"telegram_id": 1})
+    assert response.status_code == 200
+    assert response.json()["answer"] == DEFAULT_ANSWER
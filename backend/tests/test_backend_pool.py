@@ -0,0 +1,81 @@
+import asyncio
+import socket
+
+import pytest
+
+from app.ai import ollama_client
+from app.ai.backend_pool import OllamaBackendPool, OllamaUnavailableError
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+@pytest.fixture
+def stub():
+    server = FakeOllamaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def dead_url():
+    # A port that was free a moment ago: connections are refused.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def _post(pool: OllamaBackendPool, monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.setattr(ollama_client, "ollama_pool", pool)
+    response = asyncio.run(ollama_client.OllamaClient()._post("Return pandas_query JSON"))
+    return str(response.request.url)
+
+
+def test_routes_to_lowest_latency_and_fewest_in_flight():
+    pool = OllamaBackendPool(["http://a", "http://b"], unhealthy_after=2, probe_interval_s=0)
+    a, b = pool.backends
+    pool.release(pool.acquire(), latency_s=0.5)
+    pool.release(pool.acquire(), latency_s=0.2)
+    assert (a.latency_ewma, b.latency_ewma) == (0.5, 0.2)
+    assert pool.acquire() is b
+    # One request in flight on b scores (1 + 1) * 0.2 = 0.4, still below a's 0.5;
+    # a second one tips it over.
+    assert pool.acquire() is b
+    assert pool.acquire() is a
+
+def test_failing_node_leaves_rotation_and_probe_readmits_it(stub, dead_url, monkeypatch):
+    pool = OllamaBackendPool([dead_url, stub.url], unhealthy_after=1, probe_interval_s=0)
+    dead, live = pool.backends
+
+    with pytest.raises(OllamaUnavailableError):
+        _post(pool, monkeypatch)
+    assert not dead.healthy
+    assert [_post(pool, monkeypatch).startswith(stub.url) for _ in range(3)] == [True] * 3
+
+    asyncio.run(pool.probe())
+    assert not dead.healthy and live.healthy
+
+    # The stub stands in for the recovered node: its next successful probe puts it back.
+    dead.url = stub.url
+    asyncio.run(pool.probe())
+    assert dead.healthy and dead.consecutive_failures == 0
+
+
+def test_single_node_is_never_refused(stub, monkeypatch):
+    pool = OllamaBackendPool([stub.url], unhealthy_after=2, probe_interval_s=0)
+    node = pool.backends[0]
+    for _ in range(2):
+        pool.release(pool.acquire(), error="timeout")
+    assert not node.healthy
+
+    assert _post(pool, monkeypatch).startswith(stub.url)
+    assert node.healthy
+
+
+def test_all_unhealthy_falls_back_to_least_recently_failed():
+    pool = OllamaBackendPool(["http://a", "http://b"], unhealthy_after=1, probe_interval_s=0)
+    a, b = pool.backends
+    pool.release(pool.acquire(), error="timeout")
+    pool.release(pool.acquire(), error="timeout")
+    assert not a.healthy and not b.healthy
+    assert a.failed_at < b.failed_at
+    assert pool.acquire() is a
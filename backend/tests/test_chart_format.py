@@ -0,0 +1,46 @@
+import pytest
+from starlette.requests import Request
+
+from app.utils.chart_format import COLUMNAR_MEDIA_TYPE, wants_columnar
+
+
+def _request(accept: str | None) -> Request:
+    headers = [] if accept is None else [(b"accept", accept.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("application/json", False),
+        (COLUMNAR_MEDIA_TYPE, True),
+        (f"{COLUMNAR_MEDIA_TYPE}, application/json;q=0.9", True),
+        (f"{COLUMNAR_MEDIA_TYPE};q=0", False),
+        (f"{COLUMNAR_MEDIA_TYPE} ; q=0.0, application/json", False),
+        (f"application/json, {COLUMNAR_MEDIA_TYPE};q=0.5", False),
+        (f"{COLUMNAR_MEDIA_TYPE};q=0.5", True),
+        (f"{COLUMNAR_MEDIA_TYPE};q=abc", False),
+    ],
+)
+def test_wants_columnar(accept, expected):
+    assert wants_columnar(_request(accept)) is expected
+
+
+def test_dashboard_not_modified_varies_on_accept(client, dataset_id):
+    dashboard_id = client.post(
+        "/api/dashboards/save", json={"telegram_id": 1, "dataset_id": dataset_id, "title": "Etag", "config": {"widgets": []}}
+    ).json()["id"]
+    url = f"/api/dashboards/{dashboard_id}"
+    first = client.get(url, params={"telegram_id": 1})
+    assert first.headers["Vary"] == "Accept"
+
+    again = client.get(url, params={"telegram_id": 1}, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["Vary"] == "Accept"
+
+    columnar = client.get(
+        url, params={"telegram_id": 1}, headers={"If-None-Match": first.headers["ETag"], "Accept": COLUMNAR_MEDIA_TYPE}
+    )
+    assert columnar.status_code == 200
+    assert columnar.headers["Content-Type"].startswith(COLUMNAR_MEDIA_TYPE)
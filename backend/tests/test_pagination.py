@@ -0,0 +1,30 @@
+def test_comment_pages_start_from_the_newest(client, dataset_id):
+    dashboard_id = client.post(
+        "/api/dashboards/save", json={"telegram_id": 1, "dataset_id": dataset_id, "title": "Busy", "config": {"widgets": []}}
+    ).json()["id"]
+    for i in range(60):
+        client.post(f"/api/dashboards/{dashboard_id}/comments", json={"telegram_id": 1, "text": f"c{i}"})
+
+    url = f"/api/dashboards/{dashboard_id}/comments"
+    first = client.get(url, params={"telegram_id": 1})
+    assert [c["text"] for c in first.json()] == [f"c{i}" for i in range(10, 60)]
+
+    older = client.get(url, params={"telegram_id": 1, "cursor": first.headers["X-Next-Cursor"]})
+    assert [c["text"] for c in older.json()] == [f"c{i}" for i in range(10)]
+    assert "X-Next-Cursor" not in older.headers
+
+
+def test_list_pages_chain_through_every_dataset(client):
+    csv = "region,price\nNorth,1\nSouth,2\n"
+    for i in range(5):
+        client.post("/api/datasets/upload", data={"telegram_id": "77"}, files={"file": (f"d{i}.csv", csv, "text/csv")})
+
+    seen, cursor = [], None
+    while True:
+        params = {"telegram_id": 77, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/datasets", params=params)
+        seen += [d["name"] for d in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert sorted(seen) == [f"d{i}.csv" for i in range(5)]
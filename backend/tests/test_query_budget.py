@@ -0,0 +1,61 @@
+import pytest
+
+from app.models.database import SessionLocal
+from app.models.entities import User
+from app.utils.query_counter import QueryBudgetExceeded, assert_query_budget, query_budget
+
+
+@pytest.fixture
+def team_dashboard(client, dataset_id) -> tuple[int, int]:
+    dashboard_id = client.post(
+        "/api/dashboards/save", json={"telegram_id": 1, "dataset_id": dataset_id, "title": "Team", "config": {"widgets": []}}
+    ).json()["id"]
+    team_id = client.post("/api/teams", json={"telegram_id": 1, "name": "Analysts"}).json()["id"]
+    for member in range(2, 12):
+        client.post(f"/api/teams/{team_id}/members", json={"actor_telegram_id": 1, "member_telegram_id": member, "role": "viewer"})
+    client.post(f"/api/dashboards/{dashboard_id}/team-share", json={"telegram_id": 1, "team_id": team_id, "permission": "viewer"})
+    return dashboard_id, team_id
+
+
+def test_comment_list_stays_within_budget(client, team_dashboard):
+    dashboard_id, _ = team_dashboard
+    for i in range(40):
+        response = client.post(f"/api/dashboards/{dashboard_id}/comments", json={"telegram_id": 2 + i % 10, "text": f"c{i}"})
+        assert response.status_code == 200, response.text
+
+    # One call to warm the identity cache; after that a page costs the access check plus
+    # one joined comment query, however many authors the thread has.
+    client.get(f"/api/dashboards/{dashboard_id}/comments", params={"telegram_id": 3})
+    response = client.get(f"/api/dashboards/{dashboard_id}/comments", params={"telegram_id": 3})
+    assert len(response.json()) == 40
+    assert {comment["user_telegram_id"] for comment in response.json()} == set(range(2, 12))
+    assert_query_budget(response, 2)
+
+
+def test_team_member_list_stays_within_budget(client, team_dashboard):
+    _, team_id = team_dashboard
+    client.get(f"/api/teams/{team_id}/members", params={"telegram_id": 1})
+    response = client.get(f"/api/teams/{team_id}/members", params={"telegram_id": 1})
+    assert len(response.json()) == 11
+    assert_query_budget(response, 2)
+
+
+def test_assert_query_budget_fails_over_budget(client, team_dashboard):
+    dashboard_id, _ = team_dashboard
+    response = client.get(f"/api/dashboards/{dashboard_id}/comments", params={"telegram_id": 1})
+    with pytest.raises(QueryBudgetExceeded, match="/comments issued"):
+        assert_query_budget(response, 0)
+
+
+def test_query_budget_counts_statements():
+    with query_budget(2) as stats:
+        with SessionLocal() as db:
+            db.query(User).count()
+            db.query(User).first()
+    assert stats.count == 2
+
+    with pytest.raises(QueryBudgetExceeded, match="3 queries issued, budget is 2"):
+        with query_budget(2):
+            with SessionLocal() as db:
+                for _ in range(3):
+                    db.query(User).count()
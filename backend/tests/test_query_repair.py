@@ -0,0 +1,141 @@
+import pytest
+
+from app.utils.query_repair import get_repair_stats, repair_query_output
+from app.utils.safe_query import SafeQueryError, sanitize_chart_config, validate_query_expression
+
+COLUMNS = ["date", "region", "price", "Sales Amount"]
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "price > 10",
+        "region == 'North' and price <= 5",
+        "`Sales Amount` > 100",
+        "region in ['North', 'South']",
+        "region == 'it''s'",
+        "price > 1.5",
+    ],
+)
+def test_validator_accepts(expr):
+    validate_query_expression(expr, COLUMNS)
+
+
+@pytest.mark.parametrize(
+    "expr, message",
+    [
+        ("x" * 501, "too long"),
+        ("__import__('os')", "forbidden"),
+        ("`unknown col` > 1", "Unknown identifier"),
+        ("unknown > 1", "Unknown identifier"),
+        ("price > @threshold", "unsupported characters"),
+        ("region == 'a\\' or region.to_csv(\\'/tmp/x\\') or \\''", "unsupported characters"),
+        ("region.str.len() > 1", "attribute access"),
+        ("ilevel_0 > 1", "Unknown identifier"),
+    ],
+)
+def test_validator_rejects(expr, message):
+    with pytest.raises(SafeQueryError, match=message):
+        validate_query_expression(expr, COLUMNS)
+
+
+def _repair(output: dict) -> tuple[dict, list[str]]:
+    return repair_query_output(output, COLUMNS)
+
+
+def test_quote_style():
+    repaired, fired = _repair({"pandas_query": "region == `North`"})
+    assert repaired["pandas_query"] == "region == 'North'"
+    assert fired == ["quote_style"]
+
+    repaired, fired = _repair({"pandas_query": "region == “North”"})
+    assert repaired["pandas_query"] == "region == \"North\""
+    assert fired == ["quote_style"]
+
+
+def test_backtick_column():
+    repaired, fired = _repair({"pandas_query": "Sales Amount > 10"})
+    assert repaired["pandas_query"] == "`Sales Amount` > 10"
+    assert fired == ["backtick_column"]
+
+
+def test_fuzzy_identifier():
+    repaired, fired = _repair({"pandas_query": "Region == 'North' and `sales amount` > 1"})
+    assert repaired["pandas_query"] == "region == 'North' and `Sales Amount` > 1"
+    assert fired == ["fuzzy_identifier"]
+
+
+def test_aggregation_alias_and_dropped():
+    repaired, fired = _repair({"chart_config": {"x": "region", "y": "price", "aggregation": "AVG"}})
+    assert repaired["chart_config"]["aggregation"] == "mean"
+    assert fired == ["aggregation_alias"]
+
+    repaired, fired = _repair({"chart_config": {"x": "region", "y": "price", "aggregation": "median"}})
+    assert repaired["chart_config"]["aggregation"] is None
+    assert fired == ["aggregation_dropped"]
+
+
+def test_chart_column_fuzzy():
+    repaired, fired = _repair({"chart_config": {"x": "Regions", "y": "sales_amount"}})
+    assert repaired["chart_config"] == {"x": "region", "y": "Sales Amount"}
+    assert fired == ["chart_column_fuzzy", "chart_column_fuzzy"]
+
+
+def test_chart_column_fallback_matches_sanitizer():
+    config = {"type": "bar", "x": "customer", "y": "price"}
+    repaired, fired = _repair({"chart_config": config})
+    assert fired == ["chart_column_fallback"]
+    assert sanitize_chart_config(repaired["chart_config"], COLUMNS) == sanitize_chart_config(config, COLUMNS)
+
+
+def test_chart_column_dropped():
+    repaired, fired = _repair({"chart_config": {"x": "region", "y": "profit margin"}})
+    assert repaired["chart_config"]["y"] is None
+    assert fired == ["chart_column_dropped"]
+
+
+def test_valid_output_is_untouched():
+    output = {"pandas_query": "price > 1", "chart_config": {"x": "region", "y": "price", "aggregation": "sum"}}
+    repaired, fired = _repair(output)
+    assert repaired == output
+    assert fired == []
+
+
+def test_rule_counts():
+    before = get_repair_stats().get("chart_column_fallback", 0)
+    _repair({"chart_config": {"x": "nowhere"}})
+    assert get_repair_stats()["chart_column_fallback"] == before + 1
+
+
+class _ScriptedClient:
+    def __init__(self, *outputs: dict) -> None:
+        self.outputs = list(outputs)
+        self.calls = 0
+
+    async def generate_json(self, prompt: str, **kwargs) -> dict:
+        self.calls += 1
+        return self.outputs.pop(0)
+
+
+def test_unknown_chart_axis_is_repaired_without_another_llm_call():
+    import asyncio
+    import json
+    from types import SimpleNamespace
+
+    import pandas as pd
+
+    from app.ai.agents import AIAgentService
+
+    df = pd.DataFrame({"region": ["North", "South", "North"], "price": [1.0, 2.0, 3.0]})
+    dataset = SimpleNamespace(id=1, schema_json=json.dumps({"region": "object", "price": "float64"}), sample_json="[]")
+    service = AIAgentService(dataset_service=None)
+    service.client = _ScriptedClient(
+        {"answer": "ok", "pandas_query": None, "chart_config": {"type": "bar", "x": "customer", "y": "price", "aggregation": "sum"}}
+    )
+
+    result = asyncio.run(service.ask(dataset, "price by customer", df=df))
+
+    assert service.client.calls == 1
+    assert result["attempts"] == 1
+    assert result["chart_config"]["x"] == "region"
+    assert result["chart_data"] == [{"x": "North", "y": 4.0}, {"x": "South", "y": 2.0}]
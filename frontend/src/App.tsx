@@ -24,6 +24,7 @@ import {
   saveDashboard,
   shareDashboard,
   shareDashboardToTeam,
+  subscribeDashboardEvents,
   uploadCsv,
 } from './services/api'
 import { useAppStore } from './store/useAppStore'
@@ -68,6 +69,7 @@ function App() {
   const [inviteTelegramId, setInviteTelegramId] = useState('')
 
   const [comments, setComments] = useState<DashboardComment[]>([])
+  const [olderCommentsCursor, setOlderCommentsCursor] = useState<string | null>(null)
   const [commentText, setCommentText] = useState('')
 
   const [compareDateColumn, setCompareDateColumn] = useState('')
@@ -173,16 +175,34 @@ function App() {
       .catch(() => setTeamMembers([]))
   }, [selectedTeamId, activeTelegramId])
 
+  const loadLatestComments = (dashboardId: number) =>
+    listDashboardComments(dashboardId, activeTelegramId).then((page) => {
+      setComments(page.items)
+      setOlderCommentsCursor(page.nextCursor)
+    })
+
   useEffect(() => {
     if (!dashboard) {
       setComments([])
+      setOlderCommentsCursor(null)
       return
     }
-    void listDashboardComments(dashboard.id, activeTelegramId)
-      .then(setComments)
-      .catch(() => setComments([]))
+    void loadLatestComments(dashboard.id).catch(() => {
+      setComments([])
+      setOlderCommentsCursor(null)
+    })
   }, [dashboard, activeTelegramId])
 
+  useEffect(() => {
+    if (!dashboard || isPublicView) return
+    return subscribeDashboardEvents(dashboard.id, activeTelegramId, {
+      onComment: (comment) => setComments((prev) => (prev.some((c) => c.id === comment.id) ? prev : [...prev, comment])),
+      onResync: () => {
+        void loadLatestComments(dashboard.id).catch(() => undefined)
+      },
+    })
+  }, [dashboard?.id, activeTelegramId, isPublicView])
+
   useEffect(() => {
     if (!isPublicView) return
     const path = window.location.pathname
@@ -236,6 +256,7 @@ function App() {
     const next: DashboardWidget = {
       id,
       title: source.answer.slice(0, 48) || 'AI Chart',
+      pandas_query: source.pandas_query,
       chart_config: source.chart_config,
       chart_data: source.chart_data,
       layout: { x: 0, y: Infinity, w: 6, h: 4 },
@@ -305,6 +326,13 @@ function App() {
     setInviteTelegramId('')
   }
 
+  const onLoadOlderComments = async () => {
+    if (!dashboard || !olderCommentsCursor) return
+    const page = await listDashboardComments(dashboard.id, activeTelegramId, olderCommentsCursor)
+    setComments((prev) => [...page.items.filter((c) => !prev.some((p) => p.id === c.id)), ...prev])
+    setOlderCommentsCursor(page.nextCursor)
+  }
+
   const onAddComment = async () => {
     if (!dashboard || !commentText.trim()) return
     const c = await addDashboardComment(dashboard.id, {
@@ -337,6 +365,7 @@ function App() {
     const nextWidgets: DashboardWidget[] = result.widgets.map((w, idx) => ({
       id: `ai_widget_${Date.now()}_${idx}`,
       title: w.title,
+      pandas_query: w.pandas_query ?? null,
       chart_config: w.chart_config,
       chart_data: w.chart_data,
       layout: { x: (idx % 2) * 6, y: Math.floor(idx / 2) * 4, w: 6, h: 4 },
@@ -569,6 +598,11 @@ function App() {
           <section className="panel p-4 space-y-2">
             <h3 className="text-sm font-semibold">  </h3>
             <div className="space-y-2 max-h-44 overflow-auto">
+              {olderCommentsCursor && (
+                <button className="btn-ghost w-full" onClick={() => void onLoadOlderComments()}>
+                  Load older comments
+                </button>
+              )}
               {comments.map((c) => (
                 <div key={c.id} className="rounded-md border border-white/10 bg-slate-900/40 p-2 text-sm">
                   <span className="text-cyan-100/70">{c.user_telegram_id}: </span>
@@ -1,6 +1,9 @@
-import type { Dashboard } from '../types/dashboard'
+import type { Dashboard, DashboardRefresh } from '../types/dashboard'
 import type {
+  AIBatchRequest,
+  AIBatchResponse,
   AIHistory,
+  AIJob,
   AIProfile,
   AIQueryResponse,
   CompareResponse,
@@ -22,6 +25,34 @@ async function parseResponse<T>(response: Response): Promise<T> {
   return response.json()
 }
 
+export type Page<T> = {
+  items: T[]
+  nextCursor: string | null
+}
+
+function withCursor(url: string, cursor: string | null | undefined): string {
+  if (!cursor) return url
+  return `${url}${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`
+}
+
+async function fetchPage<T>(url: string, cursor?: string | null): Promise<Page<T>> {
+  const response = await fetch(withCursor(url, cursor))
+  const items = await parseResponse<T[]>(response)
+  return { items, nextCursor: response.headers.get('X-Next-Cursor') }
+}
+
+// List endpoints return at most one page; follow X-Next-Cursor until the list is complete.
+async function fetchAllPages<T>(url: string): Promise<T[]> {
+  const items: T[] = []
+  let cursor: string | null = null
+  do {
+    const page: Page<T> = await fetchPage<T>(url, cursor)
+    items.push(...page.items)
+    cursor = page.nextCursor
+  } while (cursor)
+  return items
+}
+
 export async function uploadCsv(file: File, telegramId: number): Promise<Dataset> {
   const body = new FormData()
   body.append('file', file)
@@ -35,8 +66,7 @@ export async function uploadCsv(file: File, telegramId: number): Promise<Dataset
 }
 
 export async function listDatasets(telegramId: number): Promise<DatasetListItem[]> {
-  const response = await fetch(`${API_BASE}/datasets?telegram_id=${telegramId}`)
-  return parseResponse<DatasetListItem[]>(response)
+  return fetchAllPages<DatasetListItem>(`${API_BASE}/datasets?telegram_id=${telegramId}`)
 }
 
 export async function getDataset(datasetId: number, telegramId: number): Promise<Dataset> {
@@ -54,6 +84,11 @@ export async function getAiHistory(datasetId: number, telegramId: number): Promi
   return parseResponse<AIHistory>(response)
 }
 
+export async function getAiRunPayload(payloadUrl: string, telegramId: number): Promise<AIQueryResponse> {
+  const response = await fetch(`${API_BASE.replace(/\/api$/, '')}${payloadUrl}?telegram_id=${telegramId}`)
+  return parseResponse<AIQueryResponse>(response)
+}
+
 export async function askAi(datasetId: number, telegramId: number, question: string): Promise<AIQueryResponse> {
   const response = await fetch(`${API_BASE}/ai/query/${datasetId}?telegram_id=${telegramId}`, {
     method: 'POST',
@@ -76,13 +111,37 @@ export async function comparePeriods(
   return parseResponse<CompareResponse>(response)
 }
 
+export async function askAiBatch(datasetId: number, telegramId: number, payload: AIBatchRequest): Promise<AIBatchResponse> {
+  const response = await fetch(`${API_BASE}/ai/batch/${datasetId}?telegram_id=${telegramId}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+  })
+  return parseResponse<AIBatchResponse>(response)
+}
+
+async function waitForJob<T>(jobId: string, telegramId: number, intervalMs = 1000): Promise<T> {
+  for (;;) {
+    const response = await fetch(`${API_BASE}/ai/jobs/${jobId}?telegram_id=${telegramId}`)
+    const job = await parseResponse<AIJob<T>>(response)
+    if (job.status === 'succeeded' && job.result) {
+      return job.result
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error ?? 'AI job failed')
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
+
 export async function nl2dashboard(datasetId: number, telegramId: number, prompt: string): Promise<NL2DashboardResponse> {
-  const response = await fetch(`${API_BASE}/ai/nl2dashboard/${datasetId}?telegram_id=${telegramId}`, {
+  const response = await fetch(`${API_BASE}/ai/jobs/nl2dashboard/${datasetId}?telegram_id=${telegramId}`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ prompt }),
   })
-  return parseResponse<NL2DashboardResponse>(response)
+  const job = await parseResponse<AIJob<NL2DashboardResponse>>(response)
+  return waitForJob<NL2DashboardResponse>(job.id, telegramId)
 }
 
 export async function explainChart(
@@ -115,8 +174,7 @@ export async function saveDashboard(params: {
 
 export async function listDashboards(telegramId: number, datasetId?: number): Promise<Dashboard[]> {
   const query = datasetId ? `?telegram_id=${telegramId}&dataset_id=${datasetId}` : `?telegram_id=${telegramId}`
-  const response = await fetch(`${API_BASE}/dashboards${query}`)
-  return parseResponse<Dashboard[]>(response)
+  return fetchAllPages<Dashboard>(`${API_BASE}/dashboards${query}`)
 }
 
 export async function shareDashboard(id: number, telegramId: number): Promise<Dashboard> {
@@ -126,6 +184,13 @@ export async function shareDashboard(id: number, telegramId: number): Promise<Da
   return parseResponse<Dashboard>(response)
 }
 
+export async function refreshDashboard(id: number, telegramId: number): Promise<DashboardRefresh> {
+  const response = await fetch(`${API_BASE}/dashboards/${id}/refresh?telegram_id=${telegramId}`, {
+    method: 'POST',
+  })
+  return parseResponse<DashboardRefresh>(response)
+}
+
 export async function shareDashboardToTeam(
   id: number,
   payload: { telegram_id: number; team_id: number; permission: 'viewer' | 'editor' },
@@ -138,9 +203,28 @@ export async function shareDashboardToTeam(
   return parseResponse<{ dashboard_id: number; team_id: number; permission: string; created_at: string }>(response)
 }
 
-export async function listDashboardComments(dashboardId: number, telegramId: number): Promise<DashboardComment[]> {
-  const response = await fetch(`${API_BASE}/dashboards/${dashboardId}/comments?telegram_id=${telegramId}`)
-  return parseResponse<DashboardComment[]>(response)
+// Newest comments first: each page is in posting order, and nextCursor points at older ones.
+export async function listDashboardComments(
+  dashboardId: number,
+  telegramId: number,
+  cursor?: string | null,
+): Promise<Page<DashboardComment>> {
+  return fetchPage<DashboardComment>(`${API_BASE}/dashboards/${dashboardId}/comments?telegram_id=${telegramId}`, cursor)
+}
+
+export type DashboardEventHandlers = {
+  onComment?: (comment: DashboardComment) => void
+  onDashboardUpdated?: (dashboard: Pick<Dashboard, 'id' | 'title' | 'dataset_id' | 'config' | 'updated_at'>) => void
+  onResync?: () => void
+}
+
+// EventSource reconnects on its own and resends the last event id, so missed events are replayed.
+export function subscribeDashboardEvents(dashboardId: number, telegramId: number, handlers: DashboardEventHandlers): () => void {
+  const source = new EventSource(`${API_BASE}/dashboards/${dashboardId}/events?telegram_id=${telegramId}`)
+  source.addEventListener('comment.created', (event) => handlers.onComment?.(JSON.parse((event as MessageEvent).data)))
+  source.addEventListener('dashboard.updated', (event) => handlers.onDashboardUpdated?.(JSON.parse((event as MessageEvent).data)))
+  source.addEventListener('resync', () => handlers.onResync?.())
+  return () => source.close()
 }
 
 export async function addDashboardComment(
@@ -1,6 +1,7 @@
 export type DashboardWidget = {
   id: string
   title: string
+  pandas_query?: string | null
   chart_config: {
     type: 'bar' | 'line' | 'pie' | 'histogram'
     x: string
@@ -11,6 +12,9 @@ export type DashboardWidget = {
   }
   chart_data: Array<{ x: string; y?: number; current?: number; previous?: number | null }>
   layout: { x: number; y: number; w: number; h: number }
+  spec_hash?: string
+  data_version?: string
+  refresh_error?: string
 }
 
 export type DashboardConfig = {
@@ -27,3 +31,12 @@ export type Dashboard = {
   created_at: string
   updated_at: string
 }
+
+export type DashboardRefresh = {
+  dashboard: Dashboard
+  recomputed: number
+  cached: number
+  unchanged: number
+  skipped: number
+  errors: Record<string, string>
+}
@@ -43,12 +43,13 @@ export type AIQueryResponse = {
 }
 
 export type AIHistoryItem = {
-  id: number
+  id: number | null
   question: string | null
   answer: string
   pandas_query: string | null
-  chart_config: AIQueryResponse['chart_config'] | null
-  chart_data: AIQueryResponse['chart_data'] | null
+  chart_type: AIQueryResponse['chart_config']['type'] | null
+  row_count: number | null
+  payload_url: string | null
   attempts: number
   created_at: string
 }
@@ -64,8 +65,25 @@ export type CompareResponse = {
   chart_data: AIQueryResponse['chart_data']
 }
 
+export type ComparePeriodsRequest = {
+  date_column: string
+  value_column: string
+  period: 'day' | 'week' | 'month'
+}
+
+export type AIBatchRequest = {
+  queries: Array<{ question: string }>
+  comparisons: ComparePeriodsRequest[]
+}
+
+export type AIBatchResponse = {
+  queries: Array<{ question: string; result: AIQueryResponse | null; error: string | null; status_code: number }>
+  comparisons: Array<{ request: ComparePeriodsRequest; result: CompareResponse | null; error: string | null; status_code: number }>
+}
+
 export type NL2DashboardWidget = {
   title: string
+  pandas_query?: string | null
   chart_config: AIQueryResponse['chart_config']
   chart_data: AIQueryResponse['chart_data']
 }
@@ -75,6 +93,19 @@ export type NL2DashboardResponse = {
   widgets: NL2DashboardWidget[]
 }
 
+export type AIJob<T = Record<string, unknown>> = {
+  id: string
+  job_type: 'profile' | 'nl2dashboard'
+  dataset_id: number
+  status: 'queued' | 'running' | 'succeeded' | 'failed'
+  progress_done: number
+  progress_total: number
+  result: T | null
+  error: string | null
+  created_at: string
+  updated_at: string
+}
+
 export type ExplainResponse = {
   explanation: string
 }